@@ -0,0 +1 @@
+"""本地性能测试工具：模拟后台接口、AstrBot替身及各类基准测试脚本"""
@@ -0,0 +1,151 @@
+"""AstrBot API 的最小替身
+
+main.py 依赖 astrbot.api.* 才能导入。本模块在 sys.modules 中注册同名的替身模块，
+使插件可以脱离 AstrBot 在本地导入、压测。只用于 bench 目录下的脚本，插件运行时不会加载。
+"""
+import logging
+import os
+import sys
+import tempfile
+import types
+
+_数据目录 = None
+
+
+def 数据目录() -> str:
+    """替身 StarTools.get_data_dir 返回的目录"""
+    return _数据目录
+
+
+class MessageChain(list):
+    def message(self, 文本):
+        self.append(文本)
+        return self
+
+
+class MessageEventResult(MessageChain):
+    pass
+
+
+class EventMessageType:
+    ALL = "all"
+    GROUP_MESSAGE = "group"
+    PRIVATE_MESSAGE = "private"
+
+
+class _Filter:
+    """filter.command 等装饰器的替身，只记录指令名，不做注册"""
+
+    def command(self, 指令名, *args, **kwargs):
+        def 装饰(函数):
+            函数.__bench_command__ = 指令名
+            return 函数
+        return 装饰
+
+    def __getattr__(self, 名称):
+        return lambda *args, **kwargs: (lambda 函数: 函数)
+
+
+class Context:
+    """插件上下文替身，主动发送的消息记录在 sent 列表中"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, 会话, 消息链):
+        self.sent.append((会话, 消息链))
+        return True
+
+
+class Star:
+    def __init__(self, context):
+        self.context = context
+
+
+def register(*args, **kwargs):
+    return lambda 类: 类
+
+
+class StarTools:
+    @staticmethod
+    def get_data_dir(*args, **kwargs):
+        return _数据目录
+
+
+class AstrMessageEvent:
+    """最小的消息事件，bench.harness 中有更完整的合成事件"""
+
+    def __init__(self, message_str="", sender_id="10000", group_id="", is_admin=False, **kwargs):
+        self.message_str = message_str
+        self._sender_id = str(sender_id)
+        self._group_id = str(group_id) if group_id else ""
+        self._is_admin = is_admin
+        self.platform_meta = {}
+        self.unified_msg_origin = f"bench:{'GroupMessage' if self._group_id else 'FriendMessage'}:{self._group_id or self._sender_id}"
+
+    def get_sender_id(self):
+        return self._sender_id
+
+    def get_sender_name(self):
+        return f"用户{self._sender_id}"
+
+    def get_group_id(self):
+        return self._group_id
+
+    def is_private_chat(self):
+        return not self._group_id
+
+    def is_admin(self):
+        return self._is_admin
+
+    def plain_result(self, 文本):
+        return MessageEventResult().message(文本)
+
+
+def install(data_dir=None, log_level=logging.WARNING):
+    """注册替身模块，返回插件数据目录
+
+    Args:
+        data_dir: 插件数据目录，默认创建临时目录
+        log_level: astrbot 日志器级别
+    """
+    global _数据目录
+    _数据目录 = data_dir or tempfile.mkdtemp(prefix="sce_bench_")
+    os.makedirs(_数据目录, exist_ok=True)
+
+    if isinstance(sys.modules.get("astrbot"), types.ModuleType) and getattr(sys.modules["astrbot"], "__bench_shim__", False):
+        return _数据目录
+
+    日志器 = logging.getLogger("astrbot")
+    日志器.setLevel(log_level)
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+
+    astrbot = types.ModuleType("astrbot")
+    astrbot.__bench_shim__ = True
+    api = types.ModuleType("astrbot.api")
+    api.logger = 日志器
+    event = types.ModuleType("astrbot.api.event")
+    event.filter = _Filter()
+    event.AstrMessageEvent = AstrMessageEvent
+    event.MessageEventResult = MessageEventResult
+    event.MessageChain = MessageChain
+    event_filter = types.ModuleType("astrbot.api.event.filter")
+    event_filter.EventMessageType = EventMessageType
+    star = types.ModuleType("astrbot.api.star")
+    star.Context = Context
+    star.Star = Star
+    star.register = register
+    star.StarTools = StarTools
+
+    astrbot.api = api
+    api.event = event
+    api.star = star
+    sys.modules.update({
+        "astrbot": astrbot,
+        "astrbot.api": api,
+        "astrbot.api.event": event,
+        "astrbot.api.event.filter": event_filter,
+        "astrbot.api.star": star,
+    })
+    return _数据目录
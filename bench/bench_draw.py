@@ -0,0 +1,95 @@
+"""抽奖引擎校验与基准测试
+
+先校验 DrawEngine 的两项保证，不满足时直接报错退出：
+    - 与参与者顺序无关：打乱顺序、以生成器传入时，未加权、加权和多奖项抽取的结果都不变
+    - 权重均为1时结果与按抽签值排序一致，已存档的 blake2b-es-v1 开奖记录可以复核
+再测量不同参与人数下单次遍历抽取的耗时。
+
+    python -m bench.bench_draw --entrants 100000,1000000 --winners 100 --repeat 3
+"""
+import argparse
+import random
+import time
+
+from bench import astrbot_shim
+from bench.stats import 打印表格, 百分位
+
+
+def 生成参与者(数量):
+    return [str(100000 + 序号) for 序号 in range(数量)]
+
+
+def 生成权重(参与者, seed=1):
+    随机数 = random.Random(seed)
+    # 约5%的参与者权重为0（不参与抽取），其余为0.5~5
+    return {参与者ID: (0 if 随机数.random() < 0.05 else 随机数.uniform(0.5, 5)) for 参与者ID in 参与者}
+
+
+def 校验(DrawEngine, 参与者, 获奖人数, 轮数=20):
+    随机数 = random.Random(2)
+    权重 = 生成权重(参与者)
+    奖项列表 = [("一等奖", 1), ("二等奖", 3), ("三等奖", 获奖人数)]
+    for 轮次 in range(轮数):
+        种子 = f"bench-{轮次}"
+        打乱 = 参与者[:]
+        随机数.shuffle(打乱)
+
+        未加权 = DrawEngine.抽取(种子, 参与者, 获奖人数)
+        assert DrawEngine.抽取(种子, iter(打乱), 获奖人数) == 未加权, "未加权抽取与参与者顺序有关"
+        按抽签值 = sorted(参与者, key=lambda 参与者ID: DrawEngine.抽签值(种子, 参与者ID), reverse=True)[:获奖人数]
+        assert 未加权 == 按抽签值, "权重为1时结果与按抽签值排序不一致"
+        assert DrawEngine.抽取(种子, 参与者, 获奖人数, {参与者ID: 1 for 参与者ID in 参与者}) == 未加权, "显式权重1与未加权结果不一致"
+
+        加权 = DrawEngine.抽取(种子, 参与者, 获奖人数, 权重)
+        assert DrawEngine.抽取(种子, (参与者ID for 参与者ID in 打乱), 获奖人数, 权重.get) == 加权, "加权抽取与参与者顺序有关"
+        assert all(权重[参与者ID] > 0 for 参与者ID in 加权), "权重为0的参与者中签"
+
+        多奖项 = DrawEngine.多奖项抽取(种子, 参与者, 奖项列表, 权重)
+        assert DrawEngine.多奖项抽取(种子, iter(打乱), 奖项列表, 权重) == 多奖项, "多奖项抽取与参与者顺序有关"
+        assert [参与者ID for 参与者ID, _ in 多奖项] == DrawEngine.抽取(种子, 参与者, len(多奖项), 权重), "多奖项抽取与加权抽取不一致"
+    print(f"校验通过：{轮数}轮，{len(参与者)}名参与者，未加权/加权/多奖项抽取均与参与者顺序无关")
+
+
+def 计时(函数, 次数):
+    耗时 = []
+    for _ in range(次数):
+        开始 = time.perf_counter()
+        函数()
+        耗时.append(time.perf_counter() - 开始)
+    return 百分位(耗时, 50) * 1000
+
+
+def 运行(参数):
+    astrbot_shim.install()
+    import main
+    DrawEngine = main.DrawEngine
+
+    校验(DrawEngine, 生成参与者(参数.check_entrants), 参数.winners)
+
+    行列表 = []
+    for 人数 in (int(数量) for 数量 in 参数.entrants.split(",")):
+        参与者 = 生成参与者(人数)
+        权重 = 生成权重(参与者)
+        奖项列表 = [("一等奖", 1), ("二等奖", 10), ("三等奖", 参数.winners)]
+        for 方式, 函数 in (
+            ("未加权", lambda: DrawEngine.抽取("bench", 参与者, 参数.winners)),
+            ("加权", lambda: DrawEngine.抽取("bench", 参与者, 参数.winners, 权重)),
+            ("多奖项加权", lambda: DrawEngine.多奖项抽取("bench", 参与者, 奖项列表, 权重)),
+        ):
+            耗时 = 计时(函数, 参数.repeat)
+            行列表.append({"参与人数": 人数, "方式": 方式, "耗时(ms)": round(耗时, 1),
+                          "每百万人(ms)": round(耗时 * 1_000_000 / 人数, 1)})
+    打印表格(行列表)
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="抽奖引擎校验与基准测试")
+    解析器.add_argument("--entrants", default="100000,1000000", help="逗号分隔的参与人数")
+    解析器.add_argument("--winners", type=int, default=100, help="获奖人数")
+    解析器.add_argument("--check-entrants", type=int, default=2000, help="顺序无关校验使用的参与人数")
+    解析器.add_argument("--repeat", type=int, default=3, help="每项测量的次数，取中位数")
+    运行(解析器.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""EmailService 邮件链路吞吐基准测试
+
+在本地模拟后台（bench/fake_admin_server.py）上驱动 quick_send、send_to_all 和抽奖发奖，
+输出每个场景的吞吐（封/秒）与 p50/p99 延迟。
+
+    python -m bench.bench_email_service --count 200 --concurrency 20 --latency 0.02
+    python -m bench.bench_email_service --fail-401 0.05 --fail-400 0.05 --retries 1
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench import astrbot_shim
+from bench.fake_admin_server import FakeAdminServer
+from bench.stats import 打印表格, 汇总
+
+
+async def 并发执行(次数, 并发数, 操作):
+    """以指定并发执行操作，返回 (每次耗时列表, 总耗时, 成功次数)"""
+    信号量 = asyncio.Semaphore(并发数)
+    耗时列表 = []
+
+    async def 单次(序号):
+        async with 信号量:
+            开始 = time.perf_counter()
+            try:
+                return await 操作(序号)
+            finally:
+                耗时列表.append(time.perf_counter() - 开始)
+
+    开始 = time.perf_counter()
+    结果 = await asyncio.gather(*(单次(序号) for 序号 in range(次数)))
+    return 耗时列表, time.perf_counter() - 开始, sum(1 for 成功 in 结果 if 成功)
+
+
+def 创建服务(main, 参数):
+    return main.EmailService("bench-token-" + "x" * 40, max_retries=参数.retries, timeout=参数.client_timeout,
+                             rate_limit=参数.rate_limit)
+
+
+async def 测试quick_send(main, 参数):
+    服务 = 创建服务(main, 参数)
+
+    async def 操作(序号):
+        结果 = await 服务.quick_send("压测邮件", "压测内容", str(100000 + 序号), attachment="$p_95jd.lobby_resource.魂晶.root:1")
+        return 结果.get("success")
+
+    return 汇总("quick_send", *await 并发执行(参数.count, 参数.concurrency, 操作))
+
+
+async def 测试send_to_all(main, 参数):
+    服务 = 创建服务(main, 参数)
+
+    async def 操作(序号):
+        结果 = await 服务.send_to_all("全服压测邮件", "压测内容", attachment="$p_95jd.lobby_resource.魂晶.root:1")
+        return 结果.get("success")
+
+    return 汇总("send_to_all", *await 并发执行(参数.count, 参数.concurrency, 操作))
+
+
+async def 测试抽奖发奖(main, 参数, 数据目录, 服务):
+    """完整执行一次开奖，统计每位获奖者的发奖耗时"""
+    插件 = main.MyPlugin(astrbot_shim.Context())
+    if 参数.rate_limit is not None:
+        插件.邮件请求速率 = 参数.rate_limit
+    插件.邮件失败日志 = main.EmailFailureJournal(os.path.join(数据目录, "logs"))
+    main.追踪器.日志文件 = os.path.join(数据目录, "logs", "slow_ops.log")
+    # 收到401时由模拟刷新直接换发新token：插件真实的刷新流程会逐个访问游戏页面并按退避重试，
+    # 耗时与邮件链路无关，计入压测会掩盖发奖本身的吞吐
+    刷新次数 = 0
+
+    async def 模拟刷新():
+        nonlocal 刷新次数
+        await asyncio.sleep(参数.refresh_delay)
+        刷新次数 += 1
+        插件.current_token = f"bench-token-refreshed-{刷新次数}-" + "x" * 32
+        return 插件.current_token
+
+    插件.token_provider._刷新令牌 = 模拟刷新
+    获奖人数 = 参数.count
+    参与者 = [f"qq{序号}" for 序号 in range(获奖人数)]
+    插件.玩家数据.设置绑定({qq: str(200000 + 序号) for 序号, qq in enumerate(参与者)})
+    插件.抽奖索引.添加("bench_lottery", {
+        "游戏名称": "捉妖:钟馗", "奖励名称": "魂晶", "奖励数量": "1", "抽奖人数": 获奖人数,
+        "发起人": "bench", "截止时间": "2000-01-01 00:00:00", "参与者": 参与者, "群聊ID": "bench_group",
+    })
+
+    原方法 = 插件.send_personal_reward_email
+    耗时列表 = []
+
+    async def 计时发送(*args, **kwargs):
+        开始 = time.perf_counter()
+        try:
+            return await 原方法(*args, **kwargs)
+        finally:
+            耗时列表.append(time.perf_counter() - 开始)
+
+    插件.send_personal_reward_email = 计时发送
+    事件 = astrbot_shim.AstrMessageEvent(group_id="bench_group")
+    开始 = time.perf_counter()
+    公告 = [消息 async for 消息 in 插件.开奖("bench_lottery", 事件)]
+    总耗时 = time.perf_counter() - 开始
+    插件.邮件失败日志.关闭()
+    结果 = 汇总("抽奖发奖", 耗时列表, 总耗时)
+    结果["备注"] = f"公告{len(公告)}条，刷新token{刷新次数}次"
+    return 结果
+
+
+async def 运行(参数):
+    数据目录 = astrbot_shim.install()
+    import main
+
+    with FakeAdminServer(latency=参数.latency, jitter=参数.jitter, fail_401=参数.fail_401, fail_400=参数.fail_400,
+                         timeout_rate=参数.timeout_rate, timeout_delay=参数.client_timeout + 1,
+                         dialog_box=参数.dialog_box, seed=参数.seed,
+                         rate_limit=参数.server_rate_limit, retry_after=参数.retry_after) as 服务:
+        main.EmailService.DEFAULT_BASE_URL = 服务.url
+        if 参数.rate_limit:
+            main.EmailService.RATE_BURST = max(1, int(参数.rate_limit))
+        结果 = []
+        for 场景 in 参数.scenarios.split(","):
+            if 场景 == "quick_send":
+                结果.append(await 测试quick_send(main, 参数))
+            elif 场景 == "send_to_all":
+                结果.append(await 测试send_to_all(main, 参数))
+            elif 场景 == "lottery":
+                结果.append(await 测试抽奖发奖(main, 参数, 数据目录, 服务))
+        打印表格(结果)
+        print(f"模拟后台统计: {服务.统计}")
+    return 结果
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="EmailService 吞吐基准测试")
+    解析器.add_argument("--count", type=int, default=100, help="每个场景的邮件数量")
+    解析器.add_argument("--concurrency", type=int, default=10, help="quick_send/send_to_all 的并发数")
+    解析器.add_argument("--scenarios", default="quick_send,send_to_all,lottery", help="逗号分隔的场景列表")
+    解析器.add_argument("--latency", type=float, default=0.01, help="模拟后台固定延迟（秒）")
+    解析器.add_argument("--jitter", type=float, default=0.0, help="模拟后台随机延迟上限（秒）")
+    解析器.add_argument("--fail-401", type=float, default=0.0)
+    解析器.add_argument("--fail-400", type=float, default=0.0)
+    解析器.add_argument("--timeout-rate", type=float, default=0.0)
+    解析器.add_argument("--client-timeout", type=float, default=2.0, help="EmailService 请求超时（秒）")
+    解析器.add_argument("--retries", type=int, default=0, help="EmailService 重试次数")
+    解析器.add_argument("--dialog-box", action="store_true", help="添加接口返回dialog_box格式")
+    解析器.add_argument("--server-rate-limit", type=float, default=None, help="模拟后台每秒允许的请求数，超出返回429")
+    解析器.add_argument("--refresh-delay", type=float, default=0.05, help="抽奖发奖场景中模拟token刷新的耗时（秒）")
+    解析器.add_argument("--retry-after", type=float, default=1.0, help="模拟后台429响应的Retry-After秒数")
+    解析器.add_argument("--rate-limit", type=float, default=None, help="EmailService 每个项目的初始限流速率（请求/秒），默认不限速，只在收到429后减速")
+    解析器.add_argument("--seed", type=int, default=1)
+    asyncio.run(运行(解析器.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
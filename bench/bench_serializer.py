@@ -0,0 +1,83 @@
+"""数据文件序列化基准测试
+
+用与 PlayerStore 快照相同结构的合成玩家数据，比较各序列化方式的编码耗时、解码耗时和文件大小：
+    - 标准库可读：json.dumps(indent=2, ensure_ascii=False)，即原来的写法
+    - orjson 可读 / 紧凑 / 二进制（未安装 orjson 时只测标准库）
+    - 标准库 紧凑 / 二进制
+
+    python -m bench.bench_serializer --players 10000,100000 --repeat 3
+"""
+import argparse
+import datetime
+import random
+import time
+
+from bench import astrbot_shim
+from bench.stats import 打印表格, 百分位
+
+
+def 生成玩家数据(数量, seed=1):
+    随机数 = random.Random(seed)
+    今天 = datetime.date.today().toordinal()
+    游戏列表 = ["捉妖:钟馗", "游戏2", "游戏3", "游戏4"]
+    return {
+        str(100000 + 序号): {
+            "绑定ID": str(300000 + 随机数.randrange(10 ** 6)),
+            "连续签到": 随机数.randrange(60),
+            "上次签到日": 今天 - 随机数.randrange(30),
+            "活跃度": 随机数.randrange(20000),
+            "签到记录": {游戏: 今天 - 随机数.randrange(30) for 游戏 in 随机数.sample(游戏列表, 随机数.randrange(1, 5))},
+        }
+        for 序号 in range(数量)
+    }
+
+
+def 计时(函数, 次数):
+    耗时 = []
+    结果 = None
+    for _ in range(次数):
+        开始 = time.perf_counter()
+        结果 = 函数()
+        耗时.append(time.perf_counter() - 开始)
+    return 百分位(耗时, 50) * 1000, 结果
+
+
+def 运行(参数):
+    astrbot_shim.install()
+    import main
+    Serializer = main.Serializer
+
+    方案 = []
+    if main.orjson is not None:
+        方案 += [("orjson", 格式) for 格式 in (Serializer.可读, Serializer.紧凑, Serializer.二进制)]
+    方案 += [("标准库", 格式) for 格式 in (Serializer.可读, Serializer.紧凑, Serializer.二进制)]
+
+    行列表 = []
+    for 玩家数 in (int(数量) for 数量 in 参数.players.split(",")):
+        数据 = 生成玩家数据(玩家数)
+        基准大小 = None
+        for 库, 格式 in 方案:
+            Serializer.使用orjson = 库 == "orjson"
+            编码耗时, 内容 = 计时(lambda: Serializer.编码(数据, 格式), 参数.repeat)
+            解码耗时, 解码结果 = 计时(lambda: Serializer.解码(内容), 参数.repeat)
+            assert 解码结果 == 数据
+            if 基准大小 is None and 库 == "标准库" and 格式 == Serializer.可读:
+                基准大小 = len(内容)
+            行列表.append({"玩家数": 玩家数, "库": 库, "格式": 格式, "编码(ms)": round(编码耗时, 1),
+                          "解码(ms)": round(解码耗时, 1), "大小(KB)": round(len(内容) / 1024, 1)})
+        for 行 in 行列表:
+            if 行["玩家数"] == 玩家数 and 基准大小:
+                行["相对大小"] = f"{行['大小(KB)'] * 1024 / 基准大小:.0%}"
+    Serializer.使用orjson = main.orjson is not None
+    打印表格(行列表)
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="数据文件序列化基准测试")
+    解析器.add_argument("--players", default="10000,100000", help="逗号分隔的玩家数量")
+    解析器.add_argument("--repeat", type=int, default=3, help="每项测量的次数，取中位数")
+    运行(解析器.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""插件启动耗时基准测试
+
+在数据目录中生成大量玩家和抽奖数据，每轮在新的子进程中冷启动插件，分阶段计时：
+    - 导入：注册替身模块并导入 main（以及 requests 是否已被真正加载）
+    - 构造：MyPlugin.__init__
+    - 初始化：await initialize()，即插件可以开始处理指令的时刻
+    - 首条指令：启动后立即执行一条「查看ID」
+    - 后台预热：数据文件校验和存储预加载在后台完成的时刻（从初始化开始算）
+
+    python -m bench.bench_startup --players 100000 --lotteries 2000 --repeat 5
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.stats import 打印表格, 百分位
+
+
+def 生成数据(数据目录, 玩家数, 抽奖数):
+    """写入玩家数据、抽奖数据和token文件，返回一个已绑定的用户ID"""
+    os.makedirs(数据目录, exist_ok=True)
+    今天 = datetime.date.today().toordinal()
+    玩家 = {
+        str(100000 + 序号): {"绑定ID": str(300000 + 序号), "连续签到": 序号 % 30, "上次签到日": 今天 - 序号 % 3,
+                            "活跃度": 序号 % 5000, "签到记录": {"捉妖:钟馗": 今天 - 序号 % 3}}
+        for 序号 in range(玩家数)
+    }
+    抽奖 = {
+        f"bench_{序号}": {"游戏名称": "捉妖:钟馗", "奖励名称": "魂晶", "奖励数量": "1", "抽奖人数": 10, "发起人": "bench",
+                         "截止时间": "2099-01-01 00:00:00", "参与者": [str(100000 + 序号 * 7 % max(1, 玩家数))] * 20,
+                         "群聊ID": f"group{序号 % 20}"}
+        for 序号 in range(抽奖数)
+    }
+    for 文件名, 数据 in (("玩家数据.json", 玩家), ("抽奖数据存储.json", 抽奖), ("系统token存储.json", {})):
+        with open(os.path.join(数据目录, 文件名), "w", encoding="utf-8") as f:
+            json.dump(数据, f, ensure_ascii=False, indent=2)
+    return "100000"
+
+
+async def 子进程计时(数据目录, 用户ID):
+    """在当前进程中冷启动插件并输出各阶段耗时（毫秒）"""
+    结果 = {}
+    开始 = time.perf_counter()
+    from bench import astrbot_shim
+    astrbot_shim.install(数据目录)
+    import main
+    结果["导入"] = (time.perf_counter() - 开始) * 1000
+    结果["requests已加载"] = type(sys.modules.get("requests")).__name__ == "module"
+
+    from bench.fake_admin_server import FakeAdminServer
+    with FakeAdminServer() as 服务:
+        main.EmailService.DEFAULT_BASE_URL = 服务.url
+        开始 = time.perf_counter()
+        插件 = main.MyPlugin(astrbot_shim.Context())
+        结果["构造"] = (time.perf_counter() - 开始) * 1000
+        插件.邮件失败日志 = main.EmailFailureJournal(os.path.join(数据目录, "logs"))
+        main.追踪器.日志文件 = os.path.join(数据目录, "logs", "slow_ops.log")
+        for 配置 in 插件.game_configs.values():
+            配置["URL"] = f"{服务.url}/dashboard/{配置.get('项目ID', 'bench')}"
+
+        开始 = time.perf_counter()
+        await 插件.initialize()
+        结果["初始化"] = (time.perf_counter() - 开始) * 1000
+
+        指令开始 = time.perf_counter()
+        [_ async for _ in 插件.handle_view_id(astrbot_shim.AstrMessageEvent("查看ID", sender_id=用户ID))]
+        结果["首条指令"] = (time.perf_counter() - 指令开始) * 1000
+
+        if getattr(插件, "warmup_task", None) is not None:
+            await 插件.warmup_task
+        结果["后台预热"] = (time.perf_counter() - 开始) * 1000
+        await 插件.terminate()
+    print(json.dumps(结果))
+
+
+def 运行(参数):
+    数据目录 = 参数.data_dir or tempfile.mkdtemp(prefix="sce_startup_")
+    开始 = time.perf_counter()
+    用户ID = 生成数据(数据目录, 参数.players, 参数.lotteries)
+    大小 = sum(os.path.getsize(os.path.join(数据目录, 名称)) for 名称 in os.listdir(数据目录) if 名称.endswith(".json"))
+    print(f"已生成 {参数.players} 名玩家、{参数.lotteries} 个抽奖，数据文件共 {大小 / 1024 / 1024:.1f}MB，"
+          f"耗时{time.perf_counter() - 开始:.1f}秒")
+
+    轮次结果 = []
+    for _ in range(参数.repeat):
+        输出 = subprocess.run([sys.executable, "-m", "bench.bench_startup", "--child", 数据目录, "--user", 用户ID],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        轮次结果.append(json.loads(输出.stdout.strip().splitlines()[-1]))
+
+    行列表 = []
+    for 阶段 in ("导入", "构造", "初始化", "首条指令", "后台预热"):
+        耗时 = [结果[阶段] for 结果 in 轮次结果]
+        行列表.append({"阶段": 阶段, "p50(ms)": round(百分位(耗时, 50), 2), "max(ms)": round(max(耗时), 2)})
+    打印表格(行列表)
+    print(f"导入后requests已加载: {any(结果['requests已加载'] for 结果 in 轮次结果)}")
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="插件启动耗时基准测试")
+    解析器.add_argument("--players", type=int, default=100000, help="生成的玩家数量")
+    解析器.add_argument("--lotteries", type=int, default=1000, help="生成的进行中抽奖数量")
+    解析器.add_argument("--repeat", type=int, default=5, help="冷启动次数")
+    解析器.add_argument("--data-dir", default=None, help="数据目录，默认创建临时目录")
+    解析器.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    解析器.add_argument("--user", default=None, help=argparse.SUPPRESS)
+    参数 = 解析器.parse_args()
+    if 参数.child:
+        asyncio.run(子进程计时(参数.child, 参数.user))
+    else:
+        运行(参数)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""星火后台邮件接口的本地模拟服务
+
+实现 EmailService 用到的三个接口：
+    /api/v1/table/add   添加邮件，返回 row_id 或抓包中见到的 dialog_box 格式
+    /api/v1/table/row   触发发送
+    /api/v1/table/data  邮件列表
+其余 GET/OPTIONS 请求一律返回200的空页面，插件刷新token时访问的游戏页面可以指向本服务。
+支持配置延迟、按比例注入 401、400 和超时，以及按速率限流返回带 Retry-After 的 429，
+用于离线测量邮件链路的吞吐和延迟。
+
+命令行启动：
+    python -m bench.fake_admin_server --port 8765 --latency 0.05 --fail-401 0.1
+代码中使用：
+    with FakeAdminServer(latency=0.02) as 服务:
+        EmailService.DEFAULT_BASE_URL = 服务.url
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeAdminServer:
+    """模拟后台服务，在后台线程中运行"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, fail_401=0.0, fail_400=0.0,
+                 timeout_rate=0.0, timeout_delay=5.0, dialog_box=False, valid_tokens=None, seed=None,
+                 rate_limit=None, retry_after=1.0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            latency: 每个请求的固定延迟（秒）
+            jitter: 在固定延迟上叠加的随机延迟上限（秒）
+            fail_401: 返回401的比例
+            fail_400: 返回400的比例
+            timeout_rate: 模拟超时（延迟timeout_delay秒后才响应）的比例
+            timeout_delay: 模拟超时时的响应延迟（秒），应大于客户端超时
+            dialog_box: 添加接口是否返回不带row_id的dialog_box格式
+            valid_tokens: 有效token集合，为None时不校验token
+            seed: 故障注入随机数种子，便于复现
+            rate_limit: 每秒允许的POST请求数，超出时返回429，为None时不限流
+            retry_after: 429响应中Retry-After头的秒数
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_401 = fail_401
+        self.fail_400 = fail_400
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.dialog_box = dialog_box
+        self.valid_tokens = set(valid_tokens) if valid_tokens is not None else None
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._限流令牌 = float(rate_limit or 0)
+        self._限流时间 = time.monotonic()
+        self._随机数 = random.Random(seed)
+        self._锁 = threading.Lock()
+        self._下一个行ID = 1
+        self.邮件表 = []
+        self.统计 = {"add": 0, "row": 0, "data": 0, "401": 0, "400": 0, "429": 0, "timeout": 0}
+        self._服务 = ThreadingHTTPServer((host, port), self._创建处理器())
+        self._服务.daemon_threads = True
+        self._线程 = None
+
+    @property
+    def url(self) -> str:
+        主机, 端口 = self._服务.server_address[:2]
+        return f"http://{主机}:{端口}"
+
+    def start(self):
+        self._线程 = threading.Thread(target=self._服务.serve_forever, name="fake-admin-server", daemon=True)
+        self._线程.start()
+        return self
+
+    def stop(self):
+        self._服务.shutdown()
+        self._服务.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _抽中(self, 比例) -> bool:
+        if 比例 <= 0:
+            return False
+        with self._锁:
+            return self._随机数.random() < 比例
+
+    def _计数(self, 键):
+        with self._锁:
+            self.统计[键] += 1
+
+    def _被限流(self) -> bool:
+        """服务端令牌桶，容量等于每秒请求数"""
+        if not self.rate_limit:
+            return False
+        with self._锁:
+            现在 = time.monotonic()
+            self._限流令牌 = min(self.rate_limit, self._限流令牌 + (现在 - self._限流时间) * self.rate_limit)
+            self._限流时间 = 现在
+            if self._限流令牌 < 1:
+                self.统计["429"] += 1
+                return True
+            self._限流令牌 -= 1
+            return False
+
+    def _处理(self, 路径, 请求头, 请求体):
+        """返回 (状态码, 响应对象)"""
+        延迟 = self.latency + (self._随机数.uniform(0, self.jitter) if self.jitter else 0)
+        if self._抽中(self.timeout_rate):
+            self._计数("timeout")
+            延迟 = max(延迟, self.timeout_delay)
+        if 延迟:
+            time.sleep(延迟)
+
+        if self.valid_tokens is not None:
+            认证 = 请求头.get("Authorization", "")
+            token = 认证[7:] if 认证.startswith("Bearer ") else ""
+            if token not in self.valid_tokens:
+                self._计数("401")
+                return 401, {"result": 401, "msg": "unauthorized"}
+        if self._抽中(self.fail_401):
+            self._计数("401")
+            return 401, {"result": 401, "msg": "unauthorized"}
+        if self._抽中(self.fail_400):
+            self._计数("400")
+            return 400, {"result": 1, "msg": "参数错误"}
+
+        if 路径.endswith("/table/add"):
+            self._计数("add")
+            with self._锁:
+                行ID = self._下一个行ID
+                self._下一个行ID += 1
+                负载 = 请求体.get("payload", {})
+                self.邮件表.append({"row_id": 行ID, "title": 负载.get("title"), "target": 负载.get("target"),
+                                   "target_type": 负载.get("target_type"), "sent": False})
+            if self.dialog_box:
+                return 200, {"result": 0, "msg": "添加成功", "dialog_box": {"title": "提示", "content": "添加成功"}}
+            return 200, {"result": 0, "msg": "添加成功", "data": {"row_id": 行ID}}
+
+        if 路径.endswith("/table/row"):
+            self._计数("row")
+            with self._锁:
+                for 行 in self.邮件表:
+                    if 行["row_id"] == 请求体.get("row_id"):
+                        行["sent"] = True
+            return 200, {"result": 0, "msg": "发送成功"}
+
+        if 路径.endswith("/table/data"):
+            self._计数("data")
+            页码 = int(请求体.get("page", 1))
+            每页 = int(请求体.get("page_limit", 10))
+            with self._锁:
+                倒序 = list(reversed(self.邮件表))
+            return 200, {"list": 倒序[(页码 - 1) * 每页:页码 * 每页], "page_info": {"total": len(倒序)}}
+
+        return 404, {"result": 404, "msg": "not found"}
+
+    def _创建处理器(self):
+        服务 = self
+
+        class 处理器(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                长度 = int(self.headers.get("Content-Length") or 0)
+                原始 = self.rfile.read(长度) if 长度 else b""
+                try:
+                    请求体 = json.loads(原始 or b"{}")
+                except ValueError:
+                    请求体 = {}
+                额外头 = {}
+                if 服务._被限流():
+                    状态码, 响应 = 429, {"result": 429, "msg": "too many requests"}
+                    额外头["Retry-After"] = str(服务.retry_after)
+                else:
+                    状态码, 响应 = 服务._处理(self.path, self.headers, 请求体)
+                内容 = json.dumps(响应, ensure_ascii=False).encode("utf-8")
+                try:
+                    self.send_response(状态码)
+                    for 名称, 值 in 额外头.items():
+                        self.send_header(名称, 值)
+                    self.send_header("Content-Type", "application/json; charset=utf-8")
+                    self.send_header("Content-Length", str(len(内容)))
+                    self.end_headers()
+                    self.wfile.write(内容)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已超时断开
+                    pass
+
+            def do_GET(self):
+                内容 = b"<html></html>"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(内容)))
+                self.end_headers()
+                self.wfile.write(内容)
+
+            def do_OPTIONS(self):
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return 处理器
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="星火后台邮件接口模拟服务")
+    解析器.add_argument("--host", default="127.0.0.1")
+    解析器.add_argument("--port", type=int, default=8765)
+    解析器.add_argument("--latency", type=float, default=0.0, help="固定延迟（秒）")
+    解析器.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限（秒）")
+    解析器.add_argument("--fail-401", type=float, default=0.0, help="返回401的比例")
+    解析器.add_argument("--fail-400", type=float, default=0.0, help="返回400的比例")
+    解析器.add_argument("--timeout-rate", type=float, default=0.0, help="模拟超时的比例")
+    解析器.add_argument("--timeout-delay", type=float, default=35.0, help="模拟超时的响应延迟（秒）")
+    解析器.add_argument("--dialog-box", action="store_true", help="添加接口返回dialog_box格式")
+    解析器.add_argument("--rate-limit", type=float, default=None, help="每秒允许的请求数，超出返回429")
+    解析器.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    参数 = 解析器.parse_args()
+    服务 = FakeAdminServer(参数.host, 参数.port, 参数.latency, 参数.jitter, 参数.fail_401, 参数.fail_400,
+                        参数.timeout_rate, 参数.timeout_delay, 参数.dialog_box,
+                        rate_limit=参数.rate_limit, retry_after=参数.retry_after)
+    print(f"模拟后台服务已启动: {服务.url}")
+    try:
+        服务._服务.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        服务._服务.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""脱离 AstrBot 运行 MyPlugin 的压测工具
+
+使用 bench.astrbot_shim 中的替身导入插件，所有邮件请求发往本地模拟后台。
+合成大量并发的「签到」「绑定ID」「参与抽奖」等指令直接调用插件的指令处理器，记录：
+    - 每种指令的延迟分布（p50/p99/max）
+    - 插件数据文件的读写次数（按文件统计）
+    - 事件循环阻塞时间（心跳任务测得的调度延迟）
+
+    python -m bench.harness --users 500 --events 3000 --concurrency 200
+    python -m bench.harness --mix 签到=1 --prebind --latency 0.05
+"""
+import argparse
+import asyncio
+import builtins
+import collections
+import os
+import random
+import time
+
+from bench import astrbot_shim
+from bench.fake_admin_server import FakeAdminServer
+from bench.stats import 打印表格, 汇总, 百分位
+
+
+class 合成事件生成器:
+    """按指令权重随机生成消息事件，同一种子生成的事件序列相同"""
+
+    def __init__(self, 用户数=100, 群数=5, 指令权重=None, 抽奖ID列表=(), seed=1):
+        self.用户列表 = [str(100000 + 序号) for 序号 in range(用户数)]
+        self.群列表 = [f"group{序号}" for 序号 in range(群数)]
+        self.指令权重 = 指令权重 or {"签到": 5, "绑定ID": 2, "参与抽奖": 3}
+        self.抽奖ID列表 = list(抽奖ID列表)
+        self._随机数 = random.Random(seed)
+
+    def 生成(self, 指令, 用户ID=None, 群聊ID=None):
+        用户ID = 用户ID or self._随机数.choice(self.用户列表)
+        群聊ID = 群聊ID if 群聊ID is not None else self._随机数.choice(self.群列表)
+        if 指令 == "签到":
+            消息 = "签到 捉妖:钟馗"
+        elif 指令 == "绑定ID":
+            消息 = f"绑定ID {300000 + int(用户ID) % 100000}"
+        elif 指令 == "参与抽奖":
+            消息 = f"参与抽奖 {self._随机数.choice(self.抽奖ID列表) if self.抽奖ID列表 else 'none'}"
+        else:
+            消息 = 指令
+        return astrbot_shim.AstrMessageEvent(消息, sender_id=用户ID, group_id=群聊ID)
+
+    def 批量生成(self, 数量):
+        指令列表 = list(self.指令权重)
+        权重 = [self.指令权重[指令] for 指令 in 指令列表]
+        for _ in range(数量):
+            yield self.生成(self._随机数.choices(指令列表, 权重)[0])
+
+
+class 事件循环监视器:
+    """心跳任务：按固定间隔休眠，实际唤醒时间与预期的差值即事件循环被阻塞的时间"""
+
+    def __init__(self, 间隔=0.005):
+        self.间隔 = 间隔
+        self.延迟列表 = []
+        self._任务 = None
+        self._预期 = None
+
+    async def _心跳(self):
+        循环 = asyncio.get_running_loop()
+        while True:
+            self._预期 = 循环.time() + self.间隔
+            await asyncio.sleep(self.间隔)
+            self.延迟列表.append(max(0.0, 循环.time() - self._预期))
+            self._预期 = None
+
+    def 开始(self):
+        self._预期 = asyncio.get_running_loop().time() + self.间隔
+        self._任务 = asyncio.create_task(self._心跳())
+
+    async def 停止(self):
+        # 最后一次心跳可能因循环一直被占用而来不及唤醒，补记这段阻塞
+        if self._预期 is not None:
+            滞后 = asyncio.get_running_loop().time() - self._预期
+            if 滞后 > 0:
+                self.延迟列表.append(滞后)
+        self._任务.cancel()
+        try:
+            await self._任务
+        except asyncio.CancelledError:
+            pass
+
+    def 报告(self):
+        return {
+            "阻塞总时长(s)": round(sum(self.延迟列表), 3),
+            "最大阻塞(ms)": round(max(self.延迟列表, default=0) * 1000, 2),
+            "p99阻塞(ms)": round(百分位(self.延迟列表, 99) * 1000, 2),
+        }
+
+
+class 文件IO计数器:
+    """替换插件模块内的 open，按数据目录下的文件统计读写次数"""
+
+    def __init__(self, 模块, 数据目录):
+        self.模块 = 模块
+        self.数据目录 = os.path.abspath(数据目录)
+        self.读 = collections.Counter()
+        self.写 = collections.Counter()
+
+    def _open(self, 文件, 模式="r", *args, **kwargs):
+        路径 = os.path.abspath(os.fspath(文件)) if isinstance(文件, (str, bytes, os.PathLike)) else None
+        if 路径 and 路径.startswith(self.数据目录):
+            名称 = os.path.relpath(路径, self.数据目录)
+            (self.写 if any(c in 模式 for c in "wax+") else self.读)[名称] += 1
+        return builtins.open(文件, 模式, *args, **kwargs)
+
+    def 安装(self):
+        self.模块.open = self._open
+
+    def 卸载(self):
+        if getattr(self.模块, "open", None) == self._open:
+            del self.模块.open
+
+    def 报告(self):
+        return [{"文件": 名称, "读": self.读[名称], "写": self.写[名称]} for 名称 in sorted(set(self.读) | set(self.写))]
+
+
+class PluginHarness:
+    """加载插件并执行指令的压测上下文"""
+
+    def __init__(self, 数据目录=None, 后台=None, 日志级别=None):
+        import logging
+        self.数据目录 = astrbot_shim.install(数据目录, 日志级别 or logging.ERROR)
+        import main
+        self.main = main
+        self.后台 = 后台 or FakeAdminServer()
+        self._自建后台 = 后台 is None
+        self.插件 = None
+        self.指令表 = {}
+        self.上下文 = astrbot_shim.Context()
+
+    async def __aenter__(self):
+        if self._自建后台:
+            self.后台.start()
+        self.main.EmailService.DEFAULT_BASE_URL = self.后台.url
+        self.插件 = self.main.MyPlugin(self.上下文)
+        self.插件.邮件失败日志 = self.main.EmailFailureJournal(os.path.join(self.数据目录, "logs"))
+        self.main.追踪器.日志文件 = os.path.join(self.数据目录, "logs", "slow_ops.log")
+        # token刷新访问的游戏页面也指向模拟后台
+        for 配置 in self.插件.game_configs.values():
+            配置["URL"] = f"{self.后台.url}/dashboard/{配置.get('项目ID', 'bench')}"
+        await self.插件.initialize()
+        for 名称 in dir(type(self.插件)):
+            方法 = getattr(type(self.插件), 名称, None)
+            指令 = getattr(方法, "__bench_command__", None)
+            if 指令:
+                self.指令表[指令] = getattr(self.插件, 名称)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.插件.terminate()
+        if self._自建后台:
+            self.后台.stop()
+
+    async def 执行(self, 事件):
+        """执行一条指令，返回插件回复的文本列表"""
+        指令 = 事件.message_str.split()[0]
+        处理器 = self.指令表.get(指令)
+        if 处理器 is None:
+            raise KeyError(f"未知指令: {指令}")
+        return [结果[0] if isinstance(结果, list) and 结果 else 结果 async for 结果 in 处理器(事件)]
+
+    def 预先绑定(self, 用户列表):
+        self.插件.玩家数据.设置绑定({用户: str(300000 + int(用户) % 100000) for 用户 in 用户列表})
+
+    def 创建抽奖(self, 数量, 群列表):
+        抽奖ID列表 = []
+        for 序号 in range(数量):
+            抽奖ID = f"bench_{序号}"
+            self.插件.抽奖索引.添加(抽奖ID, {
+                "游戏名称": "捉妖:钟馗", "奖励名称": "魂晶", "奖励数量": "1", "抽奖人数": 10, "发起人": "bench",
+                "截止时间": "2099-01-01 00:00:00", "参与者": [], "群聊ID": 群列表[序号 % len(群列表)],
+            })
+            抽奖ID列表.append(抽奖ID)
+        return 抽奖ID列表
+
+    async def 压测(self, 事件列表, 并发数=100):
+        """并发执行事件，返回 (按指令汇总的延迟, 文件IO统计, 事件循环阻塞统计)"""
+        耗时 = collections.defaultdict(list)
+        信号量 = asyncio.Semaphore(并发数)
+        计数器 = 文件IO计数器(self.main, self.数据目录)
+        监视器 = 事件循环监视器()
+
+        async def 单次(事件):
+            async with 信号量:
+                开始 = time.perf_counter()
+                await self.执行(事件)
+                耗时[事件.message_str.split(" ")[0]].append(time.perf_counter() - 开始)
+
+        计数器.安装()
+        监视器.开始()
+        开始 = time.perf_counter()
+        try:
+            await asyncio.gather(*(单次(事件) for 事件 in 事件列表))
+        finally:
+            总耗时 = time.perf_counter() - 开始
+            await 监视器.停止()
+            计数器.卸载()
+        return [汇总(指令, 列表, 总耗时) for 指令, 列表 in sorted(耗时.items())], 计数器.报告(), 监视器.报告()
+
+
+def 解析权重(文本):
+    权重 = {}
+    for 项 in 文本.split(","):
+        指令, _, 值 = 项.partition("=")
+        权重[指令.strip()] = float(值 or 1)
+    return 权重
+
+
+async def 运行(参数):
+    后台 = FakeAdminServer(latency=参数.latency, fail_401=参数.fail_401, fail_400=参数.fail_400, seed=参数.seed)
+    with 后台:
+        async with PluginHarness(后台=后台) as 工具:
+            生成器 = 合成事件生成器(参数.users, 参数.groups, 解析权重(参数.mix), seed=参数.seed)
+            if 参数.prebind:
+                工具.预先绑定(生成器.用户列表)
+            生成器.抽奖ID列表 = 工具.创建抽奖(参数.lotteries, 生成器.群列表)
+            延迟, 文件IO, 阻塞 = await 工具.压测(list(生成器.批量生成(参数.events)), 参数.concurrency)
+    print("== 指令延迟 ==")
+    打印表格(延迟)
+    print("\n== 数据文件读写次数 ==")
+    打印表格(文件IO)
+    print("\n== 事件循环阻塞 ==")
+    打印表格([阻塞])
+    print(f"\n模拟后台统计: {后台.统计}")
+
+
+def main():
+    解析器 = argparse.ArgumentParser(description="MyPlugin 脱机压测")
+    解析器.add_argument("--users", type=int, default=200, help="合成用户数量")
+    解析器.add_argument("--groups", type=int, default=5, help="合成群聊数量")
+    解析器.add_argument("--events", type=int, default=1000, help="指令总数")
+    解析器.add_argument("--concurrency", type=int, default=100, help="同时处理的指令数")
+    解析器.add_argument("--mix", default="签到=5,绑定ID=2,参与抽奖=3", help="指令权重，如 签到=5,绑定ID=2")
+    解析器.add_argument("--lotteries", type=int, default=3, help="预先创建的抽奖数量")
+    解析器.add_argument("--prebind", action="store_true", help="压测前为所有用户绑定ID")
+    解析器.add_argument("--latency", type=float, default=0.01, help="模拟后台延迟（秒）")
+    解析器.add_argument("--fail-401", type=float, default=0.0)
+    解析器.add_argument("--fail-400", type=float, default=0.0)
+    解析器.add_argument("--seed", type=int, default=1)
+    asyncio.run(运行(解析器.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""基准测试共用的统计工具"""
+import math
+
+
+def 百分位(数据, 百分比: float) -> float:
+    """最近秩法计算百分位数，数据为空时返回0"""
+    if not 数据:
+        return 0.0
+    有序 = sorted(数据)
+    秩 = max(1, math.ceil(百分比 / 100 * len(有序)))
+    return 有序[秩 - 1]
+
+
+def 汇总(名称: str, 耗时列表, 总耗时: float, 成功数: int = None) -> dict:
+    """汇总一组操作耗时（秒），返回吞吐量与延迟分位数（毫秒）"""
+    数量 = len(耗时列表)
+    return {
+        "场景": 名称,
+        "次数": 数量,
+        "成功": 数量 if 成功数 is None else 成功数,
+        "吞吐(次/秒)": round(数量 / 总耗时, 2) if 总耗时 > 0 else 0.0,
+        "p50(ms)": round(百分位(耗时列表, 50) * 1000, 2),
+        "p99(ms)": round(百分位(耗时列表, 99) * 1000, 2),
+        "max(ms)": round(max(耗时列表) * 1000, 2) if 耗时列表 else 0.0,
+    }
+
+
+def 打印表格(行列表):
+    """以对齐的文本表格输出汇总结果"""
+    if not 行列表:
+        return
+    列 = list(行列表[0].keys())
+    宽度 = {c: max(len(str(c)), *(len(str(行.get(c, ""))) for 行 in 行列表)) for c in 列}
+    print("  ".join(str(c).ljust(宽度[c]) for c in 列))
+    for 行 in 行列表:
+        print("  ".join(str(行.get(c, "")).ljust(宽度[c]) for c in 列))
@@ -7,16 +7,410 @@ from astrbot.api import logger as astrbot_logger
 import json
 import os
 import datetime
-import requests
 import asyncio
 from pathlib import Path
 import time
 import random
+import re
+import base64
+import traceback
+import importlib
+import hashlib
+import heapq
+import math
+import secrets
+import bisect
+import queue
+import threading
+import uuid
+import contextvars
+import functools
+import logging
+import email.utils
+import contextlib
+import collections
+import copy
+import dataclasses
+import inspect
+import zlib
+import csv
 from typing import Dict, Any, Optional
 from astrbot.api.star import StarTools
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class _延迟模块:
+    """首次访问属性时才导入的模块代理
+
+    只在本插件内部持有，不向 sys.modules 写入任何占位：真正导入时走普通的 import，
+    同一进程中的其他插件看到的始终是完整导入的模块（或尚未导入）。
+    """
+
+    def __init__(self, 模块名):
+        self._模块名 = 模块名
+        self._模块 = None
+
+    def __getattr__(self, 名称):
+        模块 = self._模块
+        if 模块 is None:
+            模块 = self._模块 = importlib.import_module(self._模块名)
+        return getattr(模块, 名称)
+
+
+# requests 的导入耗时占插件模块加载的大部分，推迟到第一次发起HTTP请求时
+requests = _延迟模块("requests")
+
+# 指标模块
+class _Histogram:
+    """固定分桶的延迟直方图（毫秒），分位数按所在分桶的上界估算"""
+    
+    分桶 = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+    
+    def __init__(self):
+        self.计数 = [0] * (len(self.分桶) + 1)
+        self.次数 = 0
+        self.总和 = 0.0
+        self.最大 = 0.0
+    
+    def 观测(self, 值):
+        self.计数[bisect.bisect_left(self.分桶, 值)] += 1
+        self.次数 += 1
+        self.总和 += 值
+        if 值 > self.最大:
+            self.最大 = 值
+    
+    def 分位数(self, 比例):
+        if not self.次数:
+            return 0.0
+        目标 = 比例 * self.次数
+        累计 = 0
+        for 序号, 数量 in enumerate(self.计数):
+            累计 += 数量
+            if 累计 >= 目标:
+                return min(self.分桶[序号], self.最大) if 序号 < len(self.分桶) else self.最大
+        return self.最大
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表
+    
+    计数器、仪表值和延迟直方图都以 (指标名, 标签) 为键保存在内存中，
+    可以导出为Prometheus文本格式写入文件，也可以格式化为聊天消息。
+    """
+    
+    def __init__(self):
+        self._计数器 = {}
+        self._仪表 = {}
+        self._直方图 = {}
+        self._锁 = threading.Lock()
+        self.启动时间 = time.time()
+    
+    @staticmethod
+    def _键(名称, 标签):
+        return 名称, tuple(sorted((k, str(v)) for k, v in 标签.items()))
+    
+    def 计数(self, 名称, 增量=1, **标签):
+        键 = self._键(名称, 标签)
+        with self._锁:
+            self._计数器[键] = self._计数器.get(键, 0) + 增量
+    
+    def 设置(self, 名称, 值, **标签):
+        with self._锁:
+            self._仪表[self._键(名称, 标签)] = 值
+    
+    def 观测(self, 名称, 毫秒, **标签):
+        键 = self._键(名称, 标签)
+        with self._锁:
+            直方图 = self._直方图.get(键)
+            if 直方图 is None:
+                直方图 = self._直方图[键] = _Histogram()
+            直方图.观测(毫秒)
+    
+    def 读取计数(self, 名称, **标签):
+        """按标签子集汇总计数器的值"""
+        条件 = set((k, str(v)) for k, v in 标签.items())
+        with self._锁:
+            return sum(值 for (指标名, 键标签), 值 in self._计数器.items() if 指标名 == 名称 and 条件 <= set(键标签))
+    
+    def 统计指令(self, 方法):
+        """装饰 @filter.command 处理函数，记录指令次数、异常次数和耗时"""
+        @functools.wraps(方法)
+        async def 包装(*args, **kwargs):
+            开始 = time.perf_counter()
+            状态 = "ok"
+            try:
+                async for 结果 in 方法(*args, **kwargs):
+                    yield 结果
+            except Exception:
+                状态 = "error"
+                raise
+            finally:
+                self.观测("command_latency_ms", (time.perf_counter() - 开始) * 1000, command=方法.__name__)
+                self.计数("commands_total", command=方法.__name__, status=状态)
+        return 包装
+    
+    @staticmethod
+    def _标签文本(标签):
+        if not 标签:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in 标签) + "}"
+    
+    def 导出文本(self) -> str:
+        """导出为Prometheus文本格式"""
+        with self._锁:
+            计数器 = sorted(self._计数器.items())
+            仪表 = sorted(self._仪表.items())
+            直方图 = sorted(self._直方图.items(), key=lambda 项: 项[0])
+        行列表 = []
+        for (名称, 标签), 值 in 计数器:
+            行列表.append(f"sce_{名称}{self._标签文本(标签)} {值}")
+        for (名称, 标签), 值 in 仪表:
+            行列表.append(f"sce_{名称}{self._标签文本(标签)} {值}")
+        for (名称, 标签), 数据 in 直方图:
+            累计 = 0
+            for 序号, 上界 in enumerate(数据.分桶 + ("+Inf",)):
+                累计 += 数据.计数[序号]
+                行列表.append(f"sce_{名称}_bucket{self._标签文本(标签 + (('le', str(上界)),))} {累计}")
+            行列表.append(f"sce_{名称}_sum{self._标签文本(标签)} {数据.总和:.3f}")
+            行列表.append(f"sce_{名称}_count{self._标签文本(标签)} {数据.次数}")
+        return "\n".join(行列表) + "\n"
+    
+    def 直方图摘要(self, 名称):
+        """返回 [(标签字典, 次数, p50, p99, 最大值)]"""
+        with self._锁:
+            项列表 = [(dict(标签), 数据.次数, 数据.分位数(0.5), 数据.分位数(0.99), 数据.最大)
+                    for (指标名, 标签), 数据 in self._直方图.items() if 指标名 == 名称]
+        return sorted(项列表, key=lambda 项: -项[1])
+    
+    def 重置仪表(self, 名称, 值列表):
+        """用 [(标签字典, 值)] 整体替换某个仪表的所有标签，已不存在的标签随之移除"""
+        新值 = {self._键(名称, 标签): 值 for 标签, 值 in 值列表}
+        with self._锁:
+            for 键 in [键 for 键 in self._仪表 if 键[0] == 名称]:
+                del self._仪表[键]
+            self._仪表.update(新值)
+    
+    def 仪表值(self, 名称):
+        """返回 [(标签字典, 值)]"""
+        with self._锁:
+            return [(dict(标签), 值) for (指标名, 标签), 值 in self._仪表.items() if 指标名 == 名称]
+    
+    def 写入文件(self, 文件路径):
+        """原子地写入Prometheus文本文件，供node_exporter等采集"""
+        临时路径 = 文件路径 + ".tmp"
+        with open(临时路径, "w", encoding="utf-8") as f:
+            f.write(self.导出文本())
+        os.replace(临时路径, 文件路径)
+
+
+# 全局指标注册表
+指标 = MetricsRegistry()
+
+# 链路追踪模块
+class _Span:
+    __slots__ = ("名称", "属性", "开始", "耗时", "子节点", "根")
+
+    def __init__(self, 名称, 属性, 根=None):
+        self.名称 = 名称
+        self.属性 = 属性
+        self.开始 = time.perf_counter()
+        self.耗时 = None
+        self.子节点 = []
+        self.根 = 根 or self
+
+
+# 当前协程所处的跨度，只在指令处理期间存在
+_当前跨度 = contextvars.ContextVar("当前跨度", default=None)
+
+
+class SpanTracer:
+    """
+    指令级的轻量链路追踪
+    
+    每个指令处理函数是一棵跨度树的根，JSON读写、邮件接口、token刷新等子步骤作为子跨度挂在当前跨度下。
+    指令耗时超过慢操作阈值时把整棵树写入慢操作日志；不在指令中（没有根跨度）时子跨度直接跳过，几乎没有开销。
+    """
+    
+    def __init__(self, 慢操作阈值=3.0, 日志文件=None, 节点上限=500, 单文件上限=5 * 1024 * 1024):
+        """
+        Args:
+            慢操作阈值 (float): 指令耗时超过多少秒记为慢操作
+            日志文件 (str): 慢操作日志路径，为None时只输出到插件日志
+            节点上限 (int): 单个指令最多记录的跨度数，防止循环中的子步骤占用过多内存
+            单文件上限 (int): 慢操作日志超过该大小后轮转为 .1
+        """
+        self.慢操作阈值 = 慢操作阈值
+        self.日志文件 = 日志文件
+        self.节点上限 = 节点上限
+        self.单文件上限 = 单文件上限
+        self._写锁 = threading.Lock()
+    
+    @contextlib.contextmanager
+    def 跨度(self, 名称, **属性):
+        """记录一个子步骤，不在指令处理中时什么也不做"""
+        父 = _当前跨度.get()
+        if 父 is None or 父.根.耗时 is not None or 父.根.属性.get("_节点数", 0) >= self.节点上限:
+            yield
+            return
+        父.根.属性["_节点数"] = 父.根.属性.get("_节点数", 0) + 1
+        节点 = _Span(名称, 属性, 父.根)
+        父.子节点.append(节点)
+        令牌 = _当前跨度.set(节点)
+        try:
+            yield
+        finally:
+            节点.耗时 = time.perf_counter() - 节点.开始
+            _当前跨度.reset(令牌)
+    
+    def 追踪(self, 名称, 记录参数=None):
+        """
+        装饰同步或异步函数，把每次调用记录为子跨度
+        
+        Args:
+            名称 (str): 跨度名称
+            记录参数 (int): 把第几个位置参数记录为跨度属性，None表示不记录
+        """
+        def 装饰器(函数):
+            def 属性(args):
+                return {"参数": args[记录参数]} if 记录参数 is not None and len(args) > 记录参数 else {}
+            
+            if inspect.iscoroutinefunction(函数):
+                @functools.wraps(函数)
+                async def 异步包装(*args, **kwargs):
+                    with self.跨度(名称, **属性(args)):
+                        return await 函数(*args, **kwargs)
+                return 异步包装
+            
+            @functools.wraps(函数)
+            def 同步包装(*args, **kwargs):
+                with self.跨度(名称, **属性(args)):
+                    return 函数(*args, **kwargs)
+            return 同步包装
+        return 装饰器
+    
+    def 追踪指令(self, 方法):
+        """装饰 @filter.command 处理函数，作为跨度树的根，结束时检查是否为慢操作"""
+        @functools.wraps(方法)
+        async def 包装(*args, **kwargs):
+            事件 = args[1] if len(args) > 1 else None
+            根 = _Span(方法.__name__, {"消息": getattr(事件, "message_str", ""), "用户": 事件.get_sender_id() if 事件 else None})
+            令牌 = _当前跨度.set(根)
+            try:
+                async for 结果 in 方法(*args, **kwargs):
+                    yield 结果
+            finally:
+                根.耗时 = time.perf_counter() - 根.开始
+                try:
+                    _当前跨度.reset(令牌)
+                except ValueError:
+                    # 生成器在其他上下文中被关闭
+                    pass
+                if 根.耗时 >= self.慢操作阈值:
+                    self._输出慢操作(根)
+        return 包装
+    
+    def 格式化(self, 根) -> str:
+        """把跨度树格式化为缩进文本，子跨度按开始时间排列，显示相对根的起始偏移和耗时"""
+        行列表 = []
+        
+        def 遍历(节点, 深度):
+            属性 = " ".join(f"{k}={str(v)[:80]}" for k, v in 节点.属性.items() if not k.startswith("_"))
+            耗时 = f"{节点.耗时 * 1000:.1f}ms" if 节点.耗时 is not None else "未结束"
+            行列表.append(f"{'  ' * 深度}+{(节点.开始 - 根.开始) * 1000:.0f}ms {节点.名称} {耗时} {属性}".rstrip())
+            for 子节点 in 节点.子节点:
+                遍历(子节点, 深度 + 1)
+        
+        遍历(根, 0)
+        if 根.属性.get("_节点数", 0) >= self.节点上限:
+            行列表.append(f"（跨度数达到上限{self.节点上限}，之后的子步骤未记录）")
+        return "\n".join(行列表)
+    
+    def _输出慢操作(self, 根):
+        文本 = self.格式化(根)
+        logger.warning(f"慢操作: {根.名称} 耗时 {根.耗时:.2f}s\n{文本}")
+        if not self.日志文件:
+            return
+        try:
+            with self._写锁:
+                os.makedirs(os.path.dirname(self.日志文件), exist_ok=True)
+                if os.path.exists(self.日志文件) and os.path.getsize(self.日志文件) > self.单文件上限:
+                    os.replace(self.日志文件, self.日志文件 + ".1")
+                with open(self.日志文件, "a", encoding="utf-8") as f:
+                    f.write(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {根.名称} {根.耗时:.2f}s\n{文本}\n\n")
+        except OSError as e:
+            logger.error(f"写入慢操作日志失败: {e}")
+
+
+# 全局链路追踪器
+追踪器 = SpanTracer()
+
 # JSON处理模块
+class Serializer:
+    """
+    数据文件的编码与解码
+
+    安装了 orjson 时用 orjson，否则用标准库 json，两者输出的JSON相同。支持三种格式：
+        可读：缩进2格，便于人工查看和修改
+        紧凑：不带缩进和空格的JSON
+        二进制：zlib压缩的紧凑JSON，带文件头，体积最小
+    读取时按文件头自动识别格式，切换格式不影响已有的文件。
+    """
+
+    可读 = "可读"
+    紧凑 = "紧凑"
+    二进制 = "二进制"
+    文件头 = b"SCEZ\x01"
+    # zlib压缩级别，1已能把重复键名压掉大部分，再高收益很小而编码明显变慢
+    压缩级别 = 1
+    # 可关闭以对比标准库的性能
+    使用orjson = orjson is not None
+
+    @staticmethod
+    def _编码JSON(数据, 缩进: bool) -> bytes:
+        if Serializer.使用orjson:
+            try:
+                return orjson.dumps(数据, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if 缩进 else 0))
+            except TypeError:
+                # orjson不支持的类型（如超过64位的整数）交给标准库处理
+                pass
+        if 缩进:
+            return json.dumps(数据, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(数据, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def 编码(数据, 格式: str = "可读") -> bytes:
+        if 格式 == Serializer.二进制:
+            return Serializer.文件头 + zlib.compress(Serializer._编码JSON(数据, False), Serializer.压缩级别)
+        return Serializer._编码JSON(数据, 格式 == Serializer.可读)
+
+    @staticmethod
+    def 解码(内容: bytes):
+        """解码任意格式的内容，内容为空时返回None"""
+        if 内容.startswith(Serializer.文件头):
+            内容 = zlib.decompress(内容[len(Serializer.文件头):])
+        内容 = 内容.strip()
+        if not 内容:
+            return None
+        if Serializer.使用orjson:
+            return orjson.loads(内容)
+        return json.loads(内容)
+
+    @staticmethod
+    def 编码行(数据) -> str:
+        """编码为单行JSON文本，用于追加写入的日志"""
+        return Serializer._编码JSON(数据, False).decode("utf-8") + "\n"
+
+
 class JsonHandler:
+    # 未指定格式时写入的格式，数据文件默认保持可读
+    默认格式 = Serializer.可读
+
     @staticmethod
     def 验证文件名(文件名: str) -> bool:
         """验证文件名是否合法"""
@@ -59,6 +453,15 @@ class JsonHandler:
         """安全地从字典中获取值"""
         return 数据字典.get(键, 默认值)
     
+    @staticmethod
+    def 指标标签(文件名: str) -> str:
+        """数据文件在指标中的file标签：临时文件计入替换的目标文件，
+        分片文件（名称.分片数-序号.json）合并为逻辑存储（名称.json），标签数量不随写入和分片调整增长"""
+        名称 = os.path.basename(文件名)
+        if 名称.endswith(".tmp"):
+            名称 = 名称[:-len(".tmp")]
+        return re.sub(r"\.\d+-\d+\.json$", ".json", 名称)
+    
     @staticmethod
     def 获取文件路径(文件名: str, 确保目录存在: bool = False) -> str:
         """获取文件路径，将数据存储在安全的数据目录中
@@ -91,12 +494,14 @@ class JsonHandler:
             return file_path
     
     @staticmethod
-    def 写入Json字典(文件名: str, 数据: dict) -> bool:
+    @追踪器.追踪("写入Json", 记录参数=0)
+    def 写入Json字典(文件名: str, 数据: dict, 格式: str = None) -> bool:
         """将字典数据写入JSON文件，使用UserData目录下的文件名作为模板
         
         Args:
             文件名: JSON文件名（使用UserData目录下的文件名作为模板）
             数据: 要写入的数据字典
+            格式: Serializer的格式，默认为JsonHandler.默认格式
             
         Returns:
             bool: 是否写入成功
@@ -112,16 +517,23 @@ class JsonHandler:
                 logger.info(f"创建目录: {目录}")
             
             # 写入数据
-            with open(文件路径, 'w', encoding='utf-8') as f:
-                json.dump(数据, f, ensure_ascii=False, indent=2)
+            开始 = time.perf_counter()
+            内容 = Serializer.编码(数据, 格式 or JsonHandler.默认格式)
+            with open(文件路径, 'wb') as f:
+                f.write(内容)
+            # 文件大小在查看状态时按逻辑存储汇总（见 MyPlugin._更新状态指标），这里只记录写入
+            指标.观测("json_write_latency_ms", (time.perf_counter() - 开始) * 1000, file=JsonHandler.指标标签(文件名))
+            指标.计数("json_writes_total", file=JsonHandler.指标标签(文件名))
             
             logger.info(f"数据已成功写入: {文件路径}")
             return True
         except Exception as e:
+            指标.计数("json_write_errors_total", file=JsonHandler.指标标签(文件名))
             logger.error(f"写入JSON文件失败: {文件名}, 错误: {e}")
             return False
     
     @staticmethod
+    @追踪器.追踪("读取Json", 记录参数=0)
     def 读取Json字典(文件名: str) -> dict:
         """读取JSON文件为字符串字典，使用UserData目录下的文件名作为模板"""
         try:
@@ -136,21 +548,43 @@ class JsonHandler:
                 return {}
             
             # 读取文件内容
-            with open(文件路径, 'r', encoding='utf-8') as f:
-                json内容 = f.read().strip()
-                if not json内容:
-                    return {}
-                字典 = json.loads(json内容)
-                
-                if not isinstance(字典, dict):
-                    logger.warning(f"JSON文件内容格式不正确: {文件路径}")
-                    return {}
-                
-                return 字典
+            指标.计数("json_reads_total", file=JsonHandler.指标标签(文件名))
+            with open(文件路径, 'rb') as f:
+                字典 = Serializer.解码(f.read())
+            if 字典 is None:
+                return {}
+            
+            if not isinstance(字典, dict):
+                logger.warning(f"JSON文件内容格式不正确: {文件路径}")
+                return {}
+            
+            return 字典
         except Exception as ex:
             logger.error(f"错误: 读取JSON字典时发生错误 - {ex}")
             return {}
     
+    @staticmethod
+    def 追加Json行(文件名: str, 数据: dict) -> bool:
+        """把一条记录作为单行JSON追加到文件末尾，不读取已有内容"""
+        try:
+            文件路径 = JsonHandler.获取文件路径(文件名, True)
+            with open(文件路径, 'a', encoding='utf-8') as f:
+                f.write(Serializer.编码行(数据))
+            指标.计数("json_writes_total", file=JsonHandler.指标标签(文件名))
+            return True
+        except Exception as e:
+            指标.计数("json_write_errors_total", file=JsonHandler.指标标签(文件名))
+            logger.error(f"追加JSON记录失败: {文件名}, 错误: {e}")
+            return False
+    
+    @staticmethod
+    def 导出可读副本(文件名: str) -> str:
+        """把任意格式的数据文件另存为缩进的JSON（文件名.可读.json），返回副本的文件名"""
+        副本文件名 = os.path.splitext(文件名)[0] + ".可读.json"
+        if not JsonHandler.写入Json字典(副本文件名, JsonHandler.读取Json字典(文件名), Serializer.可读):
+            return ""
+        return 副本文件名
+    
     @staticmethod
     def 获取值(字典: dict, 键: str, 默认值: str = None) -> str:
         """根据键获取值，如果键不存在返回默认值"""
@@ -181,11 +615,1099 @@ class JsonHandler:
 # 创建别名方便使用
 Json = JsonHandler
 
+# 玩家数据模块
+@dataclasses.dataclass(slots=True)
+class PlayerRecord:
+    """单个玩家的全部数据，日期统一保存为 date.toordinal() 的整数"""
+    绑定ID: str = ""
+    连续签到: int = 0
+    上次签到日: int = 0
+    活跃度: int = 0
+    # 游戏名称 -> 最近一次签到的日期序号，等于今天即表示今天已签到，跨天无需重置
+    签到记录: dict = dataclasses.field(default_factory=dict)
+
+    def 今日已签到(self, 游戏名称, 今天: int) -> bool:
+        return self.签到记录.get(游戏名称) == 今天
+
+    def 转字典(self) -> dict:
+        # 签到记录复制一份，后台压缩序列化时事件循环仍可能修改原字典
+        return {"绑定ID": self.绑定ID, "连续签到": self.连续签到, "上次签到日": self.上次签到日,
+                "活跃度": self.活跃度, "签到记录": dict(self.签到记录)}
+
+    @classmethod
+    def 从字典(cls, 数据: dict) -> "PlayerRecord":
+        return cls(
+            绑定ID=str(数据.get("绑定ID") or ""),
+            连续签到=int(数据.get("连续签到") or 0),
+            上次签到日=int(数据.get("上次签到日") or 0),
+            活跃度=int(数据.get("活跃度") or 0),
+            签到记录={str(游戏): int(日) for 游戏, 日 in (数据.get("签到记录") or {}).items()},
+        )
+
+
+class PlayerStore:
+    """
+    玩家数据存储
+
+    绑定ID、连续签到、上次签到日期、活跃度和各游戏的签到记录合并为每个玩家一条 PlayerRecord，
+    一次查找即可拿到全部数据。首次加载时如果新文件不存在，从旧版的四个文件迁移。
+
+    快照按用户ID的crc32分成N个分片文件（玩家数据.N-i.json，N为1时就是玩家数据.json），
+    分片数记录在清单文件 玩家数据.分片.json 中。保存时只重写有变更的分片；
+    调整分片数 按新分片数写出全部分片后再切换清单，切换前中断不影响旧分片。
+
+    签到、活跃度等高频变更不重写整个文件，而是由 记录变更 向日志文件追加一行该玩家变化后的字段值；
+    加载时先读快照再按顺序重放日志。压缩 把内存中的全部记录写成新快照并清空日志，由后台任务定期调用。
+    日志记录的是字段的新值而不是增量，重复重放同一行结果不变，压缩中途失败也不会重复累加。
+    """
+
+    旧版绑定文件 = "玩家绑定id数据存储.json"
+    旧版签到文件 = "玩家今天是否签到过.json"
+    旧版连续签到文件 = "玩家连续签到数据.json"
+    旧版活跃度文件 = "玩家活跃度数据.json"
+    # 快照数据量大、主要由程序读写，默认不缩进；设为 Serializer.二进制 体积更小，人工查看时用 导出可读副本
+    快照格式 = Serializer.紧凑
+
+    def __init__(self, 文件名: str = "玩家数据.json", 初始分片数: int = 1):
+        self.文件名 = 文件名
+        self.玩家 = None
+        # 还没有分片清单时（新安装或旧版单文件）加载后拆分成的分片数
+        self.初始分片数 = 初始分片数
+        self._文件前缀 = os.path.splitext(文件名)[0]
+        self.清单文件名 = self._文件前缀 + ".分片.json"
+        self.分片数 = 1
+        # 清单文件中记录的分片数，与分片数不同说明调整尚未完成
+        self._磁盘分片数 = 1
+        # 每个分片包含的用户ID，以及自上次保存以来有变更的分片
+        self._分片成员 = [set()]
+        self._脏分片 = set()
+        # 反向索引：游戏ID -> 绑定了它的用户ID集合，以及被多名用户绑定的游戏ID
+        self._按游戏ID = {}
+        self._重复游戏ID = set()
+        # 保护记录上的比较并设置操作，后台线程（如数据清理）也可能访问记录
+        self._记录锁 = threading.Lock()
+        # 启动后的后台预加载线程和事件循环可能同时触发加载，只加载一次
+        self._加载锁 = threading.Lock()
+        self._已加载 = False
+        # 变更日志：追加写入的文件句柄和自上次压缩以来的条数
+        self.日志文件名 = os.path.splitext(文件名)[0] + ".journal"
+        self._日志 = None
+        self._日志锁 = threading.Lock()
+        self._压缩锁 = threading.Lock()
+        self.日志条数 = 0
+
+    def _确保已加载(self):
+        if self._已加载:
+            return
+        with self._加载锁:
+            if self._已加载:
+                return
+            需要保存 = False
+            有清单 = os.path.exists(JsonHandler.获取文件路径(self.清单文件名))
+            分片数 = max(1, int(JsonHandler.读取Json字典(self.清单文件名).get("分片数") or 1)) if 有清单 else 1
+            玩家 = {}
+            if 分片数 == 1 and not os.path.exists(JsonHandler.获取文件路径(self.文件名)):
+                玩家 = self._迁移旧版数据()
+                需要保存 = True
+            else:
+                for 序号 in range(分片数):
+                    for 用户ID, 数据 in JsonHandler.读取Json字典(self._分片文件名(分片数, 序号)).items():
+                        try:
+                            玩家[str(用户ID)] = PlayerRecord.从字典(数据)
+                        except (TypeError, ValueError, AttributeError) as e:
+                            logger.warning(f"玩家数据格式错误，已跳过: {用户ID}, {e}")
+            # 上次压缩中断时留下的轮转日志在前，当前日志在后
+            重放条数 = self._重放日志(玩家, self.日志文件名 + ".1") + self._重放日志(玩家, self.日志文件名)
+            self.玩家 = 玩家
+            self.分片数 = self._磁盘分片数 = 分片数
+            self._分片成员 = self._计算分片成员(分片数)
+            for 用户ID, 记录 in 玩家.items():
+                if 记录.绑定ID:
+                    self._加入反向索引(用户ID, 记录.绑定ID)
+            self.日志条数 = 重放条数
+            self._已加载 = True
+            logger.info(f"玩家数据已加载，共{len(self.玩家)}名玩家，{分片数}个分片，重放日志{重放条数}条")
+            if 有清单:
+                self._清理旧分片()
+            if 需要保存:
+                self._脏分片 = set(range(分片数))
+                self.保存()
+            if not 有清单 and self.初始分片数 != 分片数:
+                self.调整分片数(self.初始分片数)
+
+    @staticmethod
+    def 分片号(用户ID, 分片数: int) -> int:
+        # crc32在不同进程、不同Python版本之间结果一致，内置hash对字符串是随机化的
+        return zlib.crc32(str(用户ID).encode("utf-8")) % 分片数
+
+    def _分片文件名(self, 分片数: int, 序号: int) -> str:
+        if 分片数 == 1:
+            return self.文件名
+        return f"{self._文件前缀}.{分片数}-{序号}.json"
+
+    def _计算分片成员(self, 分片数: int) -> list:
+        成员 = [set() for _ in range(分片数)]
+        for 用户ID in list(self.玩家):
+            成员[self.分片号(用户ID, 分片数)].add(用户ID)
+        return 成员
+
+    def _清理旧分片(self):
+        """删除不属于当前分片数的分片文件"""
+        模式 = re.compile(rf"^{re.escape(self._文件前缀)}\.(\d+)-\d+\.json$")
+        目录 = os.path.dirname(JsonHandler.获取文件路径(self.文件名))
+        try:
+            for 名称 in os.listdir(目录):
+                匹配 = 模式.match(名称)
+                if (匹配 and int(匹配.group(1)) != self._磁盘分片数) or (名称 == self.文件名 and self._磁盘分片数 != 1):
+                    os.remove(os.path.join(目录, 名称))
+                    logger.info(f"已删除旧的玩家数据分片: {名称}")
+        except OSError as e:
+            logger.warning(f"清理旧的玩家数据分片失败: {e}")
+
+    @staticmethod
+    def _重放日志(玩家: dict, 日志文件名: str) -> int:
+        """把日志中的字段变更按顺序应用到玩家字典，返回应用的条数"""
+        路径 = JsonHandler.获取文件路径(日志文件名)
+        if not os.path.exists(路径):
+            return 0
+        条数 = 0
+        with open(路径, "r", encoding="utf-8") as f:
+            for 行号, 行 in enumerate(f, 1):
+                if not 行.strip():
+                    continue
+                try:
+                    变更 = Serializer.解码(行.encode("utf-8"))
+                    if "批量绑定" in 变更:
+                        for 用户ID, 游戏ID in 变更["批量绑定"].items():
+                            玩家.setdefault(str(用户ID), PlayerRecord()).绑定ID = str(游戏ID)
+                    elif "删除" in 变更:
+                        for 用户ID in 变更["删除"]:
+                            玩家.pop(str(用户ID), None)
+                    else:
+                        用户ID = str(变更.pop("用户"))
+                        记录 = 玩家.get(用户ID)
+                        if 记录 is None:
+                            记录 = 玩家[用户ID] = PlayerRecord()
+                        PlayerStore._应用变更(记录, 变更)
+                    条数 += 1
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    # 进程在追加过程中退出时最后一行可能不完整
+                    logger.warning(f"跳过无法解析的玩家数据日志: {日志文件名} 第{行号}行, {e}")
+        return 条数
+
+    @staticmethod
+    def _应用变更(记录: PlayerRecord, 变更: dict):
+        for 字段, 值 in 变更.items():
+            if 字段 == "签到记录":
+                # 签到记录按游戏合并，值为None表示删除该游戏的记录
+                for 游戏名称, 日 in 值.items():
+                    if 日 is None:
+                        记录.签到记录.pop(游戏名称, None)
+                    else:
+                        记录.签到记录[游戏名称] = int(日)
+            elif 字段 == "绑定ID":
+                记录.绑定ID = str(值)
+            elif 字段 in ("连续签到", "上次签到日", "活跃度"):
+                setattr(记录, 字段, int(值))
+
+    def 预加载(self):
+        """提前加载玩家数据，供启动后的后台线程调用"""
+        self._确保已加载()
+
+    def _迁移旧版数据(self) -> dict:
+        """从旧版四个文件合并出玩家记录，旧文件保留不删除"""
+        玩家 = {}
+
+        def 记录(用户ID):
+            用户ID = str(用户ID)
+            if 用户ID not in 玩家:
+                玩家[用户ID] = PlayerRecord()
+            return 玩家[用户ID]
+
+        def 读取旧文件(文件名):
+            if not os.path.exists(JsonHandler.获取文件路径(文件名)):
+                return {}
+            return JsonHandler.读取Json字典(文件名)
+
+        def 解析整数(值):
+            try:
+                return int(值)
+            except (TypeError, ValueError):
+                return 0
+
+        for 用户ID, 游戏ID in 读取旧文件(self.旧版绑定文件).items():
+            if str(游戏ID).strip():
+                记录(用户ID).绑定ID = str(游戏ID).strip()
+
+        for 用户ID, 值 in 读取旧文件(self.旧版活跃度文件).items():
+            记录(用户ID).活跃度 = 解析整数(值)
+
+        for 键, 值 in 读取旧文件(self.旧版连续签到文件).items():
+            if 键.endswith("_连续签到"):
+                记录(键[:-len("_连续签到")]).连续签到 = 解析整数(值)
+            elif 键.endswith("_上次签到日期"):
+                try:
+                    记录(键[:-len("_上次签到日期")]).上次签到日 = datetime.date.fromisoformat(值).toordinal()
+                except (TypeError, ValueError):
+                    pass
+
+        # 旧版签到标记只对"数据保质期"记录的当天有效，过期的标记直接丢弃
+        今天 = datetime.date.today()
+        if str(JsonHandler.读取Json字典("数据保质期.json").get("日期", "")) == str(今天.day):
+            for 键, 值 in 读取旧文件(self.旧版签到文件).items():
+                if 值 == "true" and "_" in 键:
+                    用户ID, 游戏名称 = 键.split("_", 1)
+                    记录(用户ID).签到记录[游戏名称] = 今天.toordinal()
+
+        if 玩家:
+            logger.info(f"已从旧版数据文件迁移{len(玩家)}名玩家到{self.文件名}")
+        return 玩家
+
+    def 记录变更(self, 用户ID, **字段) -> bool:
+        """
+        把一名玩家已在内存中修改的字段追加到日志，写入成本与玩家总数无关
+
+        签到记录传入 {游戏名称: 日期序号}，与已有记录合并。返回是否写入成功。
+        """
+        return self._追加日志({"用户": str(用户ID), **字段}, (用户ID,))
+
+    def _追加日志(self, 变更: dict, 涉及用户) -> bool:
+        """把一条变更作为一行追加到日志，并标记涉及用户所在的分片"""
+        行 = Serializer.编码行(变更)
+        try:
+            with self._日志锁:
+                if self._日志 is None:
+                    self._日志 = open(JsonHandler.获取文件路径(self.日志文件名, True), "a", encoding="utf-8")
+                self._日志.write(行)
+                self._日志.flush()
+                self.日志条数 += 1
+                self._脏分片.update(self.分片号(用户ID, self.分片数) for 用户ID in 涉及用户)
+        except OSError as e:
+            指标.计数("json_write_errors_total", file=self.日志文件名)
+            logger.error(f"追加玩家数据日志失败: {e}")
+            return False
+        指标.计数("journal_appends_total", file=self.日志文件名)
+        return True
+
+    def 压缩(self) -> bool:
+        """
+        把有变更的分片写成新快照并清空日志，可在后台线程中调用
+
+        先把当前日志轮转为 .1 再写快照，期间的新变更写入新日志；快照写入成功后才删除轮转日志，
+        写入失败时轮转日志保留，下次加载时照常重放。
+        """
+        return self._写入快照()
+
+    def 调整分片数(self, 新分片数: int) -> bool:
+        """在线调整分片数：按新分片数写出全部分片并切换清单，之后删除旧分片，可在后台线程中调用"""
+        return self._写入快照(max(1, int(新分片数)))
+
+    def _写入快照(self, 新分片数: int = None) -> bool:
+        self._确保已加载()
+        with self._压缩锁:
+            开始 = time.perf_counter()
+            日志路径 = JsonHandler.获取文件路径(self.日志文件名, True)
+            轮转路径 = 日志路径 + ".1"
+            with self._日志锁:
+                if self._日志 is not None:
+                    self._日志.close()
+                    self._日志 = None
+                if os.path.exists(日志路径):
+                    if os.path.exists(轮转路径):
+                        # 上次压缩失败留下的轮转日志还在，接在它后面
+                        with open(日志路径, "r", encoding="utf-8") as 源, open(轮转路径, "a", encoding="utf-8") as 目标:
+                            目标.write(源.read())
+                        os.remove(日志路径)
+                    else:
+                        os.replace(日志路径, 轮转路径)
+                self.日志条数 = 0
+                if 新分片数 is not None and 新分片数 != self.分片数:
+                    # 在日志锁内切换，之后新建的玩家和新的变更都按新分片数归属
+                    self.分片数 = 新分片数
+                    self._分片成员 = self._计算分片成员(新分片数)
+                    self._脏分片 = set(range(新分片数))
+                分片数, 成员 = self.分片数, self._分片成员
+                待写分片, self._脏分片 = self._脏分片, set()
+            
+            for 序号 in sorted(待写分片):
+                # 复制成员列表是原子操作，遍历期间事件循环新增的玩家不影响本次快照，漏掉的变更在新日志中
+                快照 = {}
+                for 用户ID in list(成员[序号]):
+                    记录 = self.玩家.get(用户ID)
+                    if 记录 is not None:
+                        快照[用户ID] = 记录.转字典()
+                if not self._替换文件(self._分片文件名(分片数, 序号), 快照, self.快照格式):
+                    with self._日志锁:
+                        self._脏分片 |= 待写分片
+                    return False
+            
+            if self._磁盘分片数 != 分片数:
+                if not self._替换文件(self.清单文件名, {"分片数": 分片数}, Serializer.可读):
+                    return False
+                logger.info(f"玩家数据分片数已从{self._磁盘分片数}调整为{分片数}")
+                self._磁盘分片数 = 分片数
+                self._清理旧分片()
+            if os.path.exists(轮转路径):
+                os.remove(轮转路径)
+            指标.观测("journal_compaction_ms", (time.perf_counter() - 开始) * 1000, file=self.文件名)
+            指标.计数("player_shard_writes_total", len(待写分片))
+            return True
+
+    @staticmethod
+    def _替换文件(文件名: str, 数据: dict, 格式: str) -> bool:
+        """先写临时文件再替换，写到一半中断不会损坏原文件"""
+        临时文件名 = 文件名 + ".tmp"
+        if not JsonHandler.写入Json字典(临时文件名, 数据, 格式):
+            return False
+        os.replace(JsonHandler.获取文件路径(临时文件名), JsonHandler.获取文件路径(文件名))
+        return True
+
+    def 快照大小(self) -> int:
+        """当前分片文件的总字节数"""
+        总计 = 0
+        for 序号 in range(self._磁盘分片数):
+            try:
+                总计 += os.path.getsize(JsonHandler.获取文件路径(self._分片文件名(self._磁盘分片数, 序号)))
+            except OSError:
+                pass
+        return 总计
+
+    def 清理签到记录(self, 有效游戏, 保留天数: int, 今天: int = None) -> tuple:
+        """
+        删除签到记录中已不在 有效游戏 里的游戏，以及早于 保留天数 的记录，可在后台线程中调用
+
+        签到只判断记录是否等于今天，旧日期的记录已经没有用处。返回 (未知游戏记录数, 过期记录数)，
+        删除结果在下次压缩时写入。
+        """
+        self._确保已加载()
+        今天 = 今天 or datetime.date.today().toordinal()
+        有效游戏 = set(有效游戏)
+        未知游戏记录 = 过期记录 = 0
+        for 用户ID, 记录 in list(self.玩家.items()):
+            with self._记录锁:
+                待删除 = [游戏名称 for 游戏名称, 日 in 记录.签到记录.items() if 游戏名称 not in 有效游戏 or 今天 - 日 > 保留天数]
+                for 游戏名称 in 待删除:
+                    if 游戏名称 in 有效游戏:
+                        过期记录 += 1
+                    else:
+                        未知游戏记录 += 1
+                    del 记录.签到记录[游戏名称]
+            if 待删除:
+                with self._日志锁:
+                    self._脏分片.add(self.分片号(用户ID, self.分片数))
+        return 未知游戏记录, 过期记录
+
+    @staticmethod
+    def _可以删除(记录: PlayerRecord, 不活跃天数: int, 今天: int) -> bool:
+        """未绑定ID，且没有活跃度或超过 不活跃天数 未签到的玩家"""
+        if 记录.绑定ID or 记录.签到记录:
+            return False
+        return 记录.活跃度 == 0 or 今天 - 记录.上次签到日 > 不活跃天数
+
+    def 查找可删除玩家(self, 不活跃天数: int, 今天: int = None) -> list:
+        """只读扫描，可在后台线程中调用；实际删除用 删除玩家"""
+        self._确保已加载()
+        今天 = 今天 or datetime.date.today().toordinal()
+        return [用户ID for 用户ID, 记录 in list(self.玩家.items()) if self._可以删除(记录, 不活跃天数, 今天)]
+
+    def 删除玩家(self, 用户ID列表, 不活跃天数: int, 今天: int = None) -> dict:
+        """
+        删除仍满足条件的玩家，返回 {用户ID: 删除前的活跃度}
+
+        需要在事件循环中调用：扫描之后玩家可能刚刚绑定了ID，删除前在这里重新判断，
+        与指令处理不会交错执行。删除的用户ID先作为一行写入日志再修改内存，
+        压缩失败或进程在压缩前退出时，重放日志同样会删除这些玩家；日志写入失败时不删除任何玩家。
+        """
+        今天 = 今天 or datetime.date.today().toordinal()
+        已删除 = {}
+        for 用户ID in 用户ID列表:
+            记录 = self.玩家.get(用户ID)
+            if 记录 is not None and self._可以删除(记录, 不活跃天数, 今天):
+                已删除[用户ID] = 记录.活跃度
+        if not 已删除 or not self._追加日志({"删除": list(已删除)}, 已删除):
+            return {}
+        with self._日志锁:
+            for 用户ID in 已删除:
+                del self.玩家[用户ID]
+                self._分片成员[self.分片号(用户ID, self.分片数)].discard(用户ID)
+        return 已删除
+
+    def 导出可读副本(self) -> str:
+        """把全部玩家数据另存为缩进的JSON，返回文件名"""
+        self._确保已加载()
+        副本文件名 = self._文件前缀 + ".可读.json"
+        快照 = {用户ID: 记录.转字典() for 用户ID, 记录 in list(self.玩家.items())}
+        if not JsonHandler.写入Json字典(副本文件名, 快照, Serializer.可读):
+            return ""
+        return 副本文件名
+
+    def 保存(self) -> bool:
+        """立即写入有变更的分片"""
+        return self.压缩()
+
+    def 关闭(self):
+        """写入最终快照并关闭日志文件"""
+        if not self._已加载:
+            return
+        self.压缩()
+        with self._日志锁:
+            if self._日志 is not None:
+                self._日志.close()
+                self._日志 = None
+
+    def 获取(self, 用户ID):
+        """返回玩家记录，不存在时返回None"""
+        self._确保已加载()
+        return self.玩家.get(str(用户ID))
+
+    def 获取或创建(self, 用户ID) -> PlayerRecord:
+        self._确保已加载()
+        用户ID = str(用户ID)
+        记录 = self.玩家.get(用户ID)
+        if 记录 is None:
+            with self._日志锁:
+                记录 = self.玩家[用户ID] = PlayerRecord()
+                序号 = self.分片号(用户ID, self.分片数)
+                self._分片成员[序号].add(用户ID)
+                self._脏分片.add(序号)
+        return 记录
+
+    def 认领签到(self, 用户ID, 游戏名称, 今天: int) -> bool:
+        """
+        原子地认领 (用户, 游戏, 日期) 的签到：今天尚未签到时写入签到记录并返回True，否则返回False
+
+        只有绑定了ID的玩家可以认领；认领只修改内存中的记录，由调用方负责保存。
+        """
+        记录 = self.获取(用户ID)
+        if 记录 is None or not 记录.绑定ID:
+            return False
+        with self._记录锁:
+            if 记录.签到记录.get(游戏名称) == 今天:
+                return False
+            记录.签到记录[游戏名称] = 今天
+            return True
+
+    def 撤销签到(self, 用户ID, 游戏名称, 今天: int):
+        """认领后未能完成签到时撤销，只撤销仍为该日期的记录"""
+        记录 = self.获取(用户ID)
+        if 记录 is None:
+            return
+        with self._记录锁:
+            if 记录.签到记录.get(游戏名称) == 今天:
+                del 记录.签到记录[游戏名称]
+
+    def 获取绑定(self, 用户ID) -> str:
+        记录 = self.获取(用户ID)
+        return 记录.绑定ID if 记录 else ""
+
+    def 设置绑定(self, 绑定映射: dict) -> bool:
+        """
+        设置 {用户ID: 游戏ID}，返回是否写入成功
+
+        游戏ID统一按 EmailService.规范化用户ID 规范后保存，提取不到数字时保留去掉空白后的原值。
+        多个绑定作为一行写入日志后再修改内存，整批要么全部生效要么全部不生效：
+        日志写入失败时内存不变，进程在写入途中退出时不完整的行在重放时整行跳过。
+        """
+        绑定映射 = {str(用户ID): EmailService.规范化用户ID(游戏ID) or str(游戏ID).strip() for 用户ID, 游戏ID in 绑定映射.items()}
+        if len(绑定映射) == 1:
+            用户ID, 游戏ID = next(iter(绑定映射.items()))
+            self._确保已加载()
+            if not self.记录变更(用户ID, 绑定ID=游戏ID):
+                return False
+            self._修改绑定(用户ID, 游戏ID)
+            return True
+        self._确保已加载()
+        if 绑定映射 and not self._追加日志({"批量绑定": 绑定映射}, 绑定映射):
+            return False
+        for 用户ID, 游戏ID in 绑定映射.items():
+            self._修改绑定(用户ID, 游戏ID)
+        return True
+
+    def _修改绑定(self, 用户ID: str, 游戏ID: str):
+        记录 = self.获取或创建(用户ID)
+        if 记录.绑定ID:
+            self._移出反向索引(用户ID, 记录.绑定ID)
+        记录.绑定ID = 游戏ID
+        if 游戏ID:
+            self._加入反向索引(用户ID, 游戏ID)
+
+    @staticmethod
+    def _索引键(游戏ID) -> str:
+        # 旧数据中可能保存着未规范的游戏ID，索引统一按规范后的ID归类
+        return EmailService.规范化用户ID(游戏ID)
+
+    def _加入反向索引(self, 用户ID: str, 游戏ID: str):
+        游戏ID = self._索引键(游戏ID)
+        if not 游戏ID:
+            return
+        用户集合 = self._按游戏ID.setdefault(游戏ID, set())
+        用户集合.add(用户ID)
+        if len(用户集合) > 1:
+            self._重复游戏ID.add(游戏ID)
+
+    def _移出反向索引(self, 用户ID: str, 游戏ID: str):
+        游戏ID = self._索引键(游戏ID)
+        用户集合 = self._按游戏ID.get(游戏ID)
+        if 用户集合 is None:
+            return
+        用户集合.discard(用户ID)
+        if len(用户集合) <= 1:
+            self._重复游戏ID.discard(游戏ID)
+        if not 用户集合:
+            del self._按游戏ID[游戏ID]
+
+    def 查找绑定用户(self, 游戏ID) -> list:
+        """返回绑定了该游戏ID（按规范后的ID比较）的用户ID列表"""
+        self._确保已加载()
+        return sorted(self._按游戏ID.get(self._索引键(游戏ID), ()))
+
+    def 重复绑定(self) -> dict:
+        """返回 {规范后的游戏ID: [用户ID, ...]}，只包含被多名用户绑定的游戏ID"""
+        self._确保已加载()
+        return {游戏ID: sorted(self._按游戏ID[游戏ID]) for 游戏ID in sorted(self._重复游戏ID)}
+
+    def 逐个分片遍历(self):
+        """
+        逐个分片生成 (用户ID, 玩家数据字典)，可在后台线程中调用
+
+        每次只复制一个分片的用户ID列表，生成的是记录的副本，遍历期间事件循环仍可修改玩家数据。
+        """
+        self._确保已加载()
+        成员 = self._分片成员
+        for 分片 in 成员:
+            for 用户ID in sorted(分片):
+                记录 = self.玩家.get(用户ID)
+                if 记录 is not None:
+                    yield 用户ID, 记录.转字典()
+
+    def 所有玩家(self):
+        """迭代 (用户ID, PlayerRecord)"""
+        self._确保已加载()
+        return self.玩家.items()
+
+    def 数量(self) -> int:
+        self._确保已加载()
+        return len(self.玩家)
+
+# 邮件追踪模块
+class _Lazy:
+    """延迟求值的日志参数，只有日志真正输出时才调用"""
+    __slots__ = ("函数",)
+
+    def __init__(self, 函数):
+        self.函数 = 函数
+
+    def __str__(self):
+        return str(self.函数())
+
+
+class _LazyJson:
+    """延迟序列化的日志参数，只有日志真正输出时才执行json.dumps"""
+    __slots__ = ("数据",)
+
+    def __init__(self, 数据):
+        self.数据 = 数据
+
+    def __str__(self):
+        return json.dumps(self.数据, ensure_ascii=False, default=str)
+
+
+class _MailRequest:
+    __slots__ = ("请求ID", "缓冲")
+
+    def __init__(self, 请求ID):
+        self.请求ID = 请求ID
+        self.缓冲 = []
+
+
+# 当前协程正在处理的邮件请求，嵌套调用（如quick_send→send_email）共用同一个请求ID
+_当前邮件请求 = contextvars.ContextVar("当前邮件请求", default=None)
+
+
+class MailTrace:
+    """邮件链路的分级日志
+
+    日志使用 %s 模板和参数，级别未开启时不会格式化。每次发送分配一个请求ID作为日志前缀；
+    未开启级别的日志以未格式化的 (级别, 模板, 参数) 暂存在请求缓冲区，
+    发送成功时直接丢弃，失败时才格式化并以WARNING级别输出，便于还原失败邮件的完整过程。
+    """
+
+    def __init__(self, 日志器=None, 缓冲上限=200):
+        self.日志器 = 日志器 or logger
+        self.缓冲上限 = 缓冲上限
+
+    @staticmethod
+    def 令牌指纹(令牌) -> str:
+        """token的短指纹（SHA-256前8位和长度），失败时缓冲日志会以WARNING输出，不能写入token本身的任何片段"""
+        if not 令牌:
+            return "无"
+        return f"{hashlib.sha256(str(令牌).encode('utf-8')).hexdigest()[:8]}/{len(令牌)}"
+
+    @staticmethod
+    def 追踪请求(方法):
+        """装饰EmailService的异步入口方法，为其分配请求ID，失败时输出缓冲的调试日志"""
+        @functools.wraps(方法)
+        async def 包装(self, *args, **kwargs):
+            令牌 = self.trace.开始()
+            结果 = None
+            开始 = time.perf_counter()
+            try:
+                结果 = await 方法(self, *args, **kwargs)
+                return 结果
+            finally:
+                if 令牌 is not None:
+                    成功 = isinstance(结果, dict) and bool(结果.get("success"))
+                    指标.观测("mail_latency_ms", (time.perf_counter() - 开始) * 1000, method=方法.__name__)
+                    指标.计数("mail_requests_total", method=方法.__name__,
+                             result="success" if 成功 else (结果.get("error_code") or "failure") if isinstance(结果, dict) else "error")
+                self.trace.结束(令牌, 结果)
+        return 包装
+
+    def 开始(self):
+        """开始一个邮件请求，已处于请求中时返回None"""
+        if _当前邮件请求.get() is not None:
+            return None
+        return _当前邮件请求.set(_MailRequest(uuid.uuid4().hex[:8]))
+
+    def 结束(self, 令牌, 结果=None):
+        """结束邮件请求，结果失败时输出缓冲的调试日志"""
+        if 令牌 is None:
+            return
+        请求 = _当前邮件请求.get()
+        try:
+            if isinstance(结果, dict):
+                结果.setdefault("request_id", 请求.请求ID)
+            if not isinstance(结果, dict) or not 结果.get("success"):
+                原因 = 结果.get("message") if isinstance(结果, dict) else "无返回结果"
+                self._转储(请求, 原因)
+        finally:
+            _当前邮件请求.reset(令牌)
+
+    def 当前请求ID(self):
+        请求 = _当前邮件请求.get()
+        return 请求.请求ID if 请求 else None
+
+    def _记录(self, 级别, 模板, 参数, exc_info=False):
+        请求 = _当前邮件请求.get()
+        if self.日志器.isEnabledFor(级别):
+            前缀 = f"[邮件:{请求.请求ID}] " if 请求 else "[邮件] "
+            self.日志器.log(级别, 前缀 + 模板, *参数, exc_info=exc_info)
+        elif 请求 is not None and len(请求.缓冲) < self.缓冲上限:
+            请求.缓冲.append((模板, 参数))
+
+    def _转储(self, 请求, 原因):
+        if not 请求.缓冲:
+            return
+        行列表 = []
+        for 模板, 参数 in 请求.缓冲:
+            try:
+                行列表.append(模板 % 参数 if 参数 else 模板)
+            except Exception:
+                行列表.append(模板)
+        请求.缓冲.clear()
+        self.日志器.warning("[邮件:%s] 发送失败(%s)，请求过程:\n%s", 请求.请求ID, 原因, "\n".join(行列表))
+
+    def debug(self, 模板, *参数):
+        self._记录(logging.DEBUG, 模板, 参数)
+
+    def info(self, 模板, *参数):
+        self._记录(logging.INFO, 模板, 参数)
+
+    def warning(self, 模板, *参数):
+        self._记录(logging.WARNING, 模板, 参数)
+
+    def error(self, 模板, *参数, exc_info=False):
+        self._记录(logging.ERROR, 模板, 参数, exc_info)
+
+# 令牌管理模块
+class TokenProvider:
+    """共享的异步token提供者，EmailService收到401时通过它换取新token，并发的刷新请求合并为一次"""
+    
+    def __init__(self, 获取令牌, 刷新令牌):
+        """
+        初始化token提供者
+        
+        Args:
+            获取令牌 (callable): 返回当前token的函数
+            刷新令牌 (callable): 刷新token的协程函数，返回新token，失败时返回None
+        """
+        self._获取令牌 = 获取令牌
+        self._刷新令牌 = 刷新令牌
+        self._刷新任务 = None
+    
+    def 当前令牌(self):
+        """返回当前token"""
+        return self._获取令牌()
+    
+    @追踪器.追踪("等待token刷新")
+    async def 刷新(self, 失效令牌=None):
+        """
+        获取新token，刷新进行中时等待同一次刷新的结果
+        
+        Args:
+            失效令牌 (str): 收到401时使用的token，当前token已与之不同时说明其他请求已经刷新过，直接返回
+            
+        Returns:
+            str or None: 新token，刷新失败时为None
+        """
+        当前 = self._获取令牌()
+        if 失效令牌 and 当前 and 当前 != 失效令牌:
+            return 当前
+        if self._刷新任务 is None or self._刷新任务.done():
+            self._刷新任务 = asyncio.ensure_future(self._执行刷新())
+        # shield：某个等待方被取消时不影响其他等待同一次刷新的请求
+        return await asyncio.shield(self._刷新任务)
+    
+    async def _执行刷新(self):
+        try:
+            return await self._刷新令牌()
+        except Exception as e:
+            logger.error(f"刷新token异常: {e}")
+            return None
+
+# 熔断模块
+class CircuitOpenError(Exception):
+    """熔断器断开期间拒绝请求时抛出"""
+    
+    def __init__(self, 名称, 剩余时间):
+        super().__init__(f"后台接口熔断中: {名称}，约{剩余时间:.0f}秒后试探恢复")
+        self.名称 = 名称
+        self.剩余时间 = 剩余时间
+
+
+class CircuitBreaker:
+    """
+    按接口和项目划分的熔断器
+    
+    关闭状态下正常放行，连续失败达到阈值后断开；断开期间直接拒绝请求，
+    冷却时间过后进入半开状态，只放行少量试探请求，试探成功则恢复关闭，失败则重新断开。
+    """
+    
+    关闭 = "closed"
+    断开 = "open"
+    半开 = "half_open"
+    
+    # 同名熔断器在所有邮件服务实例间共享
+    _实例 = {}
+    _实例锁 = threading.Lock()
+    
+    def __init__(self, 名称, 失败阈值=5, 冷却时间=30.0, 半开试探数=1):
+        """
+        初始化熔断器
+        
+        Args:
+            名称 (str): 熔断器名称，一般为"项目ID:接口路径"
+            失败阈值 (int): 连续失败多少次后断开
+            冷却时间 (float): 断开后多少秒进入半开状态
+            半开试探数 (int): 半开状态下同时放行的试探请求数
+        """
+        self.名称 = 名称
+        self.失败阈值 = 失败阈值
+        self.冷却时间 = 冷却时间
+        self.半开试探数 = 半开试探数
+        self.状态 = self.关闭
+        self.连续失败 = 0
+        self._断开时间 = 0.0
+        self._试探中 = 0
+        self._锁 = threading.Lock()
+    
+    @classmethod
+    def 获取(cls, 名称, **参数):
+        """获取指定名称的共享熔断器，不存在时创建"""
+        with cls._实例锁:
+            熔断器 = cls._实例.get(名称)
+            if 熔断器 is None:
+                熔断器 = cls(名称, **参数)
+                cls._实例[名称] = 熔断器
+            return 熔断器
+    
+    def 剩余冷却(self) -> float:
+        """断开状态下距离进入半开状态的秒数"""
+        if self.状态 != self.断开:
+            return 0.0
+        return max(0.0, self._断开时间 + self.冷却时间 - time.monotonic())
+    
+    def 申请(self):
+        """
+        请求放行前调用，被拒绝时抛出CircuitOpenError
+        
+        Returns:
+            bool: 本次请求是否为半开状态下的试探请求
+        """
+        with self._锁:
+            if self.状态 == self.断开:
+                if self.剩余冷却() > 0:
+                    raise CircuitOpenError(self.名称, self.剩余冷却())
+                self.状态 = self.半开
+                self._试探中 = 0
+                logger.info(f"熔断器 {self.名称} 冷却结束，进入半开状态")
+            if self.状态 == self.半开:
+                if self._试探中 >= self.半开试探数:
+                    raise CircuitOpenError(self.名称, 0)
+                self._试探中 += 1
+                return True
+            return False
+    
+    def 记录成功(self, 试探=False):
+        with self._锁:
+            if 试探:
+                self._试探中 = max(0, self._试探中 - 1)
+            if self.状态 != self.关闭:
+                logger.info(f"熔断器 {self.名称} 试探成功，恢复关闭状态")
+            self.状态 = self.关闭
+            self.连续失败 = 0
+    
+    def 放弃试探(self, 试探=False):
+        """请求在得到结果前被取消时调用：归还试探名额，不改变熔断状态"""
+        if not 试探:
+            return
+        with self._锁:
+            self._试探中 = max(0, self._试探中 - 1)
+    
+    def 记录失败(self, 试探=False):
+        with self._锁:
+            if 试探:
+                self._试探中 = max(0, self._试探中 - 1)
+            self.连续失败 += 1
+            if self.状态 == self.半开 or (self.状态 == self.关闭 and self.连续失败 >= self.失败阈值):
+                self.状态 = self.断开
+                self._断开时间 = time.monotonic()
+                logger.warning(f"熔断器 {self.名称} 断开，连续失败 {self.连续失败} 次，{self.冷却时间:.0f}秒后试探恢复")
+
+# 限流模块
+class RateLimiter:
+    """
+    按项目共享的令牌桶限流器
+    
+    令牌按当前速率匀速补充，桶满时允许短时突发；令牌不足时请求预约后续令牌并等待。
+    收到429等限流信号时速率减半，并在Retry-After期间暂停发放；之后每次成功缓慢加速（AIMD）。
+    初始速率为0时不限速，直到收到第一个限流信号才从实际发送速率的一半开始限速，
+    恢复到最高速率后重新取消限速。
+    """
+    
+    # 同名限流器在所有邮件服务实例间共享
+    _实例 = {}
+    _实例锁 = threading.Lock()
+    
+    def __init__(self, 名称, 速率=10.0, 容量=10, 最低速率=0.5, 最高速率=None, 恢复步长=0.5):
+        """
+        初始化限流器
+        
+        Args:
+            名称 (str): 限流器名称，一般为项目ID
+            速率 (float): 初始速率（请求/秒），0为不限速
+            容量 (int): 令牌桶容量，即允许的突发请求数
+            最低速率 (float): 减速的下限
+            最高速率 (float): 加速的上限，默认为初始速率；初始不限速时，恢复到这个速率后取消限速
+            恢复步长 (float): 无限流信号时每秒大约增加的速率
+        """
+        self.名称 = 名称
+        self.速率 = float(速率)
+        self.容量 = float(容量)
+        self.最低速率 = float(最低速率)
+        self.最高速率 = float(最高速率 or 速率)
+        self.恢复步长 = float(恢复步长)
+        self._不限速 = self.速率 <= 0
+        self._令牌 = float(容量)
+        self._补充时间 = time.monotonic()
+        self._暂停至 = 0.0
+        self._代数 = 0
+        # 不限速期间统计实际发送速率：当前一秒窗口的请求数和上一个窗口的速率
+        self._窗口开始 = self._补充时间
+        self._窗口计数 = 0
+        self._上窗口速率 = 0.0
+        self._锁 = threading.Lock()
+    
+    @classmethod
+    def 获取(cls, 名称, **参数):
+        """获取指定名称的共享限流器，不存在时创建"""
+        with cls._实例锁:
+            限流器 = cls._实例.get(名称)
+            if 限流器 is None:
+                限流器 = cls(名称, **参数)
+                cls._实例[名称] = 限流器
+            return 限流器
+    
+    def _预约(self):
+        """取走一个令牌（不足时记为欠账），返回 (需要等待的秒数, 当前限流代数)"""
+        with self._锁:
+            现在 = time.monotonic()
+            if self.速率 <= 0:
+                if 现在 - self._窗口开始 >= 1.0:
+                    self._上窗口速率 = self._窗口计数 / (现在 - self._窗口开始)
+                    self._窗口开始 = 现在
+                    self._窗口计数 = 0
+                self._窗口计数 += 1
+                return max(0.0, self._暂停至 - 现在), self._代数
+            if 现在 > self._补充时间:
+                self._令牌 = min(self.容量, self._令牌 + (现在 - self._补充时间) * self.速率)
+                self._补充时间 = 现在
+            self._令牌 -= 1
+            等待 = -self._令牌 / self.速率 if self._令牌 < 0 else 0.0
+            return max(等待, self._暂停至 - 现在), self._代数
+    
+    async def 等待令牌(self):
+        """等到可以发出下一个请求"""
+        while True:
+            等待, 代数 = self._预约()
+            if 等待 <= 0:
+                return
+            await asyncio.sleep(等待)
+            # 等待期间收到过限流信号，之前的预约按旧速率计算，需要按新速率重新排队
+            if 代数 == self._代数:
+                return
+    
+    def 记录限流(self, 重试等待=None):
+        """
+        收到限流信号时调用：速率减半，并按Retry-After暂停发放令牌
+        
+        Args:
+            重试等待 (float): 服务端要求的等待秒数，为None时按当前速率等待一个令牌的时间
+        """
+        with self._锁:
+            现在 = time.monotonic()
+            # 同一轮暂停期间陆续返回的429属于同一次限流，只减速一次
+            if self.速率 <= 0:
+                # 从不限速转为限速：以实际发送速率（不超过最高速率）为基准减半
+                实际速率 = max(self._上窗口速率, self._窗口计数, self.最低速率)
+                self.速率 = max(self.最低速率, min(实际速率, self.最高速率) / 2)
+                logger.warning(f"限流器 {self.名称} 收到限流信号，开始限速 {self.速率:.2f}/秒")
+            elif 现在 >= self._暂停至:
+                self.速率 = max(self.最低速率, self.速率 / 2)
+                logger.warning(f"限流器 {self.名称} 收到限流信号，速率降至 {self.速率:.2f}/秒")
+            self._暂停至 = max(self._暂停至, 现在 + (重试等待 if 重试等待 is not None else 1 / self.速率))
+            # 清空令牌和欠账，暂停结束后从空桶开始补充，排队中的请求重新预约
+            self._令牌 = 0.0
+            self._补充时间 = self._暂停至
+            self._代数 += 1
+    
+    def 记录成功(self):
+        """请求未被限流时调用，速率缓慢回升"""
+        with self._锁:
+            if 0 < self.速率 < self.最高速率:
+                self.速率 = min(self.最高速率, self.速率 + self.恢复步长 / self.速率)
+            if self._不限速 and self.速率 >= self.最高速率:
+                self.速率 = 0.0
+                self._窗口开始 = time.monotonic()
+                self._窗口计数 = 0
+                self._上窗口速率 = 0.0
+                logger.info(f"限流器 {self.名称} 已恢复到最高速率，取消限速")
+    
+    def 剩余暂停(self) -> float:
+        """距离限流暂停结束的秒数"""
+        return max(0.0, self._暂停至 - time.monotonic())
+
+# 指令节流模块
+class CommandThrottle:
+    """按 (用户, 指令, 参数) 的短时节流和结果缓存
+    
+    窗口内重复的相同指令不会再执行处理函数：只读指令直接重放上次的回复，
+    其他指令回复节流提示，因此不会读写数据文件，也不会请求后台接口。
+    """
+    
+    def __init__(self, 窗口=5.0, 上限=10000):
+        # 节流窗口（秒），0为关闭
+        self.窗口 = 窗口
+        # 最多记录的条目数，超出时淘汰最早的条目
+        self.上限 = 上限
+        # 键 -> [记录时间, 回复列表或None]，按记录时间先后排列，便于从头部清理过期条目
+        self._条目 = collections.OrderedDict()
+    
+    def _清理过期(self, 现在):
+        while self._条目:
+            键, (时间, _) = next(iter(self._条目.items()))
+            if 现在 - 时间 < self.窗口 and len(self._条目) <= self.上限:
+                break
+            del self._条目[键]
+    
+    def 清空(self):
+        """批量修改用户数据后调用"""
+        self._条目.clear()
+    
+    def 失效(self, 用户ID):
+        """用户数据变化后调用，丢弃该用户的所有缓存回复"""
+        用户ID = str(用户ID)
+        for 键 in [键 for 键 in self._条目 if 键[0] == 用户ID]:
+            del self._条目[键]
+    
+    def __len__(self):
+        return len(self._条目)
+    
+    def 节流(self, 缓存结果=False, 提示="⏳ 操作太频繁啦，请{剩余}秒后再试"):
+        """装饰 @filter.command 处理函数
+        
+        缓存结果为True时，窗口内的重复指令重放上次成功执行的回复（仅用于只读指令）；
+        否则以及上次仍在执行时，回复节流提示。处理函数抛出异常时不留下记录。
+        """
+        def 装饰器(方法):
+            @functools.wraps(方法)
+            async def 包装(*args, **kwargs):
+                事件 = args[1]
+                if self.窗口 <= 0:
+                    async for 结果 in 方法(*args, **kwargs):
+                        yield 结果
+                    return
+                键 = (str(事件.get_sender_id()), 方法.__name__, " ".join(事件.message_str.split()))
+                现在 = time.monotonic()
+                self._清理过期(现在)
+                条目 = self._条目.get(键)
+                if 条目 is not None:
+                    记录时间, 回复列表 = 条目
+                    if 缓存结果 and 回复列表 is not None:
+                        指标.计数("command_throttled_total", command=方法.__name__, result="cached")
+                        for 结果 in 回复列表:
+                            yield copy.deepcopy(结果)
+                    else:
+                        指标.计数("command_throttled_total", command=方法.__name__, result="throttled")
+                        yield 事件.plain_result(提示.format(剩余=max(1, math.ceil(self.窗口 - (现在 - 记录时间)))))
+                    return
+                
+                # 先占位，执行期间到达的相同指令直接收到节流提示
+                条目 = [现在, None]
+                self._条目[键] = 条目
+                回复列表 = []
+                完成 = False
+                try:
+                    async for 结果 in 方法(*args, **kwargs):
+                        # 在交给框架处理前留一份副本，框架后续对结果的修改不会影响重放
+                        if 缓存结果:
+                            回复列表.append(copy.deepcopy(结果))
+                        yield 结果
+                    完成 = True
+                finally:
+                    if not 完成:
+                        if self._条目.get(键) is 条目:
+                            del self._条目[键]
+                    elif 缓存结果:
+                        条目[1] = 回复列表
+            return 包装
+        return 装饰器
+
+
+# 全局指令节流器
+指令节流 = CommandThrottle()
+
 # 邮件服务模块
 class EmailService:
     """邮件发送服务类（基于C#代码实现）"""
     
-    def __init__(self, auth_token, project_id="p_95jd", max_retries=2):
+    # 后台接口地址，本地压测时可以指向 bench/fake_admin_server.py 启动的模拟服务
+    DEFAULT_BASE_URL = "https://adminapi-pd.spark.xd.com"
+    # 单次请求超时时间（秒）
+    DEFAULT_TIMEOUT = 30
+    # 熔断设置：连续失败次数阈值、断开后的冷却时间（秒）
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_COOLDOWN = 30
+    # 限流设置：每个项目的初始请求速率（请求/秒，0为不限速，收到429或Retry-After后才开始限速）、突发容量、
+    # 限流后的最低速率、限流后逐步提速的上限（初始不限速时达到后取消限速）、429最多重试次数和单次最长等待（秒）
+    RATE_LIMIT = 0
+    RATE_BURST = 10
+    RATE_LIMIT_MIN = 0.5
+    RATE_LIMIT_MAX = 30.0
+    THROTTLE_RETRIES = 2
+    RETRY_AFTER_MAX = 60
+    
+    def __init__(self, auth_token, project_id="p_95jd", max_retries=2, base_url=None, timeout=None, token_provider=None, rate_limit=None):
         """
         初始化邮件服务
         
@@ -193,30 +1715,154 @@ class EmailService:
             auth_token (str): 认证令牌
             project_id (str): 项目ID，默认值为"p_95jd"
             max_retries (int): 重试次数，默认值为2
+            base_url (str): 后台接口地址，默认使用DEFAULT_BASE_URL
+            timeout (float): 单次请求超时时间（秒），默认使用DEFAULT_TIMEOUT
+            token_provider (TokenProvider): token提供者，收到401时用于刷新token并重放请求，为None时不自动刷新
+            rate_limit (float): 该项目的初始请求速率（请求/秒），0为不限速，默认使用RATE_LIMIT；
+                同一项目的限流器共享，以第一个创建的实例为准
         """
         self.auth_token = auth_token
+        self.token_provider = token_provider
         self.project_id = project_id
-        self.add_email_url = "https://adminapi-pd.spark.xd.com/api/v1/table/add"
-        self.send_email_url = "https://adminapi-pd.spark.xd.com/api/v1/table/row"
-        self.get_emails_url = "https://adminapi-pd.spark.xd.com/api/v1/table/data"  # 添加获取邮件列表的URL
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.rate_limit = self.RATE_LIMIT if rate_limit is None else rate_limit
+        self.add_email_url = f"{self.base_url}/api/v1/table/add"
+        self.send_email_url = f"{self.base_url}/api/v1/table/row"
+        self.get_emails_url = f"{self.base_url}/api/v1/table/data"  # 添加获取邮件列表的URL
         self.table_id = "firm0_app_email_manager"
+        # 会话只用于复用连接，不修改它的请求头和cookie：请求在多个线程中并发执行，
+        # 认证信息按请求传入，刷新token时只替换 self._请求头
         self.session = requests.Session()
         self.max_retries = max_retries  # 设置重试次数
+        self.trace = MailTrace()  # 分级日志，按请求ID关联
         # 设置默认请求头
         self._update_auth_headers(auth_token)
     
     def _update_auth_headers(self, token):
-        """更新认证头信息"""
+        """更新认证头信息：整体替换为新的字典，进行中的请求仍使用各自发出时的那一份"""
         self.auth_token = token
-        self.session.headers.update({
+        self._请求头 = {
             "Cookie": f"token={token}",
             "Content-Type": "application/json",
             "Authorization": f"Bearer {token}"  # 增加Authorization头
-        })
-        # 同时更新session的cookies
-        self.session.cookies.set('token', token)
+        }
+    
+    @追踪器.追踪("后台请求", 记录参数=1)
+    async def _post(self, url, request_data):
+        """
+        发送POST请求，收到401时通过token提供者换取新token并重放一次
+        
+        Args:
+            url (str): 请求地址
+            request_data (dict): 请求数据
+            
+        Returns:
+            requests.Response: 响应对象
+        """
+        # 其他共享同一提供者的请求可能已经换了token，先同步过来
+        if self.token_provider is not None:
+            当前令牌 = self.token_provider.当前令牌()
+            if 当前令牌 and 当前令牌 != self.auth_token:
+                self._update_auth_headers(当前令牌)
+        
+        数据 = json.dumps(request_data)
+        使用的令牌 = self.auth_token
+        response = await self._限流发送(url, 数据)
+        if response.status_code != 401 or self.token_provider is None:
+            return response
+        
+        self.trace.warning("收到401未授权错误，尝试刷新token后重放请求")
+        新令牌 = await self.token_provider.刷新(使用的令牌)
+        if not 新令牌 or 新令牌 == 使用的令牌:
+            self.trace.warning("未能获取到新token，不再重放请求")
+            return response
+        if 新令牌 != self.auth_token:
+            self._update_auth_headers(新令牌)
+        self.trace.info("已获取新token，指纹: %s，重放请求", _Lazy(lambda: MailTrace.令牌指纹(新令牌)))
+        return await self._限流发送(url, 数据)
+    
+    def _限流器(self):
+        """获取该项目的共享限流器，添加、触发和列表请求共用"""
+        return RateLimiter.获取(
+            self.project_id,
+            速率=self.rate_limit,
+            容量=self.RATE_BURST,
+            最低速率=self.RATE_LIMIT_MIN,
+            最高速率=max(self.rate_limit, self.RATE_LIMIT_MAX)
+        )
+    
+    def _解析重试等待(self, response):
+        """解析Retry-After响应头（秒数或HTTP日期），无法解析时返回None"""
+        值 = response.headers.get("Retry-After")
+        if not 值:
+            return None
+        try:
+            等待 = float(值)
+        except ValueError:
+            try:
+                等待 = (email.utils.parsedate_to_datetime(值) - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(0.0, 等待), self.RETRY_AFTER_MAX)
     
-    def _trigger_email_send(self, row_id):
+    async def _限流发送(self, url, 数据):
+        """按项目限流发送请求，收到429（或带Retry-After的503）时减速并在等待后重试"""
+        限流器 = self._限流器()
+        for 次数 in range(self.THROTTLE_RETRIES + 1):
+            with 追踪器.跨度("等待限流"):
+                await 限流器.等待令牌()
+            with 追踪器.跨度("HTTP"):
+                response = await self._熔断发送(url, 数据)
+            重试等待 = self._解析重试等待(response) if response.status_code in (429, 503) else None
+            if response.status_code != 429 and 重试等待 is None:
+                限流器.记录成功()
+                return response
+            限流器.记录限流(重试等待)
+            if 次数 < self.THROTTLE_RETRIES:
+                self.trace.warning("后台限流(%s)，%.1f秒后重试 (%d/%d)", response.status_code, 限流器.剩余暂停(), 次数 + 1, self.THROTTLE_RETRIES)
+        return response
+    
+    def _熔断器(self, url):
+        """获取该项目该接口的共享熔断器"""
+        return CircuitBreaker.获取(
+            f"{self.project_id}:{urlparse(url).path}",
+            失败阈值=self.CIRCUIT_FAILURE_THRESHOLD,
+            冷却时间=self.CIRCUIT_COOLDOWN
+        )
+    
+    async def _熔断发送(self, url, 数据):
+        """经过熔断器发送请求：超时、连接失败和5xx计为失败，其余响应说明后台可用。
+        requests是同步库，请求放到线程中执行，避免阻塞事件循环上的其他指令"""
+        熔断器 = self._熔断器(url)
+        接口 = urlparse(url).path.rsplit("/", 1)[-1]
+        try:
+            试探 = 熔断器.申请()
+        except CircuitOpenError:
+            指标.计数("admin_api_requests_total", endpoint=接口, status="circuit_open")
+            raise
+        开始 = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(self.session.post, url, data=数据, headers=self._请求头, timeout=self.timeout)
+        except asyncio.CancelledError:
+            # 取消不说明后台是否可用，但必须归还试探名额，否则熔断器会一直停在半开状态拒绝所有请求
+            熔断器.放弃试探(试探)
+            raise
+        except Exception as e:
+            指标.计数("admin_api_requests_total", endpoint=接口, status=type(e).__name__)
+            熔断器.记录失败(试探)
+            raise
+        finally:
+            指标.观测("admin_api_latency_ms", (time.perf_counter() - 开始) * 1000, endpoint=接口)
+        指标.计数("admin_api_requests_total", endpoint=接口, status=response.status_code)
+        if response.status_code >= 500:
+            熔断器.记录失败(试探)
+        else:
+            熔断器.记录成功(试探)
+        return response
+    
+    @追踪器.追踪("触发发送")
+    async def _trigger_email_send(self, row_id):
         """
         触发邮件发送（根据C#代码和最新接口响应格式优化）
         
@@ -239,18 +1885,13 @@ class EmailService:
                 "table_id": self.table_id
             }
             
-            print(f"准备触发邮件发送: {row_id}")
-            print(f"触发请求数据: {json.dumps(request_data, ensure_ascii=False)}")
+            self.trace.debug("准备触发邮件发送: %s", row_id)
+            self.trace.debug("触发请求数据: %s", _LazyJson(request_data))
             
-            # 添加超时设置
-            response = self.session.post(
-                self.send_email_url, 
-                data=json.dumps(request_data),
-                timeout=30
-            )
+            response = await self._post(self.send_email_url, request_data)
             
-            print(f"触发发送响应状态码: {response.status_code}")
-            print(f"触发发送响应内容: {response.text}")
+            self.trace.debug("触发发送响应状态码: %s", response.status_code)
+            self.trace.debug("触发发送响应内容: %s", _Lazy(lambda: response.text))
             
             # 保存原始响应，用于调试和错误处理
             raw_response = response.text
@@ -270,7 +1911,7 @@ class EmailService:
                         "response_data": result
                     }
                 except json.JSONDecodeError:
-                    print(f"触发发送响应解析失败: {raw_response}")
+                    self.trace.warning("触发发送响应解析失败: %s", raw_response)
                     # 即使JSON解析失败，如果状态码是200，也可以尝试判断是否成功
                     # 这里我们仍然返回失败，但提供更详细的错误信息
                     return {
@@ -282,7 +1923,7 @@ class EmailService:
             else:
                 # 非200状态码的错误处理
                 error_msg = f"触发发送失败: {response.status_code} {response.reason}"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 return {
                     "success": False, 
                     "message": error_msg,
@@ -290,21 +1931,23 @@ class EmailService:
                     "response_status": response.status_code
                 }
                 
+        except CircuitOpenError as e:
+            self.trace.warning("%s", e)
+            return {"success": False, "message": str(e), "error_type": "CIRCUIT_OPEN"}
         except requests.Timeout:
             error_msg = f"触发邮件发送超时: row_id={row_id}"
-            print(error_msg)
+            self.trace.warning("%s", error_msg)
             return {"success": False, "message": error_msg, "error_type": "TIMEOUT"}
         except requests.ConnectionError:
             error_msg = f"触发邮件发送连接错误: row_id={row_id}"
-            print(error_msg)
+            self.trace.warning("%s", error_msg)
             return {"success": False, "message": error_msg, "error_type": "CONNECTION_ERROR"}
         except Exception as e:
             error_msg = f"触发邮件发送异常: {str(e)}"
-            print(error_msg)
-            import traceback
-            print(f"异常堆栈: {traceback.format_exc()}")
+            self.trace.error("%s", error_msg, exc_info=True)
             return {"success": False, "message": error_msg, "error_type": "UNKNOWN_ERROR"}
     
+    @MailTrace.追踪请求
     async def send_email(self, email_data, use_data_api=False):
         """
         异步发送邮件（根据C#代码实现）
@@ -317,14 +1960,14 @@ class EmailService:
             dict: 发送结果
         """
         try:
-            print(f"准备发送邮件: {email_data.get('标题', '无标题')}")
-            print(f"目标类型: {email_data.get('目标类型', 1)}，收件人ID: {email_data.get('收件人ID', '全体')}")
-            print(f"是否使用Data API: {use_data_api}")
+            self.trace.debug("准备发送邮件: %s", email_data.get('标题', '无标题'))
+            self.trace.debug("目标类型: %s，收件人ID: %s", email_data.get('目标类型', 1), email_data.get('收件人ID', '全体'))
+            self.trace.debug("是否使用Data API: %s", use_data_api)
             
             # 先验证token是否存在
             if not self.auth_token:
                 error_msg = "认证token为空，请先设置有效的token"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 return {"success": False, "message": error_msg, "error_code": "TOKEN_EMPTY"}
             
             # 检查新建邮件参数是否齐全
@@ -343,7 +1986,7 @@ class EmailService:
             
             if missing_params:
                 error_msg = f"邮件参数不齐全，缺少以下必填项: {', '.join(missing_params)}"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 return {"success": False, "message": error_msg, "error_code": "MISSING_REQUIRED_PARAMS"}
             
             # 记录邮件的唯一标识信息，用于后续查找
@@ -358,11 +2001,11 @@ class EmailService:
             
             # 第一步：添加邮件到系统
             add_result = await self._add_email(email_data)
-            print(f"添加邮件结果: {add_result}")
+            self.trace.debug("添加邮件结果: %s", add_result)
             
             # 检查是否是401错误
             if add_result and "401 Unauthorized" in add_result.get("message", ""):
-                print("检测到401未授权错误，可能需要刷新token")
+                self.trace.warning("检测到401未授权错误，可能需要刷新token")
                 return {
                     "success": False, 
                     "message": add_result.get("message"),
@@ -373,48 +2016,52 @@ class EmailService:
             if not add_result:
                 return {"success": False, "message": "添加邮件失败: 未收到响应", "error_code": "NO_RESPONSE"}
             
+            # 后台接口熔断中，直接返回，不再走Data API兜底
+            if add_result.get("error_code") == "CIRCUIT_OPEN":
+                return add_result
+            
             # 如果添加成功，获取row_id
             row_id = add_result.get('row_id')
             
             # 如果启用了Data API并且没有获取到row_id，尝试通过Data API查找
             if use_data_api and not row_id:
-                print("尝试通过Data API获取邮件ID...")
+                self.trace.debug("尝试通过Data API获取邮件ID...")
                 # 获取邮件列表
                 list_result = await self.get_email_list()
                 
                 if list_result.get("success"):
                     emails = list_result.get("emails", [])
-                    print(f"通过Data API获取到 {len(emails)} 封邮件")
+                    self.trace.debug("通过Data API获取到 %d 封邮件", len(emails))
                     
                     # 尝试查找刚添加的邮件（可能需要根据更多条件优化）
                     found_email = self.get_email_by_criteria(emails, email_identifier)
                     
                     if found_email:
                         row_id = found_email.get("row_id")
-                        print(f"通过Data API成功找到邮件，row_id: {row_id}")
+                        self.trace.debug("通过Data API成功找到邮件，row_id: %s", row_id)
                     else:
-                        print("通过Data API未找到对应的邮件，尝试其他方式...")
+                        self.trace.debug("通过Data API未找到对应的邮件，尝试其他方式...")
             
             # 如果添加失败但启用了Data API，可以尝试直接查找并发送
             if not add_result.get('success') and use_data_api:
                 error_message = add_result.get('message', '添加邮件失败')
-                print(f"添加邮件失败: {error_message}，尝试通过Data API查找并发送邮件...")
+                self.trace.warning("添加邮件失败: %s，尝试通过Data API查找并发送邮件...", error_message)
                 
                 # 获取邮件列表
                 list_result = await self.get_email_list()
                 
                 if list_result.get("success"):
                     emails = list_result.get("emails", [])
-                    print(f"通过Data API获取到 {len(emails)} 封邮件")
+                    self.trace.debug("通过Data API获取到 %d 封邮件", len(emails))
                     
                     # 尝试查找匹配的邮件
                     found_email = self.get_email_by_criteria(emails, email_identifier)
                     
                     if found_email:
                         row_id = found_email.get("row_id")
-                        print(f"通过Data API成功找到匹配的邮件，row_id: {row_id}")
+                        self.trace.debug("通过Data API成功找到匹配的邮件，row_id: %s", row_id)
                         # 直接尝试触发发送
-                        trigger_result = self._trigger_email_send(row_id)
+                        trigger_result = await self._trigger_email_send(row_id)
                         if trigger_result.get("success"):
                             return {
                                 "success": True,
@@ -424,7 +2071,7 @@ class EmailService:
                                 "used_data_api": True
                             }
                     else:
-                        print("通过Data API未找到匹配的邮件")
+                        self.trace.debug("通过Data API未找到匹配的邮件")
                 
                 # 如果通过Data API也无法找到或发送，返回原始错误
                 return {"success": False, "message": error_message, "error_code": "EMAIL_ADD_FAILED"}
@@ -436,10 +2083,9 @@ class EmailService:
             
             # 尝试从原始响应中提取row_id
             if not row_id:
-                print("未获取到row_id，尝试从原始响应中提取...")
+                self.trace.debug("未获取到row_id，尝试从原始响应中提取...")
                 try:
                     # 如果原始响应是JSON格式，尝试直接解析
-                    import json
                     if raw_response.strip().startswith('{'):
                         raw_json = json.loads(raw_response)
                         # 尝试多种可能的路径
@@ -449,28 +2095,28 @@ class EmailService:
                                 for key in ['row_id', 'id', 'rowId']:
                                     if key in raw_json['data']:
                                         row_id = raw_json['data'][key]
-                                        print(f"从原始响应中成功提取到row_id: {row_id}")
+                                        self.trace.debug("从原始响应中成功提取到row_id: %s", row_id)
                                         break
                             # 直接在根对象中查找
                             if not row_id:
                                 for key in ['row_id', 'id', 'rowId']:
                                     if key in raw_json:
                                         row_id = raw_json[key]
-                                        print(f"从原始响应根对象中成功提取到row_id: {row_id}")
+                                        self.trace.debug("从原始响应根对象中成功提取到row_id: %s", row_id)
                                         break
                 except Exception as parse_error:
-                    print(f"解析原始响应异常: {str(parse_error)}")
+                    self.trace.warning("解析原始响应异常: %s", parse_error)
             
             # 无论是否有row_id，都尝试触发发送邮件（关键修改：参考C#实现）
             # 在C#代码中，即使添加邮件成功，也显式调用了触发发送方法
-            print("根据C#实现，尝试触发邮件发送...")
+            self.trace.debug("根据C#实现，尝试触发邮件发送...")
             
             # 先尝试使用row_id触发发送
             trigger_success = False
             if row_id:
                 # 调用触发发送方法
-                trigger_result = self._trigger_email_send(row_id)
-                print(f"触发发送结果: {trigger_result}")
+                trigger_result = await self._trigger_email_send(row_id)
+                self.trace.debug("触发发送结果: %s", trigger_result)
                 
                 if trigger_result.get("success"):
                     trigger_success = True
@@ -487,17 +2133,17 @@ class EmailService:
                     # 触发发送失败，但邮件已添加
                     error_msg = trigger_result.get('message', '未知错误')
                     error_type = trigger_result.get('error_type', 'UNKNOWN')
-                    print(f"邮件添加成功但触发发送失败: {error_msg}, 错误类型: {error_type}")
+                    self.trace.warning("邮件添加成功但触发发送失败: %s, 错误类型: %s", error_msg, error_type)
             else:
                 # 没有row_id时的特殊处理
-                print("没有row_id，无法直接触发发送，但邮件已添加到系统")
+                self.trace.debug("没有row_id，无法直接触发发送，但邮件已添加到系统")
                 
             # 如果触发发送失败或者没有row_id，根据情况决定返回结果
             # 特别注意：根据C#实现和用户反馈，邮件可能只是被添加而未实际发送
             
             # 处理特殊情况：有dialog_box字段
             if has_dialog_box:
-                print(f"检测到特殊响应格式（有dialog_box字段），邮件已成功添加")
+                self.trace.debug("检测到特殊响应格式（有dialog_box字段），邮件已成功添加")
                 return {
                     "success": True,
                     "message": "邮件添加成功并自动发送（特殊响应格式）",
@@ -508,7 +2154,7 @@ class EmailService:
             
             # 检查是否是TIMEOUT错误
             if row_id and error_type == 'TIMEOUT':
-                print(f"警告: 触发发送超时，邮件可能已经成功发送但无法确认")
+                self.trace.warning("触发发送超时，邮件可能已经成功发送但无法确认")
                 return {
                     "success": False,
                     "message": f"邮件添加成功，但触发发送超时，邮件可能已发送: {error_msg}",
@@ -523,7 +2169,7 @@ class EmailService:
             if add_result.get('success'):
                 # 重要修改：根据用户反馈，即使添加操作成功，也不认为邮件已自动发送
                 # 我们返回一个特殊的状态，表明邮件已添加但可能未发送
-                print(f"邮件已添加到系统，但需要手动触发发送或检查系统后台")
+                self.trace.warning("邮件已添加到系统，但需要手动触发发送或检查系统后台")
                 return {
                     "success": False,  # 修改为False，因为邮件可能未实际发送
                     "message": "邮件已添加到系统，但可能未实际发送",
@@ -543,7 +2189,7 @@ class EmailService:
             
         except requests.RequestException as e:
             error_msg = f"网络请求异常: {str(e)}"
-            print(error_msg)
+            self.trace.warning("%s", error_msg)
             if hasattr(e, 'response') and e.response is not None:
                 # 检查是否是401错误
                 if e.response.status_code == 401:
@@ -556,11 +2202,22 @@ class EmailService:
             return {"success": False, "message": error_msg, "error_code": "NETWORK_ERROR"}
         except Exception as e:
             error_msg = f"发送邮件异常: {str(e)}"
-            print(error_msg)
-            import traceback
-            print(f"异常堆栈: {traceback.format_exc()}")
+            self.trace.error("%s", error_msg, exc_info=True)
             return {"success": False, "message": error_msg, "error_code": "INTERNAL_ERROR"}
     
+    @staticmethod
+    def 规范化用户ID(用户ID) -> str:
+        """
+        把游戏用户ID规范为纯数字：去掉首尾空白，混有其他字符时只保留数字部分
+
+        星火后台的用户ID是纯数字，发送邮件和批量绑定都按这个规则校验。提取不到数字时返回空字符串。
+        """
+        清理后 = str(用户ID).strip()
+        if 清理后.isdigit():
+            return 清理后
+        return re.sub(r'\D', '', 清理后)
+
+    @MailTrace.追踪请求
     async def quick_send(self, title, content, recipient_id, item_id=0, item_count=0, money=0, attachment="", use_data_api=False):
         """
         异步快速发送邮件（根据C#代码实现）
@@ -579,7 +2236,7 @@ class EmailService:
             dict: 发送结果
         """
         # 记录传入的参数
-        print(f"quick_send方法调用参数 - 标题: '{title}', 收件人ID: '{recipient_id}', 奖励字符串: '{attachment}'")
+        self.trace.debug("quick_send方法调用参数 - 标题: '%s', 收件人ID: '%s', 奖励字符串: '%s'", title, recipient_id, attachment)
         
         # 验证必填字段
         if not title or not str(title).strip():
@@ -590,33 +2247,24 @@ class EmailService:
             return {"success": False, "message": "收件人ID不能为空", "error_code": "EMPTY_RECIPIENT"}
         
         # 验证并清理recipient_id，确保它是一个有效的数字格式用户ID
-        # 清理空格和不可见字符
-        cleaned_recipient_id = str(recipient_id).strip()
-        # 验证是否只包含数字
-        if not cleaned_recipient_id.isdigit():
-            print(f"警告：收件人ID '{recipient_id}' 包含非数字字符，可能导致400错误")
-            # 尝试提取数字部分（如果是混合格式）
-            import re
-            numbers_only = re.sub(r'\D', '', cleaned_recipient_id)
-            if numbers_only:
-                print(f"已提取数字部分: {numbers_only}")
-                recipient_id = numbers_only
-            else:
-                print("无法从收件人ID中提取有效的数字，将使用原ID但可能导致错误")
-                return {"success": False, "message": f"无效的收件人ID格式: {recipient_id}", "error_code": "INVALID_RECIPIENT_FORMAT"}
-        else:
-            recipient_id = cleaned_recipient_id
+        cleaned_recipient_id = self.规范化用户ID(recipient_id)
+        if not cleaned_recipient_id:
+            self.trace.warning("无法从收件人ID中提取有效的数字")
+            return {"success": False, "message": f"无效的收件人ID格式: {recipient_id}", "error_code": "INVALID_RECIPIENT_FORMAT"}
+        if cleaned_recipient_id != str(recipient_id).strip():
+            self.trace.warning("收件人ID '%s' 包含非数字字符，可能导致400错误，已提取数字部分: %s", recipient_id, cleaned_recipient_id)
+        recipient_id = cleaned_recipient_id
         
-        print(f"清理后的收件人ID: '{recipient_id}'")
+        self.trace.debug("清理后的收件人ID: '%s'", recipient_id)
         
         # 验证奖励字符串格式（如果提供）
         if attachment:
             # 确保奖励字符串格式正确，包含必要的分隔符
             if ':' not in attachment:
-                print(f"警告：奖励字符串格式可能不正确，缺少分隔符':': '{attachment}'")
+                self.trace.warning("奖励字符串格式可能不正确，缺少分隔符':': '%s'", attachment)
                 # 简单检查格式是否符合预期模式
                 if not re.search(r'\$[\w\.]+:\d+', attachment):
-                    print(f"奖励字符串 '{attachment}' 可能不符合预期格式")
+                    self.trace.warning("奖励字符串 '%s' 可能不符合预期格式", attachment)
         
         # 构建完整的邮件数据
         email_data = {
@@ -634,10 +2282,11 @@ class EmailService:
             "发件人": "系统管理员"
         }
         
-        print(f"构建的邮件数据: {json.dumps(email_data, ensure_ascii=False)}")
+        self.trace.debug("构建的邮件数据: %s", _LazyJson(email_data))
         
         return await self.send_email(email_data, use_data_api=use_data_api)
     
+    @MailTrace.追踪请求
     async def send_to_all(self, title, content, item_id=0, item_count=0, money=0, attachment="", use_data_api=False):
         """
         异步发送全体邮件（根据C#代码实现）
@@ -671,6 +2320,8 @@ class EmailService:
         
         return await self.send_email(email_data, use_data_api=use_data_api)
     
+    @MailTrace.追踪请求
+    @追踪器.追踪("Data API查询邮件")
     async def get_email_list(self, page=1, page_limit=10, search_key="", sort_key="id", sort_type="desc"):
         """
         获取邮件列表
@@ -686,7 +2337,7 @@ class EmailService:
             dict: 邮件列表数据
         """
         try:
-            print(f"准备获取邮件列表，页码: {page}, 每页数量: {page_limit}")
+            self.trace.debug("准备获取邮件列表，页码: %s, 每页数量: %s", page, page_limit)
             
             # 构建请求数据
             request_data = {
@@ -700,18 +2351,14 @@ class EmailService:
                 "sort_type": sort_type
             }
             
-            print(f"准备发送邮件列表请求到: {self.get_emails_url}")
-            print(f"请求数据: {json.dumps(request_data, ensure_ascii=False)}")
-            print(f"当前使用的token: {self.auth_token[:20]}...{self.auth_token[-8:]}")
+            self.trace.debug("准备发送邮件列表请求到: %s", self.get_emails_url)
+            self.trace.debug("请求数据: %s", _LazyJson(request_data))
+            self.trace.debug("当前使用的token指纹: %s", _Lazy(lambda 令牌=self.auth_token: MailTrace.令牌指纹(令牌)))
             
-            response = self.session.post(
-                self.get_emails_url,
-                data=json.dumps(request_data),
-                timeout=30
-            )
+            response = await self._post(self.get_emails_url, request_data)
             
-            print(f"邮件列表响应状态码: {response.status_code}")
-            print(f"邮件列表响应内容: {response.text}")
+            self.trace.debug("邮件列表响应状态码: %s", response.status_code)
+            self.trace.debug("邮件列表响应内容: %s", _Lazy(lambda: response.text))
             
             if response.status_code == 200:
                 try:
@@ -724,18 +2371,19 @@ class EmailService:
                     }
                 except json.JSONDecodeError:
                     error_msg = "邮件列表响应解析失败"
-                    print(f"{error_msg}: {response.text}")
+                    self.trace.warning("%s: %s", error_msg, response.text)
                     return {"success": False, "message": error_msg}
             else:
                 error_msg = f"获取邮件列表失败: {response.status_code} {response.reason}"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 return {"success": False, "message": error_msg}
                 
+        except CircuitOpenError as e:
+            self.trace.warning("%s", e)
+            return {"success": False, "message": str(e), "error_code": "CIRCUIT_OPEN"}
         except Exception as e:
             error_msg = f"获取邮件列表异常: {str(e)}"
-            print(error_msg)
-            import traceback
-            print(f"异常堆栈: {traceback.format_exc()}")
+            self.trace.error("%s", error_msg, exc_info=True)
             return {"success": False, "message": error_msg}
     
     def get_email_by_criteria(self, emails, criteria):
@@ -759,6 +2407,7 @@ class EmailService:
                 return email
         return None
     
+    @追踪器.追踪("添加邮件")
     async def _add_email(self, email_data):
         """
         添加邮件到系统（根据C#代码实现）
@@ -771,12 +2420,11 @@ class EmailService:
         """
         # 准备请求数据（提取为独立函数避免重复代码）
         def prepare_request_data():
-            import time
             current_time_ms = int(time.time() * 1000)
             
             # 获取完整的奖励字符串，确保不做任何处理或分割
             full_reward_string = email_data.get("道具奖励", "")
-            print(f"准备发送的完整奖励字符串: '{full_reward_string}'")
+            self.trace.debug("准备发送的完整奖励字符串: '%s'", full_reward_string)
             
             # 构建payload数据
             payload = {
@@ -808,7 +2456,7 @@ class EmailService:
         # 执行请求（带重试逻辑）
         for attempt in range(self.max_retries + 1):
             try:
-                print(f"准备添加邮件到系统 (尝试 {attempt + 1}/{self.max_retries + 1})\n原始邮件数据: {email_data}")
+                self.trace.debug("准备添加邮件到系统 (尝试 %d/%d)\n原始邮件数据: %s", attempt + 1, self.max_retries + 1, email_data)
                 
                 request_data = prepare_request_data()
                 
@@ -819,7 +2467,7 @@ class EmailService:
                 # 验证用户ID格式
                 if target_id and not str(target_id).strip().isdigit():
                     error_msg = f"参数验证失败: 用户ID '{target_id}' 必须只包含数字"
-                    logger.error(error_msg)
+                    self.trace.error("%s", error_msg)
                     return {
                         "success": False,
                         "message": error_msg,
@@ -829,31 +2477,27 @@ class EmailService:
                 
                 # 验证其他关键参数
                 if not payload.get('attachment'):
-                    logger.warning("警告: attachment参数为空，可能导致请求失败")
+                    self.trace.warning("attachment参数为空，可能导致请求失败")
                 if not payload.get('content'):
-                    logger.warning("警告: content参数为空，可能导致请求失败")
+                    self.trace.warning("content参数为空，可能导致请求失败")
                 if not payload.get('title'):
-                    logger.warning("警告: title参数为空，可能导致请求失败")
+                    self.trace.warning("title参数为空，可能导致请求失败")
                 
-                print(f"准备发送邮件请求到: {self.add_email_url}")
-                print(f"请求数据: {json.dumps(request_data, ensure_ascii=False)}")
-                print(f"当前使用的token: {self.auth_token[:20]}...{self.auth_token[-8:]}")
+                self.trace.debug("准备发送邮件请求到: %s", self.add_email_url)
+                self.trace.debug("请求数据: %s", _LazyJson(request_data))
+                self.trace.debug("当前使用的token指纹: %s", _Lazy(lambda 令牌=self.auth_token: MailTrace.令牌指纹(令牌)))
                 
-                response = self.session.post(
-                    self.add_email_url, 
-                    data=json.dumps(request_data),
-                    timeout=30  # 添加超时设置
-                )
+                response = await self._post(self.add_email_url, request_data)
                 
-                print(f"邮件服务响应状态码: {response.status_code}")
-                print(f"邮件服务响应内容: {response.text}")
+                self.trace.debug("邮件服务响应状态码: %s", response.status_code)
+                self.trace.debug("邮件服务响应内容: %s", _Lazy(lambda: response.text))
                 
                 # 处理400错误（请求参数问题）
                 if response.status_code == 400:
                     error_detail = f"收到400 Bad Request错误，请求参数可能有问题"
-                    logger.error(error_detail)
-                    logger.error(f"详细响应内容: {response.text}")
-                    logger.error(f"完整请求数据: {json.dumps(request_data, ensure_ascii=False)}")
+                    self.trace.error("%s", error_detail)
+                    self.trace.error("详细响应内容: %s", response.text)
+                    self.trace.error("完整请求数据: %s", _LazyJson(request_data))
                     
                     # 分析可能的问题：验证用户ID格式
                     target_id = request_data.get('payload', {}).get('target', '')
@@ -877,30 +2521,25 @@ class EmailService:
                     
                     # 尝试修复用户ID格式（如果有问题）
                     if target_id and not str(target_id).strip().isdigit():
-                        import re
-                        cleaned_id = re.sub(r'\D', '', str(target_id))
+                        cleaned_id = self.规范化用户ID(target_id)
                         if cleaned_id:
-                            logger.info(f"尝试自动修复用户ID: {target_id} -> {cleaned_id}")
+                            self.trace.info("尝试自动修复用户ID: %s -> %s", target_id, cleaned_id)
                             payload['target'] = cleaned_id
                             request_data['payload'] = payload
                             # 重新发送请求
-                            logger.info("使用修复后的用户ID重新发送请求...")
-                            response = self.session.post(
-                                self.add_email_url, 
-                                data=json.dumps(request_data),
-                                timeout=30
-                            )
+                            self.trace.info("使用修复后的用户ID重新发送请求...")
+                            response = await self._post(self.add_email_url, request_data)
                             # 检查修复后是否成功
                             if response.status_code == 200:
-                                logger.info("使用修复后的用户ID成功发送请求")
+                                self.trace.info("使用修复后的用户ID成功发送请求")
                                 # 继续处理成功响应
                             else:
-                                logger.error(f"修复用户ID后仍然失败，状态码: {response.status_code}")
+                                self.trace.error("修复用户ID后仍然失败，状态码: %s", response.status_code)
                     
                     # 如果是最后一次尝试，直接返回详细错误
                     if attempt >= self.max_retries:
                         error_msg = f"HTTP错误: 400 Bad Request，请求参数问题: {error_detail}"
-                        logger.error(error_msg)
+                        self.trace.error("%s", error_msg)
                         return {
                             "success": False, 
                             "message": error_msg, 
@@ -912,53 +2551,21 @@ class EmailService:
                         }
                     
                     # 等待后重试
-                    logger.info("等待2秒后重试...")
-                    import time
-                    time.sleep(2)
+                    self.trace.debug("等待2秒后重试...")
+                    await asyncio.sleep(2)
                     continue
                     
-                # 处理401错误（需要刷新token）
+                # 处理401错误：_post已经通过token提供者刷新并重放过一次，仍然401说明刷新无效，不再重试
                 if response.status_code == 401:
-                    print(f"收到401未授权错误，token可能已过期")
-                    
-                    # 如果是最后一次尝试，直接返回错误
-                    if attempt >= self.max_retries:
-                        error_msg = f"HTTP错误: 401 Unauthorized，已尝试刷新token但仍失败"
-                        print(error_msg)
-                        return {"success": False, "message": error_msg, "response": response.text}
-                    
-                    # 立即尝试刷新token
-                    print("尝试自动刷新token...")
-                    refresh_result = await self._refresh_all_games()
-                    
-                    if refresh_result.get("success") and refresh_result.get("token"):
-                        new_token = refresh_result["token"]
-                        print(f"成功刷新token，后10位: {new_token[-10:]}")
-                        self._update_auth_headers(new_token)
-                        # 立即重试请求
-                        continue
-                    else:
-                        print(f"token刷新失败: {refresh_result.get('message')}")
-                    
-                    # 尝试从cookie中获取新token（如果有）
-                    if 'token' in self.session.cookies:
-                        new_token = self.session.cookies['token']
-                        if new_token and new_token != self.auth_token:
-                            print(f"从cookie中获取到新token")
-                            self._update_auth_headers(new_token)
-                            continue  # 重试请求
-                    
-                    # 添加延迟后重试
-                    print(f"等待2秒后重试...")
-                    import time
-                    time.sleep(2)
-                    continue
+                    error_msg = "HTTP错误: 401 Unauthorized，已尝试刷新token但仍失败" if self.token_provider is not None else "HTTP错误: 401 Unauthorized"
+                    self.trace.error("%s", error_msg)
+                    return {"success": False, "message": error_msg, "response": response.text, "status_code": 401, "error_code": "TOKEN_EXPIRED", "need_refresh": True}
                 
                 # 处理其他状态码
                 if response.status_code == 200:
                     try:
                         result = response.json()
-                        print(f"响应解析结果: {result}")
+                        self.trace.debug("响应解析结果: %s", result)
                         
                         # 返回统一格式的结果
                         success = result.get("result") == 0
@@ -977,13 +2584,13 @@ class EmailService:
                             # 根据抓包数据的特殊处理：即使没有row_id，只要添加成功，也认为是成功的
                             # 在这种情况下，我们不尝试触发发送，因为没有row_id，但邮件实际上已经被添加
                             if not row_id:
-                                print(f"Add接口响应中未包含row_id，但添加操作成功")
-                                print(f"响应结构: {result.keys()}")
+                                self.trace.debug("Add接口响应中未包含row_id，但添加操作成功")
+                                self.trace.debug("响应结构: %s", list(result.keys()))
                                 # 检查是否有dialog_box字段，这是抓包数据中看到的格式
                                 if 'dialog_box' in result:
-                                    print(f"检测到dialog_box字段，这与抓包数据格式匹配")
+                                    self.trace.debug("检测到dialog_box字段，这与抓包数据格式匹配")
                             else:
-                                print(f"成功提取到row_id: {row_id}")
+                                self.trace.debug("成功提取到row_id: %s", row_id)
                         
                         return {
                             "success": success,
@@ -995,56 +2602,649 @@ class EmailService:
                         }
                     except json.JSONDecodeError:
                         error_msg = f"响应解析失败: {response.text}"
-                        print(error_msg)
+                        self.trace.warning("%s", error_msg)
                         return {"success": False, "message": error_msg}
+                elif response.status_code == 429:
+                    # _限流发送已经按Retry-After等待重试过，仍被限流时交给调用方记录失败日志稍后重发
+                    error_msg = "HTTP错误: 429 Too Many Requests，后台持续限流"
+                    self.trace.warning("%s", error_msg)
+                    return {"success": False, "message": error_msg, "response": response.text, "status_code": 429, "error_code": "THROTTLED"}
                 else:
                     error_msg = f"HTTP错误: {response.status_code} {response.reason}"
-                    print(error_msg)
+                    self.trace.warning("%s", error_msg)
                     return {"success": False, "message": error_msg, "response": response.text}
                     
+            except CircuitOpenError as e:
+                # 熔断期间不再重试，交给调用方记录失败日志，恢复后可重发
+                self.trace.warning("%s", e)
+                return {"success": False, "message": str(e), "error_code": "CIRCUIT_OPEN"}
             except requests.Timeout:
                 error_msg = f"请求超时 (尝试 {attempt + 1}/{self.max_retries + 1})"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 if attempt >= self.max_retries:
                     return {"success": False, "message": error_msg}
-                print("等待3秒后重试...")
-                import time
-                time.sleep(3)
+                self.trace.debug("等待3秒后重试...")
+                await asyncio.sleep(3)
             except requests.ConnectionError:
                 error_msg = f"连接错误 (尝试 {attempt + 1}/{self.max_retries + 1})"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 if attempt >= self.max_retries:
                     return {"success": False, "message": error_msg}
-                print("等待3秒后重试...")
-                import time
-                time.sleep(3)
+                self.trace.debug("等待3秒后重试...")
+                await asyncio.sleep(3)
             except requests.RequestException as e:
                 error_msg = f"HTTP请求错误: {str(e)} (尝试 {attempt + 1}/{self.max_retries + 1})"
-                print(error_msg)
+                self.trace.warning("%s", error_msg)
                 if hasattr(e, 'response') and e.response is not None:
                     error_msg += f", 状态码: {e.response.status_code}, 响应: {e.response.text}"
                     # 检查是否是401错误
                     if e.response.status_code == 401 and attempt < self.max_retries:
-                        print("401错误，需要刷新token")
+                        self.trace.warning("401错误，需要刷新token")
                         continue
                 if attempt >= self.max_retries:
                     return {"success": False, "message": error_msg}
-                print("等待2秒后重试...")
-                import time
-                time.sleep(2)
+                self.trace.debug("等待2秒后重试...")
+                await asyncio.sleep(2)
+            except Exception as e:
+                error_msg = f"添加邮件异常: {str(e)} (尝试 {attempt + 1}/{self.max_retries + 1})"
+                self.trace.error("%s", error_msg, exc_info=True)
+                if attempt >= self.max_retries:
+                    return {"success": False, "message": error_msg}
+                self.trace.debug("等待2秒后重试...")
+                await asyncio.sleep(2)
+        
+        # 所有尝试都失败
+        return {"success": False, "message": "所有尝试均失败，请检查token是否有效"}
+
+# 邮件失败日志模块
+class EmailFailureJournal:
+    """奖励邮件发送失败日志（JSON Lines格式）
+
+    记录操作只把条目放入队列，由后台线程批量写入文件，不阻塞事件循环；
+    文件超过大小上限时自动轮转。提供按用户、游戏、错误码查询以及标记重发结果的接口。
+    """
+
+    def __init__(self, 日志目录, 文件名="email_failures.jsonl", 单文件上限=5 * 1024 * 1024, 保留份数=5, 批量间隔=1.0):
+        """
+        初始化失败日志
+
+        Args:
+            日志目录 (str): 日志文件所在目录
+            文件名 (str): 当前日志文件名，轮转后的文件追加 .1 .2 ... 后缀
+            单文件上限 (int): 单个日志文件的最大字节数
+            保留份数 (int): 保留的轮转文件数量
+            批量间隔 (float): 后台线程合并写入的最长等待秒数
+        """
+        self.日志目录 = 日志目录
+        self.日志文件 = os.path.join(日志目录, 文件名)
+        self.单文件上限 = 单文件上限
+        self.保留份数 = 保留份数
+        self.批量间隔 = 批量间隔
+        self._队列 = queue.Queue()
+        self._线程 = None
+        self._线程锁 = threading.Lock()
+        self._停止 = threading.Event()
+
+    def _确保线程(self):
+        if self._线程 is not None and self._线程.is_alive():
+            return
+        with self._线程锁:
+            if self._线程 is None or not self._线程.is_alive():
+                self._停止.clear()
+                self._线程 = threading.Thread(target=self._写入循环, name="email-failure-journal", daemon=True)
+                self._线程.start()
+
+    def 记录(self, user_id, reward_info, error_msg, 游戏名称=None, error_code=None, 重发参数=None):
+        """
+        记录一条发送失败信息（非阻塞）
+
+        Returns:
+            str: 记录ID
+        """
+        条目 = {
+            "id": uuid.uuid4().hex[:12],
+            "类型": "失败",
+            "时间": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "用户": str(user_id),
+            "游戏": 游戏名称,
+            "错误码": error_code,
+            "错误": str(error_msg),
+            "奖励": reward_info,
+            "重发参数": 重发参数
+        }
+        self._确保线程()
+        self._队列.put(条目)
+        return 条目["id"]
+
+    def 标记已重发(self, 记录ID, 成功: bool):
+        """追加一条重发结果记录，已重发的记录不再出现在未处理列表中（重发失败时会产生新的失败记录）"""
+        self._确保线程()
+        self._队列.put({
+            "id": uuid.uuid4().hex[:12],
+            "类型": "重发成功" if 成功 else "重发失败",
+            "时间": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "原记录": 记录ID
+        })
+
+    def _写入循环(self):
+        while not self._停止.is_set() or not self._队列.empty():
+            try:
+                批次 = [self._队列.get(timeout=self.批量间隔)]
+            except queue.Empty:
+                continue
+            # 合并队列中已有的条目，一次打开文件写入
+            while True:
+                try:
+                    批次.append(self._队列.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._写入批次(批次)
             except Exception as e:
-                error_msg = f"添加邮件异常: {str(e)} (尝试 {attempt + 1}/{self.max_retries + 1})"
-                print(error_msg)
-                import traceback
-                print(f"异常堆栈: {traceback.format_exc()}")
-                if attempt >= self.max_retries:
-                    return {"success": False, "message": error_msg}
-                print("等待2秒后重试...")
-                import time
-                time.sleep(2)
-        
-        # 所有尝试都失败
-        return {"success": False, "message": "所有尝试均失败，请检查token是否有效"}
+                logger.error(f"写入邮件失败日志异常: {e}")
+            finally:
+                for _ in 批次:
+                    self._队列.task_done()
+
+    def _写入批次(self, 批次):
+        os.makedirs(self.日志目录, exist_ok=True)
+        内容 = "".join(json.dumps(条目, ensure_ascii=False, default=str) + "\n" for 条目 in 批次)
+        try:
+            当前大小 = os.path.getsize(self.日志文件)
+        except OSError:
+            当前大小 = 0
+        if 当前大小 and 当前大小 + len(内容.encode('utf-8')) > self.单文件上限:
+            self._轮转()
+        with open(self.日志文件, "a", encoding="utf-8") as f:
+            f.write(内容)
+
+    def _轮转(self):
+        for 序号 in range(self.保留份数 - 1, 0, -1):
+            源 = f"{self.日志文件}.{序号}"
+            if os.path.exists(源):
+                os.replace(源, f"{self.日志文件}.{序号 + 1}")
+        if self.保留份数 > 0:
+            os.replace(self.日志文件, f"{self.日志文件}.1")
+        else:
+            os.remove(self.日志文件)
+
+    def 刷新(self, 超时=5.0):
+        """等待队列中的条目全部写入文件"""
+        if self._线程 is None:
+            return
+        截止 = time.monotonic() + 超时
+        while self._队列.unfinished_tasks and time.monotonic() < 截止:
+            time.sleep(0.01)
+
+    def 关闭(self):
+        """写完剩余条目并停止后台线程"""
+        self._停止.set()
+        if self._线程 is not None:
+            self._线程.join(timeout=5)
+
+    def _读取全部(self):
+        """按时间从旧到新读取所有日志文件（含轮转文件）"""
+        文件列表 = [f"{self.日志文件}.{序号}" for 序号 in range(self.保留份数, 0, -1)] + [self.日志文件]
+        for 文件 in 文件列表:
+            if not os.path.exists(文件):
+                continue
+            with open(文件, "r", encoding="utf-8") as f:
+                for 行 in f:
+                    行 = 行.strip()
+                    if not 行:
+                        continue
+                    try:
+                        yield json.loads(行)
+                    except json.JSONDecodeError:
+                        continue
+
+    def 查询(self, user_id=None, 游戏名称=None, error_code=None, 仅未处理=True, 数量上限=100):
+        """
+        查询失败记录（会读取文件，应在线程中调用）
+
+        Args:
+            user_id (str): 按用户筛选
+            游戏名称 (str): 按游戏筛选
+            error_code (str): 按错误码筛选
+            仅未处理 (bool): 是否排除已重发过的记录
+            数量上限 (int): 最多返回的记录数，返回最新的记录
+
+        Returns:
+            list: 失败记录列表，从新到旧
+        """
+        self.刷新()
+        失败记录 = []
+        已处理 = set()
+        for 条目 in self._读取全部():
+            if 条目.get("类型") in ("重发成功", "重发失败"):
+                已处理.add(条目.get("原记录"))
+                continue
+            if 条目.get("类型") != "失败":
+                continue
+            if user_id is not None and 条目.get("用户") != str(user_id):
+                continue
+            if 游戏名称 is not None and 条目.get("游戏") != 游戏名称:
+                continue
+            if error_code is not None and 条目.get("错误码") != error_code:
+                continue
+            失败记录.append(条目)
+        if 仅未处理:
+            失败记录 = [条目 for 条目 in 失败记录 if 条目["id"] not in 已处理]
+        return list(reversed(失败记录))[:数量上限]
+
+# 抽奖引擎模块
+class DrawEngine:
+    """可复现的抽奖引擎
+
+    每场抽奖使用独立的随机种子。参与者的抽签值由以种子为密钥的 BLAKE2b 消息认证码推导，
+    与参与者顺序和全局随机数状态无关，保存种子即可随时复核开奖结果。
+    加权抽取采用 Efraimidis-Spirakis 算法，只维护大小为获奖人数的小顶堆，
+    对参与者单次遍历即可完成，参与者可以是任意可迭代对象（无需先复制成列表）。
+    权重均为1时排序键等价于抽签值本身，未加权的开奖记录始终可以按 blake2b-es-v1 复核。
+    """
+
+    算法 = "blake2b-es-v1"
+
+    @staticmethod
+    def 生成种子() -> str:
+        """生成一个密码学安全的抽奖种子"""
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def _密钥(种子: str) -> bytes:
+        # BLAKE2b的密钥最长64字节，先压缩种子保证任意长度的种子都可用
+        return hashlib.sha256(str(种子).encode('utf-8')).digest()
+
+    @staticmethod
+    def _抽签值(密钥: bytes, 参与者ID) -> float:
+        摘要 = hashlib.blake2b(str(参与者ID).encode('utf-8'), key=密钥, digest_size=8).digest()
+        # 取前53位，保证转换为浮点数时不丢失精度
+        整数值 = int.from_bytes(摘要, 'big') >> 11
+        return (整数值 + 0.5) / (1 << 53)
+
+    @classmethod
+    def 抽签值(cls, 种子: str, 参与者ID: str) -> float:
+        """计算参与者在指定种子下的抽签值，范围为(0, 1)"""
+        return cls._抽签值(cls._密钥(种子), 参与者ID)
+
+    @classmethod
+    def 抽取(cls, 种子: str, 参与者, 获奖人数: int, 权重=None) -> list:
+        """从参与者中抽取获奖者
+
+        Args:
+            种子: 本场抽奖的随机种子
+            参与者: 参与者ID的可迭代对象，可以是生成器
+            获奖人数: 需要抽取的人数，参与者不足时全员获奖
+            权重: 可选，参与者ID到权重的字典或函数，权重<=0的参与者不参与抽取
+
+        Returns:
+            list: 按中签顺序排列的获奖者ID列表
+        """
+        if 获奖人数 <= 0:
+            return []
+
+        密钥 = cls._密钥(种子)
+        堆 = []
+        for 参与者ID in 参与者:
+            if 权重 is None:
+                当前权重 = 1.0
+            elif callable(权重):
+                当前权重 = float(权重(参与者ID))
+            else:
+                当前权重 = float(权重.get(参与者ID, 1))
+            if 当前权重 <= 0:
+                continue
+
+            # key = u^(1/w)，取对数避免下溢，值越大越优先
+            键 = math.log(cls._抽签值(密钥, 参与者ID)) / 当前权重
+            if len(堆) < 获奖人数:
+                heapq.heappush(堆, (键, 参与者ID))
+            elif 键 > 堆[0][0]:
+                heapq.heapreplace(堆, (键, 参与者ID))
+
+        return [参与者ID for _, 参与者ID in sorted(堆, reverse=True)]
+
+    @classmethod
+    def 多奖项抽取(cls, 种子: str, 参与者, 奖项列表, 权重=None) -> list:
+        """一次遍历完成多奖项抽取，按中签顺序依次分配奖项
+
+        Args:
+            种子: 本场抽奖的随机种子
+            参与者: 参与者ID的可迭代对象
+            奖项列表: [(奖项名称, 名额)] 列表，靠前的奖项优先分配
+            权重: 同抽取()
+
+        Returns:
+            list: [(获奖者ID, 奖项名称)] 列表
+        """
+        总名额 = sum(max(0, int(名额)) for _, 名额 in 奖项列表)
+        获奖者 = iter(cls.抽取(种子, 参与者, 总名额, 权重))
+        结果 = []
+        for 奖项名称, 名额 in 奖项列表:
+            for _ in range(max(0, int(名额))):
+                获奖者ID = next(获奖者, None)
+                if 获奖者ID is None:
+                    return 结果
+                结果.append((获奖者ID, 奖项名称))
+        return 结果
+
+# 抽奖索引模块
+class LotteryIndex:
+    """进行中抽奖的内存缓存及二级索引
+
+    抽奖数据只在首次使用时从文件加载一次，之后的查询全部走内存索引：
+    按游戏名称、按群聊ID分组，并按截止时间排序。发起、参与、开奖时同步更新索引并写回文件。
+    """
+
+    def __init__(self, 文件名: str = "抽奖数据存储.json"):
+        self.文件名 = 文件名
+        self.抽奖数据 = None
+        self.按游戏 = {}
+        self.按群聊 = {}
+        # (截止时间, 抽奖ID) 有序列表，截止时间格式为"%Y-%m-%d %H:%M:%S"，字符串顺序即时间顺序
+        self.按截止时间 = []
+        # 启动后的后台预加载线程和事件循环可能同时触发加载，只加载一次
+        self._加载锁 = threading.Lock()
+        self._已加载 = False
+
+    def _确保已加载(self):
+        if self._已加载:
+            return
+        with self._加载锁:
+            if self._已加载:
+                return
+            self.抽奖数据 = {}
+            for 抽奖ID, 数据 in JsonHandler.读取Json字典(self.文件名).items():
+                if isinstance(数据, dict):
+                    self._加入索引(抽奖ID, 数据)
+            self._已加载 = True
+            logger.info(f"抽奖索引已加载，共{len(self.抽奖数据)}个进行中的抽奖")
+
+    def 预加载(self):
+        """提前加载抽奖数据，供启动后的后台线程调用"""
+        self._确保已加载()
+
+    def _加入索引(self, 抽奖ID, 数据):
+        self.抽奖数据[抽奖ID] = 数据
+        self.按游戏.setdefault(数据.get('游戏名称', ''), set()).add(抽奖ID)
+        self.按群聊.setdefault(str(数据.get('群聊ID') or ''), set()).add(抽奖ID)
+        bisect.insort(self.按截止时间, (数据.get('截止时间', ''), 抽奖ID))
+
+    def _移出索引(self, 抽奖ID):
+        数据 = self.抽奖数据.pop(抽奖ID, None)
+        if 数据 is None:
+            return None
+        for 索引, 键 in ((self.按游戏, 数据.get('游戏名称', '')), (self.按群聊, str(数据.get('群聊ID') or ''))):
+            集合 = 索引.get(键)
+            if 集合 is not None:
+                集合.discard(抽奖ID)
+                if not 集合:
+                    del 索引[键]
+        条目 = (数据.get('截止时间', ''), 抽奖ID)
+        位置 = bisect.bisect_left(self.按截止时间, 条目)
+        if 位置 < len(self.按截止时间) and self.按截止时间[位置] == 条目:
+            del self.按截止时间[位置]
+        return 数据
+
+    def 保存(self) -> bool:
+        """将当前抽奖数据写回文件"""
+        self._确保已加载()
+        return JsonHandler.写入Json字典(self.文件名, self.抽奖数据)
+
+    def 获取(self, 抽奖ID):
+        """按抽奖ID获取抽奖数据，不存在时返回None"""
+        self._确保已加载()
+        return self.抽奖数据.get(抽奖ID)
+
+    def 添加(self, 抽奖ID, 数据) -> bool:
+        """发起抽奖：加入索引并保存"""
+        self._确保已加载()
+        if 抽奖ID in self.抽奖数据:
+            self._移出索引(抽奖ID)
+        self._加入索引(抽奖ID, 数据)
+        return self.保存()
+
+    def 参与(self, 抽奖ID, 用户ID) -> bool:
+        """参与抽奖：追加参与者并保存，已参与或抽奖不存在时返回False"""
+        数据 = self.获取(抽奖ID)
+        if 数据 is None:
+            return False
+        参与者列表 = 数据.setdefault('参与者', [])
+        if 用户ID in 参与者列表:
+            return False
+        参与者列表.append(用户ID)
+        self.保存()
+        return True
+
+    def 移除(self, 抽奖ID):
+        """开奖或取消：移出索引并保存，返回被移除的抽奖数据"""
+        self._确保已加载()
+        数据 = self._移出索引(抽奖ID)
+        if 数据 is not None:
+            self.保存()
+        return 数据
+
+    def 查询(self, 群聊ID=None, 游戏名称=None, 页码: int = 1, 每页数量: int = 5):
+        """按群聊和/或游戏筛选抽奖，按截止时间排序并分页
+
+        Returns:
+            tuple: ([(抽奖ID, 数据)] 当前页列表, 符合条件的总数, 总页数)
+        """
+        self._确保已加载()
+        候选 = None
+        if 群聊ID is not None:
+            候选 = self.按群聊.get(str(群聊ID), set())
+        if 游戏名称 is not None:
+            游戏候选 = self.按游戏.get(游戏名称, set())
+            候选 = 游戏候选 if 候选 is None else 候选 & 游戏候选
+
+        if 候选 is None:
+            有序ID = [抽奖ID for _, 抽奖ID in self.按截止时间]
+        else:
+            有序ID = [抽奖ID for _, 抽奖ID in self.按截止时间 if 抽奖ID in 候选]
+
+        每页数量 = max(1, 每页数量)
+        总数 = len(有序ID)
+        总页数 = max(1, (总数 + 每页数量 - 1) // 每页数量)
+        页码 = min(max(1, 页码), 总页数)
+        当前页 = 有序ID[(页码 - 1) * 每页数量:页码 * 每页数量]
+        return [(抽奖ID, self.抽奖数据[抽奖ID]) for 抽奖ID in 当前页], 总数, 总页数
+
+# 排行榜模块
+class _SkipNode:
+    __slots__ = ("键", "后继", "跨度")
+
+    def __init__(self, 键, 层数):
+        self.键 = 键
+        self.后继 = [None] * 层数
+        # 跨度[i]：沿第i层指针前进一步跨过的元素个数，用于按名次定位
+        self.跨度 = [0] * 层数
+
+
+class IndexableSkiplist:
+    """
+    带跨度的可索引跳表（与Redis有序集合的结构相同）
+
+    插入、删除、按键查名次、按名次取元素都是期望 O(log n)，键需要可比较且互不相同。
+    """
+
+    最大层数 = 32
+    晋升概率 = 0.25
+
+    def __init__(self, 随机数=None):
+        self._头 = _SkipNode(None, self.最大层数)
+        self._层数 = 1
+        self._长度 = 0
+        self._随机数 = 随机数 or random.Random()
+
+    def __len__(self):
+        return self._长度
+
+    def _随机层数(self):
+        层数 = 1
+        while 层数 < self.最大层数 and self._随机数.random() < self.晋升概率:
+            层数 += 1
+        return 层数
+
+    def 批量构建(self, 有序键列表):
+        """用已排序且不重复的键 O(n) 重建跳表"""
+        self.__init__(self._随机数)
+        末节点 = [self._头] * self.最大层数
+        末位置 = [0] * self.最大层数
+        for 位置, 键 in enumerate(有序键列表, 1):
+            层数 = self._随机层数()
+            self._层数 = max(self._层数, 层数)
+            节点 = _SkipNode(键, 层数)
+            for i in range(层数):
+                末节点[i].后继[i] = 节点
+                末节点[i].跨度[i] = 位置 - 末位置[i]
+                末节点[i] = 节点
+                末位置[i] = 位置
+            self._长度 = 位置
+        for i in range(self._层数):
+            末节点[i].跨度[i] = self._长度 - 末位置[i]
+
+    def 插入(self, 键):
+        更新 = [None] * self.最大层数
+        名次 = [0] * self.最大层数
+        节点 = self._头
+        for i in reversed(range(self._层数)):
+            名次[i] = 名次[i + 1] if i + 1 < self._层数 else 0
+            while 节点.后继[i] is not None and 节点.后继[i].键 < 键:
+                名次[i] += 节点.跨度[i]
+                节点 = 节点.后继[i]
+            更新[i] = 节点
+        层数 = self._随机层数()
+        if 层数 > self._层数:
+            for i in range(self._层数, 层数):
+                名次[i] = 0
+                更新[i] = self._头
+                self._头.跨度[i] = self._长度
+            self._层数 = 层数
+        新节点 = _SkipNode(键, 层数)
+        for i in range(层数):
+            新节点.后继[i] = 更新[i].后继[i]
+            更新[i].后继[i] = 新节点
+            新节点.跨度[i] = 更新[i].跨度[i] - (名次[0] - 名次[i])
+            更新[i].跨度[i] = 名次[0] - 名次[i] + 1
+        for i in range(层数, self._层数):
+            更新[i].跨度[i] += 1
+        self._长度 += 1
+
+    def 删除(self, 键) -> bool:
+        更新 = [None] * self.最大层数
+        节点 = self._头
+        for i in reversed(range(self._层数)):
+            while 节点.后继[i] is not None and 节点.后继[i].键 < 键:
+                节点 = 节点.后继[i]
+            更新[i] = 节点
+        节点 = 节点.后继[0]
+        if 节点 is None or 节点.键 != 键:
+            return False
+        for i in range(self._层数):
+            if 更新[i].后继[i] is 节点:
+                更新[i].跨度[i] += 节点.跨度[i] - 1
+                更新[i].后继[i] = 节点.后继[i]
+            else:
+                更新[i].跨度[i] -= 1
+        while self._层数 > 1 and self._头.后继[self._层数 - 1] is None:
+            self._层数 -= 1
+        self._长度 -= 1
+        return True
+
+    def 小于个数(self, 键) -> int:
+        """严格小于键的元素个数，键不必在表中"""
+        个数 = 0
+        节点 = self._头
+        for i in reversed(range(self._层数)):
+            while 节点.后继[i] is not None and 节点.后继[i].键 < 键:
+                个数 += 节点.跨度[i]
+                节点 = 节点.后继[i]
+        return 个数
+
+    def 遍历(self, 起始名次=1):
+        """从第起始名次（从1开始）个元素开始按顺序迭代键"""
+        if 起始名次 < 1 or 起始名次 > self._长度:
+            return
+        已跨过 = 0
+        节点 = self._头
+        for i in reversed(range(self._层数)):
+            while 节点.后继[i] is not None and 已跨过 + 节点.跨度[i] <= 起始名次:
+                已跨过 += 节点.跨度[i]
+                节点 = 节点.后继[i]
+        while 节点 is not None:
+            yield 节点.键
+            节点 = 节点.后继[0]
+
+
+class ActivityRanking:
+    """
+    活跃度排行榜
+
+    以 (-活跃度, 用户ID) 为键保存在可索引跳表中，活跃度变化时删除旧键、插入新键，
+    前N名和个人名次查询都是 O(log n)，不需要每次排序整份活跃度数据。首次使用时从玩家数据构建。
+    """
+
+    def __init__(self, 玩家数据: "PlayerStore"):
+        self.玩家数据 = 玩家数据
+        self.活跃度 = None
+        self._跳表 = IndexableSkiplist()
+
+    def _确保已加载(self):
+        if self.活跃度 is not None:
+            return
+        self.活跃度 = {用户ID: 记录.活跃度 for 用户ID, 记录 in self.玩家数据.所有玩家() if 记录.活跃度 > 0}
+        self._跳表.批量构建(sorted((-值, 用户ID) for 用户ID, 值 in self.活跃度.items()))
+        logger.info(f"活跃度排行已加载，共{len(self.活跃度)}名玩家")
+
+    def 更新(self, 用户ID, 活跃度: int):
+        """活跃度变化后调用，增量调整排行"""
+        self._确保已加载()
+        用户ID = str(用户ID)
+        旧值 = self.活跃度.get(用户ID)
+        if 旧值 == 活跃度:
+            return
+        if 旧值 is not None:
+            self._跳表.删除((-旧值, 用户ID))
+        self.活跃度[用户ID] = 活跃度
+        self._跳表.插入((-活跃度, 用户ID))
+
+    def 数量(self) -> int:
+        self._确保已加载()
+        return len(self._跳表)
+
+    def 移除(self, 用户ID):
+        """玩家数据被删除后调用"""
+        self._确保已加载()
+        旧值 = self.活跃度.pop(str(用户ID), None)
+        if 旧值 is not None:
+            self._跳表.删除((-旧值, str(用户ID)))
+
+    def 名次(self, 用户ID):
+        """
+        返回 (名次, 活跃度)，活跃度相同的玩家名次并列；未上榜时返回 (None, 0)
+        """
+        self._确保已加载()
+        值 = self.活跃度.get(str(用户ID))
+        if 值 is None:
+            return None, 0
+        return self._跳表.小于个数((-值, "")) + 1, 值
+
+    def 前列(self, 起始名次=1, 数量=10):
+        """返回从起始名次开始的 [(名次, 用户ID, 活跃度)]，并列的玩家名次相同"""
+        self._确保已加载()
+        结果 = []
+        上一个值 = None
+        名次 = None
+        for 序号, (负值, 用户ID) in enumerate(self._跳表.遍历(起始名次), 起始名次):
+            if len(结果) >= 数量:
+                break
+            if 负值 != 上一个值:
+                名次 = 序号 if 上一个值 is not None else self._跳表.小于个数((负值, "")) + 1
+                上一个值 = 负值
+            结果.append((名次, 用户ID, -负值))
+        return 结果
+
 
 # 主程序功能整合
 @register("sce_spark_game", "开发者", "SCE星火游戏插件", "1.3.1")
@@ -1113,6 +3313,55 @@ class MyPlugin(Star):
             }
            
         }
+        # 调度用的独立随机数生成器，与抽奖引擎、全局random互不影响
+        self._调度随机数 = random.Random()
+        # 进行中抽奖的内存索引，首次使用时加载
+        self.抽奖索引 = LotteryIndex()
+        # 玩家数据（绑定ID、签到、活跃度），首次使用时加载，必要时从旧版文件迁移；
+        # 还没有分片清单时按初始分片数拆分，之后用「玩家数据分片」指令在线调整
+        self.玩家数据 = PlayerStore(初始分片数=16)
+        # 活跃度排行榜，签到增加活跃度时增量更新
+        self.活跃度排行 = ActivityRanking(self.玩家数据)
+        self.排行榜每页人数 = 10
+        # 抽奖列表查询每页展示的抽奖数量
+        self.抽奖列表每页数量 = 5
+        # 每个项目向后台发送请求的初始速率（请求/秒）。0为不限速，后台返回429或Retry-After后才自动减速，
+        # 之后逐步恢复；后台有明确的速率上限时可以直接设为该值
+        self.邮件请求速率 = 0
+        # 奖励邮件失败日志，后台线程批量写入
+        self.邮件失败日志 = EmailFailureJournal(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs"))
+        # 同一时间只允许一次重发，避免两次重发读到相同的未处理记录而重复发放奖励
+        self._重发锁 = asyncio.Lock()
+        # 指令耗时超过阈值（秒）时，把各子步骤的耗时树写入慢操作日志
+        追踪器.慢操作阈值 = 3.0
+        追踪器.日志文件 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "slow_ops.log")
+        # 共享的token提供者，各项目的邮件服务收到401时通过它刷新token，并发刷新合并为一次
+        self.token_provider = TokenProvider(lambda: getattr(self, "current_token", None) or self.auth_token, self._刷新令牌)
+        # 按项目ID复用的邮件服务实例
+        self.邮件服务 = {}
+        # 等待开奖的后台任务，用于统计待开奖数量
+        self.开奖任务 = set()
+        # 签到后在后台发放奖励邮件的任务
+        self.发奖任务 = set()
+        # 数据保质期文件中已确认的日期，与当天一致时跳过检查
+        self._已确认日期 = None
+        # 玩家数据变更日志每隔这么多秒合并进快照，日志条数达到阈值时提前合并
+        self.玩家数据压缩间隔 = 300
+        self.玩家数据压缩阈值 = 5000
+        # 数据清理策略：签到记录保留的天数；未绑定ID且超过这么多天未签到的玩家整条删除；
+        # 每隔这么多秒在后台自动清理一次，0为只在管理员发送「清理数据」时清理
+        self.签到记录保留天数 = 7
+        self.不活跃玩家天数 = 180
+        self.数据清理间隔 = 24 * 3600
+        # 同一用户重复发送相同的签到、查看ID、参与抽奖指令时，这么多秒内不再执行，0为关闭
+        指令节流.窗口 = 5.0
+        # 指标导出：大于0时每隔这么多秒把指标以Prometheus文本格式写入数据目录下的指标文件，0为不导出
+        self.指标导出间隔 = 0
+        self.指标导出文件 = "插件指标.prom"
+        # 开奖公告每页展示的获奖者数量，获奖者较多时分页发送，避免刷屏
+        self.开奖公告每页人数 = 50
+        # 开奖记录，每场开奖追加一行JSON（抽奖ID、种子、算法、参与者、获奖者、发放结果），只追加不改写
+        self.开奖记录文件名 = "抽奖开奖记录.jsonl"
         # 加载current_token（可能与auth_token不同，用于实际请求）
         self._load_token()
 
@@ -1134,26 +3383,37 @@ class MyPlugin(Star):
             # 启动定时任务，每15分钟刷新一次网页并更新token
             self.refresh_task = asyncio.create_task(self._schedule_web_refresh())
             
+            # 启动时的token刷新和数据文件校验都在后台进行，不阻塞插件就绪
+            self.startup_refresh_task = asyncio.create_task(self._refresh_all_games())
+            self.warmup_task = asyncio.create_task(asyncio.to_thread(self._后台预热))
+            
+            # 定期在后台把玩家数据日志合并进快照
+            self.compaction_task = asyncio.create_task(self._schedule_player_compaction())
+            
+            # 按保留策略定期清理玩家数据
+            if self.数据清理间隔 > 0:
+                self.retention_task = asyncio.create_task(self._schedule_retention())
+            
+            # 按配置定期导出指标
+            if self.指标导出间隔 > 0:
+                self.metrics_task = asyncio.create_task(self._schedule_metrics_dump())
+            
             logger.info("SCE星火游戏插件初始化成功")
         except Exception as e:
             logger.error(f"SCE星火游戏插件初始化失败: {e}")
     
+    # 插件使用的数据文件，玩家数据和抽奖数据由各自的存储在首次使用时加载
+    json_files = [
+        "抽奖数据存储.json",
+        "数据保质期.json",
+        "玩家提醒设置.json",
+        "玩家每日任务数据.json",
+        "系统token存储.json"
+    ]
+    
     def _check_and_create_json_files(self):
-        """检查并创建所有必要的JSON文件"""
-        # 需要检查的JSON文件列表
-        json_files = [
-            "抽奖数据存储.json",
-            "数据保质期.json",
-            "玩家今天是否签到过.json",
-            "玩家提醒设置.json",
-            "玩家每日任务数据.json",
-            "玩家活跃度数据.json",
-            "玩家绑定id数据存储.json",
-            "玩家连续签到数据.json",
-            "系统token存储.json"
-        ]
-        
-        for file_name in json_files:
+        """创建缺失的JSON文件；只检查文件是否存在，内容的校验在后台预热时进行"""
+        for file_name in self.json_files:
             try:
                 # 获取文件路径
                 file_path = JsonHandler.获取文件路径(file_name, True)
@@ -1164,20 +3424,29 @@ class MyPlugin(Star):
                     with open(file_path, 'w', encoding='utf-8') as f:
                         json.dump({}, f, ensure_ascii=False, indent=2)
                     logger.info(f"已创建新的JSON文件: {file_name}")
-                else:
-                    # 确保文件内容是有效的JSON
-                    try:
-                        data = JsonHandler.读取Json字典(file_name)
-                        if data is None:
-                            # 如果读取失败，重写为空JSON
-                            with open(file_path, 'w', encoding='utf-8') as f:
-                                json.dump({}, f, ensure_ascii=False, indent=2)
-                            logger.warning(f"已修复损坏的JSON文件: {file_name}")
-                    except Exception as e:
-                        logger.error(f"检查JSON文件内容失败 {file_name}: {e}")
             except Exception as e:
                 logger.error(f"处理JSON文件 {file_name} 时出错: {e}")
     
+    def _后台预热(self):
+        """在后台线程中校验数据文件并预先加载玩家数据和抽奖索引，使首条指令不必等待加载"""
+        开始 = time.perf_counter()
+        for file_name in self.json_files:
+            file_path = JsonHandler.获取文件路径(file_name)
+            try:
+                with open(file_path, 'rb') as f:
+                    内容 = Serializer.解码(f.read())
+                if 内容 is not None and not isinstance(内容, dict):
+                    raise ValueError("顶层不是对象")
+            except FileNotFoundError:
+                continue
+            except (ValueError, OSError, zlib.error) as e:
+                # 读取时损坏的文件按空数据处理，下次保存会覆盖，这里只提示，不抢先改写文件
+                指标.计数("json_corrupt_files_total", file=file_name)
+                logger.warning(f"JSON文件内容无效，读取时将按空数据处理: {file_name}, {e}")
+        self.玩家数据.预加载()
+        self.抽奖索引.预加载()
+        logger.info(f"数据文件后台校验和预加载完成，耗时{time.perf_counter() - 开始:.2f}秒")
+    
     def _parse_token_expiry(self, token):
         """解析JWT token中的过期时间"""
         try:
@@ -1187,7 +3456,6 @@ class MyPlugin(Star):
                 return None
             
             # 解码base64的payload部分
-            import base64
             payload = parts[1]
             # 确保padding正确
             payload += '=' * ((4 - len(payload) % 4) % 4)
@@ -1231,28 +3499,10 @@ class MyPlugin(Star):
             token_data = Json.读取Json字典(self.token_file)
             token = token_data.get("token", self.auth_token)
             
-            # 验证token有效性
+            # 验证token有效性；是否需要刷新由调用方决定（启动时在后台刷新，定时任务按剩余有效期刷新）
             if self._is_token_valid(token):
                 self.current_token = token
                 logger.info(f"已加载有效token，长度: {len(token)} 字符")
-                
-                # 检查过期时间并提前刷新
-                expiry = self._parse_token_expiry(token)
-                if expiry:
-                    time_until_expiry = expiry - datetime.datetime.now()
-                    # 首先检查token是否已过期（防止解析时已过期但_is_token_valid检查通过的情况）
-                    if time_until_expiry.total_seconds() < 0:
-                        logger.warning(f"token已过期，过期时间: {expiry}，已过期时间: {-time_until_expiry}")
-                        # 即使_is_token_valid通过，发现已过期也应该立即刷新
-                        self._refresh_all_games()
-                    else:
-                        logger.info(f"token过期时间: {expiry}，剩余时间: {time_until_expiry}")
-                        # 如果token将在30分钟内过期，记录警告
-                        if time_until_expiry.total_seconds() < 1800:
-                            logger.warning(f"token将在30分钟内过期，建议尽快刷新")
-                        # 使用asyncio.create_task异步执行刷新操作
-                        import asyncio
-                        asyncio.create_task(self._refresh_all_games())
             else:
                 logger.warning(f"加载的token无效，使用默认token")
                 self.current_token = self.auth_token
@@ -1349,7 +3599,6 @@ class MyPlugin(Star):
                         last_refresh_time = current_time
                     except Exception as e:
                         logger.error(f"定时刷新网页时出错: {e}")
-                        import traceback
                         logger.error(f"异常堆栈: {traceback.format_exc()}")
                 
                 # 检查token是否即将过期（每5分钟）
@@ -1366,7 +3615,6 @@ class MyPlugin(Star):
             logger.info("收到键盘中断，停止网页刷新任务")
         except Exception as e:
             logger.error(f"网页刷新定时任务异常: {e}")
-            import traceback
             logger.error(f"异常堆栈: {traceback.format_exc()}")
             # 发生异常后等待一段时间再尝试恢复
             await asyncio.sleep(60)
@@ -1376,9 +3624,6 @@ class MyPlugin(Star):
     
     async def _simulate_browser_refresh(self, game_name, url, session):
         """模拟真实浏览器行为刷新游戏网页，增强token管理"""
-        # 导入所需模块
-        import time
-        from urllib.parse import urlparse, parse_qs
         max_retries = 5  # 增加重试次数
         base_delay = 5  # 增加基础延迟时间
         
@@ -1559,20 +3804,31 @@ class MyPlugin(Star):
                 logger.error(f"刷新游戏{game_name}HTTP错误 (尝试 {attempt + 1}/{max_retries}): {e}")
             except Exception as e:
                 logger.error(f"刷新游戏{game_name}失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                import traceback
                 logger.debug(f"异常堆栈: {traceback.format_exc()}")
             
             # 指数退避策略
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)  # 指数增长
-                jitter = random.uniform(0, 1)  # 添加随机抖动避免同步请求
+                jitter = self._调度随机数.uniform(0, 1)  # 添加随机抖动避免同步请求
                 actual_delay = delay + jitter
                 logger.info(f"等待 {actual_delay:.2f} 秒后重试游戏 {game_name}")
                 await asyncio.sleep(actual_delay)
         
         return False, None
     
+    @追踪器.追踪("刷新token")
     async def _refresh_all_games(self):
+        """刷新所有游戏的网页并更新token，记录刷新耗时和结果"""
+        开始 = time.perf_counter()
+        结果 = None
+        try:
+            结果 = await self._刷新所有游戏网页()
+            return 结果
+        finally:
+            指标.观测("token_refresh_latency_ms", (time.perf_counter() - 开始) * 1000)
+            指标.计数("token_refresh_total", result="success" if isinstance(结果, dict) and 结果.get("success") else "failure")
+    
+    async def _刷新所有游戏网页(self):
         """刷新所有游戏的网页并更新token，带增强的错误处理和浏览器模拟"""
         logger.info(f"开始刷新所有游戏网页，共{len(self.game_configs)}个游戏")
         
@@ -1588,7 +3844,8 @@ class MyPlugin(Star):
             return {"success": False, "message": "没有找到游戏配置"}
         
         # 对游戏配置进行随机排序，避免总是从同一个游戏开始
-        sorted_games = sorted(self.game_configs.items(), key=lambda x: random.random())
+        sorted_games = list(self.game_configs.items())
+        self._调度随机数.shuffle(sorted_games)
         
         for game_name, config in sorted_games:
             url = config.get("URL")
@@ -1624,12 +3881,11 @@ class MyPlugin(Star):
                     logger.warning(f"游戏 {game_name} 刷新失败")
                 
                 # 随机延迟，模拟真实用户行为
-                await asyncio.sleep(random.uniform(2, 5))
+                await asyncio.sleep(self._调度随机数.uniform(2, 5))
                 
             except Exception as e:
                 failure_count += 1
                 logger.error(f"刷新游戏 {game_name} 时发生异常: {e}")
-                import traceback
                 logger.debug(f"异常堆栈: {traceback.format_exc()}")
                 
                 # 发生异常后短暂休眠
@@ -1687,11 +3943,152 @@ class MyPlugin(Star):
         except Exception as e:
             logger.error(f"定时任务异常: {e}")
     
+    async def _schedule_player_compaction(self):
+        """定时任务：在后台线程中把玩家数据日志合并进快照"""
+        上次压缩 = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(min(5, self.玩家数据压缩间隔))
+                条数 = self.玩家数据.日志条数
+                if 条数 >= self.玩家数据压缩阈值 or (条数 and time.monotonic() - 上次压缩 >= self.玩家数据压缩间隔):
+                    try:
+                        await asyncio.to_thread(self.玩家数据.压缩)
+                    except Exception as e:
+                        logger.error(f"压缩玩家数据日志时出错: {e}")
+                    上次压缩 = time.monotonic()
+        except asyncio.CancelledError:
+            logger.info("玩家数据压缩任务已取消")
+    
+    async def _执行数据清理(self) -> dict:
+        """按保留策略清理玩家数据：扫描和写文件在后台线程，删除玩家在事件循环中进行"""
+        开始 = time.perf_counter()
+        原大小 = await asyncio.to_thread(self.玩家数据.快照大小)
+        未知游戏记录, 过期记录 = await asyncio.to_thread(
+            self.玩家数据.清理签到记录, set(self.game_configs), self.签到记录保留天数)
+        候选 = await asyncio.to_thread(self.玩家数据.查找可删除玩家, self.不活跃玩家天数)
+        删除的玩家 = self.玩家数据.删除玩家(候选, self.不活跃玩家天数)
+        for 用户ID in 删除的玩家:
+            self.活跃度排行.移除(用户ID)
+        写入成功 = await asyncio.to_thread(self.玩家数据.压缩)
+        现大小 = await asyncio.to_thread(self.玩家数据.快照大小)
+        报告 = {
+            "未知游戏记录": 未知游戏记录,
+            "过期签到记录": 过期记录,
+            "删除玩家": len(删除的玩家),
+            "释放字节": 原大小 - 现大小,
+            "写入成功": 写入成功,
+            "耗时": time.perf_counter() - 开始,
+        }
+        指标.计数("retention_removed_total", 未知游戏记录, kind="unknown_game")
+        指标.计数("retention_removed_total", 过期记录, kind="expired_checkin")
+        指标.计数("retention_removed_total", len(删除的玩家), kind="player")
+        logger.info(f"数据清理完成: {报告}")
+        return 报告
+    
+    @staticmethod
+    def _格式化清理报告(报告: dict) -> str:
+        return (f"🧹 数据清理完成\n\n"
+                f"已删除游戏的签到记录：{报告['未知游戏记录']}条\n"
+                f"过期签到记录：{报告['过期签到记录']}条\n"
+                f"删除不活跃的未绑定玩家：{报告['删除玩家']}名\n"
+                f"数据文件减少：{报告['释放字节'] / 1024:.1f}KB\n"
+                f"耗时：{报告['耗时']:.2f}秒" + ("" if 报告["写入成功"] else "\n⚠️ 写入数据文件失败，清理结果将在下次保存时写入"))
+    
+    async def _schedule_retention(self):
+        """定时任务：按数据清理间隔清理玩家数据"""
+        logger.info(f"启动数据清理任务，每{self.数据清理间隔}秒清理一次")
+        try:
+            while True:
+                await asyncio.sleep(self.数据清理间隔)
+                try:
+                    await self._执行数据清理()
+                except Exception as e:
+                    logger.error(f"清理玩家数据时出错: {e}")
+        except asyncio.CancelledError:
+            logger.info("数据清理任务已取消")
+    
+    def _更新状态指标(self):
+        """刷新只在查看时才需要计算的仪表值：token剩余有效期、数据文件大小、待开奖任务数"""
+        token = getattr(self, "current_token", None) or self.auth_token
+        过期时间 = self._parse_token_expiry(token) if token else None
+        if 过期时间:
+            指标.设置("token_remaining_seconds", int((过期时间 - datetime.datetime.now()).total_seconds()))
+        指标.设置("pending_lottery_tasks", len(self.开奖任务))
+        指标.设置("pending_reward_tasks", len(self.发奖任务))
+        指标.设置("throttle_cache_entries", len(指令节流))
+        指标.设置("player_journal_entries", self.玩家数据.日志条数)
+        try:
+            大小 = collections.Counter()
+            with os.scandir(os.path.dirname(JsonHandler.获取文件路径("test.json"))) as 目录:
+                for 条目 in 目录:
+                    if 条目.is_file() and 条目.name.endswith(".json"):
+                        大小[JsonHandler.指标标签(条目.name)] += 条目.stat().st_size
+            指标.重置仪表("json_file_bytes", [({"file": 标签}, 值) for 标签, 值 in 大小.items()])
+        except OSError as e:
+            logger.warning(f"统计数据文件大小失败: {e}")
+    
+    def _导出指标(self):
+        self._更新状态指标()
+        指标.写入文件(JsonHandler.获取文件路径(self.指标导出文件, True))
+    
+    async def _schedule_metrics_dump(self):
+        """定时任务：按指标导出间隔把指标写入文件"""
+        logger.info(f"启动指标导出任务，每{self.指标导出间隔}秒导出一次")
+        try:
+            while True:
+                await asyncio.sleep(self.指标导出间隔)
+                try:
+                    await asyncio.to_thread(self._导出指标)
+                except Exception as e:
+                    logger.error(f"导出指标时出错: {e}")
+        except asyncio.CancelledError:
+            logger.info("指标导出任务已取消")
+    
+    def _格式化插件状态(self):
+        """把指标整理成聊天消息"""
+        self._更新状态指标()
+        运行秒数 = int(time.time() - 指标.启动时间)
+        行列表 = [f"插件状态（已运行 {运行秒数 // 3600}小时{运行秒数 % 3600 // 60}分）"]
+        
+        成功 = 指标.读取计数("mail_requests_total", result="success")
+        总数 = 指标.读取计数("mail_requests_total")
+        成功率 = f"{成功 * 100 / 总数:.1f}%" if 总数 else "-"
+        行列表.append(f"邮件：成功 {成功} / 共 {总数}，成功率 {成功率}")
+        
+        for 标签, 次数, p50, p99, 最大 in 指标.直方图摘要("admin_api_latency_ms"):
+            行列表.append(f"后台接口 {标签.get('endpoint')}：{次数}次 p50≤{p50:.0f}ms p99≤{p99:.0f}ms 最大{最大:.0f}ms")
+        
+        for 标签, 剩余 in 指标.仪表值("token_remaining_seconds"):
+            行列表.append(f"token剩余有效期：{剩余 // 3600}小时{剩余 % 3600 // 60}分" if 剩余 > 0 else "token已过期")
+        刷新次数 = 指标.读取计数("token_refresh_total")
+        if 刷新次数:
+            刷新耗时 = 指标.直方图摘要("token_refresh_latency_ms")[0]
+            行列表.append(f"token刷新：{刷新次数}次，失败 {指标.读取计数('token_refresh_total', result='failure')}次，p50≤{刷新耗时[2] / 1000:.1f}s")
+        
+        for 标签, 大小 in sorted(指标.仪表值("json_file_bytes"), key=lambda 项: -项[1]):
+            文件名 = 标签.get("file")
+            行列表.append(f"数据文件 {文件名}：{大小 / 1024:.1f}KB，写入{指标.读取计数('json_writes_total', file=文件名)}次")
+        
+        for 标签, 值 in 指标.仪表值("pending_lottery_tasks"):
+            行列表.append(f"待开奖任务：{值}")
+        for 标签, 值 in 指标.仪表值("pending_reward_tasks"):
+            行列表.append(f"发放中的签到奖励：{值}")
+        for 标签, 值 in 指标.仪表值("player_journal_entries"):
+            行列表.append(f"玩家数据日志待合并：{值}条")
+        
+        for 标签, 次数, p50, p99, 最大 in 指标.直方图摘要("command_latency_ms"):
+            错误 = 指标.读取计数("commands_total", command=标签.get("command"), status="error")
+            行列表.append(f"指令 {标签.get('command')}：{次数}次 异常{错误}次 p50≤{p50:.0f}ms p99≤{p99:.0f}ms")
+        return "\n".join(行列表)
+    
     def _check_and_update_date(self):
-        """检查并更新数据保质期，重置签到状态"""
+        """检查并更新数据保质期"""
         try:
             # 获取当前日期的day值
             current_day = str(datetime.datetime.now().day)
+            # 已确认过今天的日期时不再读文件，每次签到前调用也只是一次比较
+            if current_day == self._已确认日期:
+                return
             
             # 读取数据保质期
             保质期数据 = Json.读取Json字典("数据保质期.json")
@@ -1699,46 +4096,26 @@ class MyPlugin(Star):
             
             # 比较日期
             if current_day != 存储的日期:
-                logger.info(f"日期变更: 从{存储的日期}更新到{current_day}，重置所有签到状态")
+                logger.info(f"日期变更: 从{存储的日期}更新到{current_day}")
                 
                 # 更新数据保质期
                 Json.添加或更新("数据保质期.json", "日期", current_day)
                 
-                # 重置所有玩家的签到状态
-                签到数据 = Json.读取Json字典("玩家今天是否签到过.json")
-                if 签到数据:
-                    # 创建新的签到数据字典，所有值设为false
-                    新签到数据 = {key: "false" for key in 签到数据.keys()}
-                    # 写入文件
-                    # 使用JSON文件存储签到数据
-                    文件路径 = JsonHandler.获取文件路径("玩家今天是否签到过.json", True)
-                    try:
-                        with open(文件路径, 'w', encoding='utf-8') as f:
-                            json.dump(新签到数据, f, ensure_ascii=False, indent=2)
-                        logger.info(f"签到数据已保存到: {文件路径}")
-                        logger.info(f"已重置{len(新签到数据)}条签到记录")
-                    except Exception as e:
-                        logger.error(f"保存签到数据失败: {e}")
-                else:
-                    # 如果签到数据为空，初始化一个空字典
-                    文件路径 = JsonHandler.获取文件路径("玩家今天是否签到过.json", True)
-                    try:
-                        with open(文件路径, 'w', encoding='utf-8') as f:
-                            json.dump({}, f, ensure_ascii=False, indent=2)
-                        logger.info(f"初始化签到数据文件: {文件路径}")
-                    except Exception as e:
-                        logger.error(f"初始化签到数据文件失败: {e}")
+                # 签到记录按日期保存（见PlayerRecord.签到记录），跨天后自然失效，不再需要重写签到文件
+            self._已确认日期 = current_day
         except Exception as e:
             logger.error(f"检查和更新数据保质期时出错: {e}")
-            import traceback
             logger.error(f"异常堆栈: {traceback.format_exc()}")
 
     async def 发送消息(self, event: AstrMessageEvent, 消息内容: str):
         """发送消息封装函数"""
         yield event.plain_result(消息内容)
 
+    @追踪器.追踪("发送奖励邮件")
     async def send_personal_reward_email(self, 认证令牌, 项目ID, 奖励内容, 发送的用户, 邮件标题, 邮件正文, 游戏名称=None, use_data_api=True):
         """发送个人奖励邮件（适配C#邮件格式）"""
+        # 记录原始参数，失败后可以从失败日志中重发
+        重发参数 = {"项目ID": 项目ID, "奖励内容": 奖励内容, "邮件标题": 邮件标题, "邮件正文": 邮件正文, "游戏名称": 游戏名称}
         try:
             # 如果没有提供游戏名称，尝试从游戏配置中获取第一个
             if not 游戏名称 and self.game_configs:
@@ -1821,86 +4198,24 @@ class MyPlugin(Star):
                 if f"{display_name} x{count}" not in 邮件正文:
                     邮件正文 = f"{邮件正文}\n\n获得奖励：{display_name} x{count}"
             
-            # 先验证current_token是否有效
-            token_to_use = self.current_token or 认证令牌
-            if not token_to_use or len(token_to_use) < 10:  # 简单的长度验证
-                print("[邮件] 警告: 当前token可能无效，尝试使用默认token")
-                token_to_use = self.auth_token
-            
-            print(f"[邮件] 准备发送邮件 - 用户ID: {发送的用户}, 项目ID: {项目ID}")
-            print(f"[邮件] 使用的token长度: {len(token_to_use)} 字符")
-            print(f"[邮件] 邮件标题: {邮件标题}, 附件: {attachment}")
+            logger.debug("[邮件] 准备发送邮件 - 用户ID: %s, 项目ID: %s", 发送的用户, 项目ID)
+            logger.debug("[邮件] 邮件标题: %s, 附件: %s", 邮件标题, attachment)
             
-            # 创建邮件服务并发送邮件（增加重试设置）
-            email_service = EmailService(
-                auth_token=token_to_use,
-                project_id=项目ID,
-                max_retries=3
-            )
-            print("[邮件] 开始调用邮件服务发送邮件...")
-            print(f"[邮件] 启用Data API: {use_data_api}")
+            # 复用该项目的邮件服务，token失效时由token提供者刷新并重放请求，无需在这里重建服务重发
+            email_service = self._获取邮件服务(项目ID, 认证令牌)
+            logger.debug("[邮件] 开始调用邮件服务发送邮件...")
+            logger.debug("[邮件] 启用Data API: %s", use_data_api)
             result = await email_service.quick_send(邮件标题, 邮件正文, 发送的用户, attachment=attachment, use_data_api=use_data_api)
-            print(f"[邮件] 邮件服务返回结果: {result}")
-            
-            # 检查是否是token相关错误或400错误
-            message = result.get('message', '')
-            status_code = result.get('status_code')
+            logger.debug("[邮件] 邮件服务返回结果: %s", result)
             
-            # 检测token错误或400/401/403错误
-            if not result.get('success'):
-                error_detected = False
-                
-                # 检测400错误（请求参数问题）
-                if status_code == 400 or (message and '400' in message):
-                    logger.warning(f"检测到400 Bad Request错误，可能是请求参数问题，尤其是用户ID格式")
-                    logger.warning(f"详细错误信息: {message}")
-                    logger.warning(f"目标用户ID: {发送的用户}")
-                    error_detected = True
-                # 检测token相关错误
-                elif (message and ('token' in message.lower() or '认证' in message or any(code in message for code in ['401', '403']))) or status_code in [401, 403]:
-                    logger.warning(f"检测到邮件发送错误: {message or status_code}，尝试刷新token")
-                    error_detected = True
-                
-                if error_detected:
-                
-                    # 立即尝试刷新token（使用新的浏览器模拟方法）
-                    refresh_result = await self._refresh_all_games()
-                
-                # 如果刷新成功且有新token
-                if refresh_result and (refresh_result.get("success") or isinstance(refresh_result, str)):
-                    # 获取新token
-                    new_token = refresh_result.get("token") if isinstance(refresh_result, dict) else refresh_result
-                    
-                    if new_token and (isinstance(new_token, str) and len(new_token) > 50):
-                        logger.info(f"token刷新成功，新token长度: {len(new_token)}")
-                        
-                        # 使用新token创建新的邮件服务实例并重新发送
-                        logger.info("使用新token重新尝试发送邮件")
-                        new_email_service = EmailService(
-                            auth_token=new_token,
-                            project_id=项目ID,
-                            max_retries=2
-                        )
-                        # 重新发送邮件
-                        retry_result = await new_email_service.quick_send(邮件标题, 邮件正文, 发送的用户, attachment=attachment)
-                        
-                        if retry_result.get('success'):
-                            logger.info("使用新token重新发送邮件成功")
-                            return True
-                        else:
-                            logger.error(f"使用新token重新发送邮件失败: {retry_result.get('message', '未知错误')}")
-                            self._log_email_failure(发送的用户, 奖励内容, "使用新token重试失败: " + retry_result.get('message', '未知错误'))
-                    else:
-                        logger.warning("刷新后获取的token无效或为空")
-                else:
-                    logger.error(f"token刷新失败或无返回值")
-                    self._log_email_failure(发送的用户, 奖励内容, "Token刷新失败或无返回值")
-                    # 使用新token重新发送邮件
-                    return False
+            # 400错误（请求参数问题）单独提示，便于排查用户ID格式
+            if not result.get('success') and (result.get('status_code') == 400 or result.get('error_code') == 'BAD_REQUEST'):
+                logger.warning(f"检测到400 Bad Request错误，可能是请求参数问题，尤其是用户ID格式")
+                logger.warning(f"详细错误信息: {result.get('message', '')}")
+                logger.warning(f"目标用户ID: {发送的用户}")
             
             # 检查结果是否成功
             if result.get('success'):
-                print(f"[邮件] ✅ 奖励邮件发送成功: {发送的用户}")
                 logger.info(f"奖励邮件发送成功: {发送的用户}")
                 return True
             else:
@@ -1908,7 +4223,7 @@ class MyPlugin(Star):
                 error_msg = result.get('message')
                 status_code = result.get('status_code')
                 detailed_error = error_msg
-                print(f"[邮件] ❌ 奖励邮件发送失败: {发送的用户}, 状态码: {status_code}, 错误信息: {error_msg}")
+                logger.debug("[邮件] 奖励邮件发送失败: %s, 状态码: %s, 错误信息: %s, 请求ID: %s", 发送的用户, status_code, error_msg, result.get('request_id'))
                 
                 # 如果是NO_ROW_ID错误，收集更详细的错误信息
                 if result.get('error_code') == 'NO_ROW_ID':
@@ -1920,6 +4235,12 @@ class MyPlugin(Star):
                     
                     logger.error(f"邮件行ID提取失败: {detailed_error}")
                 
+                # 后台接口熔断中，请求未发出，记入失败日志等待恢复后重发
+                elif result.get('error_code') == 'CIRCUIT_OPEN':
+                    logger.warning(f"后台接口熔断中，奖励邮件暂缓发送: {发送的用户}，恢复后可使用「重发失败奖励 错误码 CIRCUIT_OPEN」补发")
+                    self._log_email_failure(发送的用户, 奖励内容, error_msg, 游戏名称, "CIRCUIT_OPEN", 重发参数)
+                    return False
+
                 # 处理触发发送超时的特殊情况
                 elif result.get('trigger_timeout'):
                     # 对于触发发送超时，邮件可能已经成功发送，我们记录为警告而非错误
@@ -1927,7 +4248,7 @@ class MyPlugin(Star):
                     logger.warning(f"奖励邮件发送状态不确定: {发送的用户}, 详情: {warning_msg}")
                     # 这里可以选择返回True，因为邮件可能已经发送成功
                     # 但为了安全起见，我们仍然返回False，但记录为警告而非错误
-                    self._log_email_failure(发送的用户, 奖励内容, warning_msg + " (状态不确定)")
+                    self._log_email_failure(发送的用户, 奖励内容, warning_msg + " (状态不确定)", 游戏名称, "TRIGGER_TIMEOUT", 重发参数)
                     return False
                 
                 # 处理邮件已添加但触发发送失败的情况
@@ -1944,58 +4265,420 @@ class MyPlugin(Star):
                     
                     logger.error(f"邮件已添加但触发发送失败: {发送的用户}, 详情: {detailed_error}")
                 
-                logger.error(f"奖励邮件发送失败: {发送的用户}, 原因: {detailed_error}")
+                logger.error(f"奖励邮件发送失败: {发送的用户}, 原因: {detailed_error}, 请求ID: {result.get('request_id')}")
                 # 记录失败信息
-                self._log_email_failure(发送的用户, 奖励内容, detailed_error)
+                self._log_email_failure(发送的用户, 奖励内容, detailed_error, 游戏名称, result.get('error_code'), 重发参数)
                 return False
         except requests.RequestException as e:
             error_msg = f"发送奖励邮件网络异常: {str(e)}"
             logger.error(error_msg)
-            import traceback
             logger.error(f"异常堆栈: {traceback.format_exc()}")
-            self._log_email_failure(发送的用户, 奖励内容, error_msg)
+            self._log_email_failure(发送的用户, 奖励内容, error_msg, 游戏名称, "NETWORK_ERROR", 重发参数)
             return False
         except Exception as e:
             error_msg = f"发送奖励邮件异常: {str(e)}"
             logger.error(error_msg)
-            import traceback
             logger.error(f"异常堆栈: {traceback.format_exc()}")
-            self._log_email_failure(发送的用户, 奖励内容, error_msg)
+            self._log_email_failure(发送的用户, 奖励内容, error_msg, 游戏名称, "INTERNAL_ERROR", 重发参数)
             return False
     
-    def _log_email_failure(self, user_id, reward_info, error_msg):
+    async def _刷新令牌(self):
+        """供token提供者调用，刷新成功时返回新token，否则返回None"""
+        refresh_result = await self._refresh_all_games()
+        if isinstance(refresh_result, dict) and refresh_result.get("success"):
+            return refresh_result.get("token")
+        logger.error(f"token刷新失败: {refresh_result.get('message') if isinstance(refresh_result, dict) else refresh_result}")
+        return None
+    
+    def _获取邮件服务(self, 项目ID, 认证令牌=None):
+        """按项目ID复用邮件服务实例，共享连接和token提供者"""
+        email_service = self.邮件服务.get(项目ID)
+        if email_service is None:
+            email_service = EmailService(
+                auth_token=self.token_provider.当前令牌() or 认证令牌,
+                project_id=项目ID,
+                max_retries=3,
+                token_provider=self.token_provider,
+                rate_limit=self.邮件请求速率
+            )
+            self.邮件服务[项目ID] = email_service
+        return email_service
+    
+    def _log_email_failure(self, user_id, reward_info, error_msg, 游戏名称=None, error_code=None, 重发参数=None):
+        """
+        记录邮件发送失败信息（写入由后台线程完成，不阻塞事件循环）
+        
+        Args:
+            user_id (str): 用户ID
+            reward_info (dict): 奖励信息
+            error_msg (str): 错误信息
+            游戏名称 (str): 游戏名称
+            error_code (str): 错误码
+            重发参数 (dict): 重发邮件所需的原始参数
+        """
+        try:
+            self.邮件失败日志.记录(user_id, reward_info, error_msg, 游戏名称, error_code, 重发参数)
+        except Exception as e:
+            logger.error(f"记录失败日志异常: {str(e)}")
+
+    async def 查询邮件失败(self, user_id=None, 游戏名称=None, error_code=None, 仅未处理=True, 数量上限=100):
+        """按用户、游戏或错误码查询邮件失败记录"""
+        return await asyncio.to_thread(self.邮件失败日志.查询, user_id, 游戏名称, error_code, 仅未处理, 数量上限)
+
+    async def 重发邮件失败(self, user_id=None, 游戏名称=None, error_code=None, 数量上限=100):
+        """
+        重发符合条件的失败奖励邮件
+
+        Returns:
+            tuple: (重发成功数, 重发失败数, 无法重发数)
+        """
+        成功数 = 失败数 = 跳过数 = 0
+        async with self._重发锁:
+            for 条目 in await self.查询邮件失败(user_id, 游戏名称, error_code, True, 数量上限):
+                参数 = 条目.get("重发参数")
+                if not 参数:
+                    跳过数 += 1
+                    continue
+                结果 = await self.send_personal_reward_email(
+                    self.auth_token, 参数.get("项目ID"), 参数.get("奖励内容"), 条目.get("用户"),
+                    参数.get("邮件标题"), 参数.get("邮件正文"), 参数.get("游戏名称")
+                )
+                self.邮件失败日志.标记已重发(条目["id"], bool(结果))
+                if 结果:
+                    成功数 += 1
+                else:
+                    失败数 += 1
+        return 成功数, 失败数, 跳过数
+
+    @staticmethod
+    def _解析失败筛选条件(parts):
+        """解析「用户/游戏/错误码 值」形式的筛选参数"""
+        筛选 = {"user_id": None, "游戏名称": None, "error_code": None}
+        字段 = {"用户": "user_id", "游戏": "游戏名称", "错误码": "error_code"}
+        if len(parts) >= 3 and parts[1] in 字段:
+            筛选[字段[parts[1]]] = " ".join(parts[2:])
+        return 筛选
+
+    @filter.command("查看发奖失败")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 查看发奖失败(self, event: AstrMessageEvent):
+        """管理员查看未处理的奖励邮件失败记录，格式为：查看发奖失败 [用户/游戏/错误码 值]"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        筛选 = self._解析失败筛选条件(event.message_str.strip().split(" "))
+        记录列表 = await self.查询邮件失败(数量上限=20, **筛选)
+        if not 记录列表:
+            async for msg in self.发送消息(event, "📢 没有未处理的奖励邮件失败记录"):
+                yield msg
+            return
+        消息内容 = f"📮 奖励邮件失败记录（最新{len(记录列表)}条）📮\n\n"
+        for 条目 in 记录列表:
+            消息内容 += f"[{条目.get('时间')}] 用户：{条目.get('用户')} 游戏：{条目.get('游戏') or '未知'}\n错误码：{条目.get('错误码') or '无'} 错误：{str(条目.get('错误'))[:80]}\n\n"
+        消息内容 += "使用「重发失败奖励 [用户/游戏/错误码 值]」重新发放"
+        async for msg in self.发送消息(event, 消息内容):
+            yield msg
+
+    @filter.command("重发失败奖励")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 重发失败奖励(self, event: AstrMessageEvent):
+        """管理员重发失败的奖励邮件，格式为：重发失败奖励 [用户/游戏/错误码 值]"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        if self._重发锁.locked():
+            async for msg in self.发送消息(event, "⏳ 已有重发任务正在进行，请等待完成后再试"):
+                yield msg
+            return
+        筛选 = self._解析失败筛选条件(event.message_str.strip().split(" "))
+        成功数, 失败数, 跳过数 = await self.重发邮件失败(**筛选)
+        async for msg in self.发送消息(event, f"📮 重发完成：成功{成功数}封，失败{失败数}封，缺少重发参数{跳过数}条"):
+            yield msg
+
+    @filter.command("插件状态")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 查看插件状态(self, event: AstrMessageEvent):
+        """管理员查看插件运行指标：邮件成功率、后台接口延迟、token有效期、数据文件和指令耗时"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        结果 = await asyncio.to_thread(self._格式化插件状态)
+        async for msg in self.发送消息(event, 结果):
+            yield msg
+
+    @filter.command("导出可读数据")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 导出可读数据(self, event: AstrMessageEvent):
+        """管理员把玩家数据另存为缩进的JSON，便于人工查看（玩家数据快照默认为紧凑格式并分片保存）"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+
+        def 导出():
+            return self.玩家数据.导出可读副本()
+
+        副本文件名 = await asyncio.to_thread(导出)
+        if 副本文件名:
+            async for msg in self.发送消息(event, f"✅ 玩家数据已导出到数据目录下的 {副本文件名}"):
+                yield msg
+        else:
+            async for msg in self.发送消息(event, "❌ 导出失败，请查看日志"):
+                yield msg
+
+    @filter.command("清理数据")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 清理数据(self, event: AstrMessageEvent):
+        """管理员立即按保留策略清理玩家数据，并报告清理了多少"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        报告 = await self._执行数据清理()
+        async for msg in self.发送消息(event, self._格式化清理报告(报告)):
+            yield msg
+
+    导出字段 = ("用户ID", "绑定ID", "连续签到", "上次签到日期", "活跃度", "签到记录")
+    
+    def _导出行(self, 玩家迭代):
+        """把 (用户ID, 玩家数据字典) 转为导出用的行，日期转为 YYYY-MM-DD"""
+        def 日期(序号):
+            return datetime.date.fromordinal(序号).isoformat() if 序号 else ""
+        for 用户ID, 数据 in 玩家迭代:
+            yield {
+                "用户ID": 用户ID,
+                "绑定ID": 数据["绑定ID"],
+                "连续签到": 数据["连续签到"],
+                "上次签到日期": 日期(数据["上次签到日"]),
+                "活跃度": 数据["活跃度"],
+                "签到记录": ";".join(f"{游戏}:{日期(日)}" for 游戏, 日 in sorted(数据["签到记录"].items())),
+            }
+    
+    def _写出玩家数据(self, 格式: str) -> tuple:
+        """把玩家数据逐行写入数据目录下的导出文件，返回 (文件名, 行数)，在后台线程中调用"""
+        文件名 = f"玩家数据导出_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{格式}"
+        路径 = JsonHandler.获取文件路径(文件名, True)
+        行数 = 0
+        行迭代 = self._导出行(self.玩家数据.逐个分片遍历())
+        # 先写临时文件，导出完成后再改名，不会留下半个导出文件
+        with open(路径 + ".tmp", "w", encoding="utf-8-sig" if 格式 == "csv" else "utf-8", newline="") as f:
+            if 格式 == "csv":
+                写入器 = csv.DictWriter(f, fieldnames=self.导出字段)
+                写入器.writeheader()
+                for 行 in 行迭代:
+                    写入器.writerow(行)
+                    行数 += 1
+            else:
+                for 行 in 行迭代:
+                    f.write(Serializer.编码行(行))
+                    行数 += 1
+        os.replace(路径 + ".tmp", 路径)
+        return 文件名, 行数
+    
+    @filter.command("导出玩家数据")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 导出玩家数据(self, event: AstrMessageEvent):
+        """管理员把所有玩家的绑定ID、连续签到、活跃度和签到记录导出为CSV或JSONL，格式为：导出玩家数据 [csv|jsonl]"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        parts = event.message_str.strip().split()
+        格式 = parts[1].lower() if len(parts) > 1 else "csv"
+        if 格式 not in ("csv", "jsonl"):
+            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n导出玩家数据：导出玩家数据 [csv|jsonl]"):
+                yield msg
+            return
+        开始 = time.perf_counter()
+        try:
+            文件名, 行数 = await asyncio.to_thread(self._写出玩家数据, 格式)
+        except OSError as e:
+            logger.error(f"导出玩家数据失败: {e}")
+            async for msg in self.发送消息(event, "❌ 导出失败，请查看日志"):
+                yield msg
+            return
+        大小 = os.path.getsize(JsonHandler.获取文件路径(文件名))
+        async for msg in self.发送消息(event, f"✅ 已导出{行数}名玩家的数据\n\n文件：数据目录下的 {文件名}\n大小：{大小 / 1024:.1f}KB\n耗时：{time.perf_counter() - 开始:.2f}秒"):
+            yield msg
+
+    @staticmethod
+    def _解析批量绑定(行列表) -> tuple:
         """
-        记录邮件发送失败信息
-        
-        Args:
-            user_id (str): 用户ID
-            reward_info (dict): 奖励信息
-            error_msg (str): 错误信息
+        逐行解析「用户ID 游戏ID」（空格、逗号或制表符分隔），用户ID必须是纯数字，
+        游戏ID按 EmailService.规范化用户ID 的规则校验
+
+        返回 (有效绑定 {用户ID: 游戏ID}, 修正的行数, 被拒绝的行 [(行号, 内容, 原因)])。
+        空行和#开头的行忽略；第一个有内容的行不含数字时视为表头；同一用户出现多次时以最后一行为准。
         """
-        import os
-        import datetime
-        
-        # 创建失败日志目录
-        log_dir = os.path.join(os.path.dirname(__file__), "logs")
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        
-        # 日志文件名
-        log_file = os.path.join(log_dir, "email_failures.log")
-        
-        # 构建日志内容
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] 用户: {user_id}, 奖励: {reward_info}, 错误: {error_msg}\n"
-        
-        # 写入日志文件
+        有效绑定 = {}
+        修正数 = 0
+        被拒绝 = []
+        首个数据行 = True
+        for 行号, 行 in enumerate(行列表, 1):
+            内容 = 行.strip()
+            if not 内容 or 内容.startswith("#"):
+                continue
+            if 首个数据行:
+                首个数据行 = False
+                if not re.search(r"\d", 内容):
+                    continue
+            字段 = [项 for 项 in re.split(r"[\s,，]+", 内容) if 项]
+            if len(字段) != 2:
+                被拒绝.append((行号, 内容, "需要两列：用户ID 游戏ID"))
+                continue
+            用户ID, 游戏ID = 字段
+            if not 用户ID.isdigit():
+                被拒绝.append((行号, 内容, "用户ID必须是纯数字"))
+                continue
+            规范化ID = EmailService.规范化用户ID(游戏ID)
+            if not 规范化ID:
+                被拒绝.append((行号, 内容, "游戏ID中没有数字"))
+                continue
+            if 规范化ID != 游戏ID:
+                修正数 += 1
+            有效绑定[用户ID] = 规范化ID
+        return 有效绑定, 修正数, 被拒绝
+
+    def _读取批量绑定文件(self, 文件名: str) -> tuple:
+        with open(JsonHandler.获取文件路径(文件名), "r", encoding="utf-8-sig") as f:
+            return self._解析批量绑定(f)
+
+    @staticmethod
+    def _写出被拒绝行(被拒绝) -> str:
+        """把被拒绝的行写入数据目录下的文本文件，返回文件名，在后台线程中调用"""
+        拒绝文件名 = f"批量绑定_被拒绝_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        with open(JsonHandler.获取文件路径(拒绝文件名, True), "w", encoding="utf-8") as f:
+            f.writelines(f"{行号}\t{内容}\t{原因}\n" for 行号, 内容, 原因 in 被拒绝)
+        return 拒绝文件名
+
+    @filter.command("批量绑定")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 批量绑定(self, event: AstrMessageEvent):
+        """管理员批量导入ID绑定，格式为：批量绑定 文件名（数据目录下的文件），或在指令后换行，每行一个「用户ID 游戏ID」"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        首行, _, 其余 = event.message_str.strip().partition("\n")
+        parts = 首行.split()
+        if 其余.strip():
+            有效绑定, 修正数, 被拒绝 = self._解析批量绑定(其余.splitlines())
+        elif len(parts) == 2 and JsonHandler.验证文件名(parts[1]):
+            try:
+                有效绑定, 修正数, 被拒绝 = await asyncio.to_thread(self._读取批量绑定文件, parts[1])
+            except (OSError, UnicodeDecodeError) as e:
+                async for msg in self.发送消息(event, f"❌ 读取文件失败：{parts[1]}\n{e}"):
+                    yield msg
+                return
+        else:
+            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n批量绑定：批量绑定 文件名（文件放在插件数据目录下）\n或：批量绑定 后换行，每行一个「用户ID 游戏ID」"):
+                yield msg
+            return
+
+        if 有效绑定 and not self.玩家数据.设置绑定(有效绑定):
+            async for msg in self.发送消息(event, "❌ 写入绑定数据失败，本次导入未生效，请查看日志"):
+                yield msg
+            return
+        指令节流.清空()
+
+        行列表 = [f"✅ 批量绑定完成\n\n成功导入：{len(有效绑定)}条" + (f"（其中{修正数}条游戏ID已去除非数字字符）" if 修正数 else ""),
+                  f"被拒绝：{len(被拒绝)}条"]
+        重复游戏ID = {游戏ID for 游戏ID in set(有效绑定.values()) if len(self.玩家数据.查找绑定用户(游戏ID)) > 1}
+        if 重复游戏ID:
+            行列表.append(f"⚠️ 其中{len(重复游戏ID)}个游戏ID被多名用户绑定，可发送「查询绑定」查看")
+        if 被拒绝:
+            for 行号, 内容, 原因 in 被拒绝[:10]:
+                行列表.append(f"第{行号}行「{内容[:40]}」：{原因}")
+            if len(被拒绝) > 10:
+                try:
+                    拒绝文件名 = await asyncio.to_thread(self._写出被拒绝行, 被拒绝)
+                    行列表.append(f"……完整列表见数据目录下的 {拒绝文件名}")
+                except OSError as e:
+                    logger.error(f"写入被拒绝的批量绑定行失败: {e}")
+                    行列表.append(f"……另有{len(被拒绝) - 10}条未列出（写入完整列表失败）")
+        async for msg in self.发送消息(event, "\n".join(行列表)):
+            yield msg
+
+    @filter.command("查询绑定")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 查询绑定(self, event: AstrMessageEvent):
+        """管理员按游戏ID反查绑定的用户，格式为：查询绑定 游戏ID，不带参数时列出被多名用户绑定的游戏ID"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        parts = event.message_str.strip().split()
+        if len(parts) < 2:
+            重复绑定 = self.玩家数据.重复绑定()
+            if not 重复绑定:
+                async for msg in self.发送消息(event, "✅ 没有被多名用户绑定的游戏ID\n按游戏ID查询：查询绑定 游戏ID"):
+                    yield msg
+                return
+            行列表 = [f"⚠️ 共{len(重复绑定)}个游戏ID被多名用户绑定"]
+            for 游戏ID, 用户列表 in list(重复绑定.items())[:20]:
+                行列表.append(f"{游戏ID}：{'、'.join(用户列表)}")
+            if len(重复绑定) > 20:
+                行列表.append(f"……另有{len(重复绑定) - 20}个未列出")
+            async for msg in self.发送消息(event, "\n".join(行列表)):
+                yield msg
+            return
+
+        游戏ID = EmailService.规范化用户ID(parts[1]) or parts[1]
+        用户列表 = self.玩家数据.查找绑定用户(游戏ID)
+        if not 用户列表:
+            async for msg in self.发送消息(event, f"没有用户绑定游戏ID：{游戏ID}"):
+                yield msg
+            return
+        async for msg in self.发送消息(event, f"游戏ID {游戏ID} 绑定的用户（{len(用户列表)}名）：\n" + "\n".join(用户列表)):
+            yield msg
+
+    @filter.command("玩家数据分片")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 调整玩家数据分片(self, event: AstrMessageEvent):
+        """管理员在线调整玩家数据的分片数，格式为：玩家数据分片 分片数（1-256），不带参数时查看当前分片数"""
+        if(event.is_admin()!=True):
+            async for msg in self.发送消息(event, "您没有权限使用此命令。"):
+                yield msg
+            return
+        parts = event.message_str.strip().split()
+        if len(parts) < 2:
+            await asyncio.to_thread(self.玩家数据.预加载)
+            async for msg in self.发送消息(event, f"玩家数据当前分为{self.玩家数据.分片数}个分片，共{self.玩家数据.数量()}名玩家\n调整格式：玩家数据分片 分片数（1-256）"):
+                yield msg
+            return
         try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_entry)
-            print(f"邮件发送失败信息已记录到: {log_file}")
-        except Exception as e:
-            print(f"记录失败日志异常: {str(e)}")
+            新分片数 = int(parts[1])
+        except ValueError:
+            新分片数 = 0
+        if not 1 <= 新分片数 <= 256:
+            async for msg in self.发送消息(event, "❌ 分片数必须是1到256之间的整数"):
+                yield msg
+            return
+        开始 = time.perf_counter()
+        成功 = await asyncio.to_thread(self.玩家数据.调整分片数, 新分片数)
+        if 成功:
+            async for msg in self.发送消息(event, f"✅ 玩家数据已调整为{新分片数}个分片，耗时{time.perf_counter() - 开始:.2f}秒"):
+                yield msg
+        else:
+            async for msg in self.发送消息(event, "❌ 调整分片失败，原有分片未改动，请查看日志"):
+                yield msg
 
     @filter.command("签到")
+    @指标.统计指令
+    @追踪器.追踪指令
+    @指令节流.节流()
     async def handle_checkin(self, event: AstrMessageEvent):
         """处理签到功能"""
         # 每次签到前检查日期，确保签到状态正确
@@ -2018,80 +4701,94 @@ class MyPlugin(Star):
 
     async def handle_single_checkin(self, event: AstrMessageEvent, author_id, 游戏名称):
         """处理单个游戏签到"""
-        # 使用复合键格式: "玩家ID_游戏ID"
-        复合键 = f"{author_id}_{游戏名称}"
+        # 一次查找拿到该玩家的绑定、签到记录和活跃度
+        玩家 = self.玩家数据.获取(author_id)
+        今天 = datetime.date.today().toordinal()
         
-        # 检查是否已签到
-        if Json.获取值(Json.读取Json字典("玩家今天是否签到过.json"), 复合键) is None:
-            Json.添加或更新("玩家今天是否签到过.json", 复合键, "false")
+        # 检查ID绑定
+        发送的用户 = 玩家.绑定ID if 玩家 else ""
+        if not 发送的用户:
+            async for msg in self.发送消息(event, "ID未绑定，请发送\"绑定ID xxx\"进行绑定"):
+                yield msg
+            return
         
-        if Json.获取值(Json.读取Json字典("玩家今天是否签到过.json"), 复合键) != "true":
-            # 检查ID绑定
-            玩家数据 = Json.读取Json字典("玩家绑定id数据存储.json")
-            发送的用户 = Json.获取值(玩家数据, author_id)
-            
-            if not 发送的用户:
-                async for msg in self.发送消息(event, "ID未绑定，请发送\"绑定ID xxx\"进行绑定"):
-                    yield msg
-                return
-            
-            # 发送奖励邮件
-            # 从游戏配置中获取项目ID和奖励信息
-            游戏配置 = self.game_configs.get(游戏名称, {})
-            项目ID = 游戏配置.get("项目ID", "mock_project")
-            发送的奖励 = {"items": []}
-            
-            # 解析奖励格式: "$p_95jd.lobby_resource.魂晶.root:999"
-            奖励字符串 = 游戏配置.get("发送的奖励", "")
-            if 奖励字符串:
-                try:
-                    # 提取奖励ID和数量
-                    奖励_id, 数量 = 奖励字符串.split(":")
-                    数量 = int(数量)
-                    # 改进的显示名称提取逻辑
-                    # 1. 尝试从奖励ID中提取中文字符作为显示名称
-                    name_parts = 奖励_id.split(".")
-                    display_name = "奖励"
-                    for part in name_parts:
-                        if any('\u4e00' <= char <= '\u9fff' for char in part):
-                            display_name = part
-                            break
-                    # 2. 如果没有找到中文字符，回退到使用最后一部分
-                    if display_name == "奖励" and name_parts:
-                        display_name = name_parts[-1]
-                    发送的奖励["items"].append(f"{display_name}*{数量}")
-                except:
-                    # 如果解析失败，使用默认奖励
-                    发送的奖励["items"] = ["签到奖励"]
-            else:
-                发送的奖励["items"] = ["签到奖励"]
-                
-            邮件标题 = "签到奖励"
-            邮件正文 = f"恭喜您在{游戏名称}签到成功！"
-
-            # 先更新签到状态，确保用户签到成功
-            Json.添加或更新("玩家今天是否签到过.json", 复合键, "true")
-            print(f"[签到] 用户{author_id}在{游戏名称}的签到状态已更新")
-            
-            # 发送奖励邮件
-            邮件返回值 = await self.send_personal_reward_email(self.auth_token, 项目ID, 发送的奖励, 发送的用户, 邮件标题, 邮件正文, 游戏名称)
-            print(f"[签到] 邮件发送结果: {邮件返回值}")
-            
-            # 无论邮件是否发送成功，都处理连续签到并显示签到成功消息
-            # 处理连续签到
-            async for msg in self.handle_continuous_checkin(event, author_id, 游戏名称):
+        # 认领今天在该游戏的签到：认领在存储的记录锁内原子完成，同一 (用户, 游戏, 日期) 的并发签到只有一个能成功
+        认领成功 = self.玩家数据.认领签到(author_id, 游戏名称, 今天)
+        if 认领成功 and not self.玩家数据.记录变更(author_id, 签到记录={游戏名称: 今天}):
+            self.玩家数据.撤销签到(author_id, 游戏名称, 今天)
+            async for msg in self.发送消息(event, "⚠️ 签到记录保存失败，请稍后重试"):
                 yield msg
-            
-            # 如果邮件发送失败，添加提示信息
-            if not 邮件返回值:
-                print(f"[签到] 警告: 邮件发送失败，但签到已记录")
-                async for msg in self.发送消息(event, "⚠️ 签到记录已保存，但奖励邮件发送失败，请稍后尝试或联系管理员"):
-                    yield msg
-        else:
+            return
+        
+        if not 认领成功:
             async for msg in self.发送消息(event, f"您今天已经在{游戏名称}签到过了，请明天再来！"):
                 yield msg
+            return
+        logger.debug("[签到] 用户%s在%s的签到状态已更新", author_id, 游戏名称)
+        
+        # 发送奖励邮件
+        # 从游戏配置中获取项目ID和奖励信息
+        游戏配置 = self.game_configs.get(游戏名称, {})
+        项目ID = 游戏配置.get("项目ID", "mock_project")
+        发送的奖励 = {"items": []}
+        
+        # 解析奖励格式: "$p_95jd.lobby_resource.魂晶.root:999"
+        奖励字符串 = 游戏配置.get("发送的奖励", "")
+        if 奖励字符串:
+            try:
+                # 提取奖励ID和数量
+                奖励_id, 数量 = 奖励字符串.split(":")
+                数量 = int(数量)
+                # 改进的显示名称提取逻辑
+                # 1. 尝试从奖励ID中提取中文字符作为显示名称
+                name_parts = 奖励_id.split(".")
+                display_name = "奖励"
+                for part in name_parts:
+                    if any('\u4e00' <= char <= '\u9fff' for char in part):
+                        display_name = part
+                        break
+                # 2. 如果没有找到中文字符，回退到使用最后一部分
+                if display_name == "奖励" and name_parts:
+                    display_name = name_parts[-1]
+                发送的奖励["items"].append(f"{display_name}*{数量}")
+            except:
+                # 如果解析失败，使用默认奖励
+                发送的奖励["items"] = ["签到奖励"]
+        else:
+            发送的奖励["items"] = ["签到奖励"]
+            
+        邮件标题 = "签到奖励"
+        邮件正文 = f"恭喜您在{游戏名称}签到成功！"
+        
+        # 奖励邮件在后台发放，签到结果立即回复，只有最终发放失败时才补发提示
+        任务 = asyncio.create_task(self._发放签到奖励(event, 项目ID, 发送的奖励, 发送的用户, 邮件标题, 邮件正文, 游戏名称))
+        self.发奖任务.add(任务)
+        任务.add_done_callback(self.发奖任务.discard)
+        
+        # 处理连续签到
+        async for msg in self.handle_continuous_checkin(event, author_id, 游戏名称):
+            yield msg
+
+    async def _发放签到奖励(self, event: AstrMessageEvent, 项目ID, 发送的奖励, 发送的用户, 邮件标题, 邮件正文, 游戏名称):
+        """后台发送签到奖励邮件，失败时主动发消息提示用户（失败记录已写入失败日志，可由管理员重发）"""
+        try:
+            邮件返回值 = await self.send_personal_reward_email(self.auth_token, 项目ID, 发送的奖励, 发送的用户, 邮件标题, 邮件正文, 游戏名称)
+        except asyncio.CancelledError:
+            # 插件停用时被取消，记入失败日志以便重发
+            self._log_email_failure(发送的用户, 发送的奖励, "插件停用时奖励尚未发放完成", 游戏名称, "CANCELLED",
+                                    {"项目ID": 项目ID, "奖励内容": 发送的奖励, "邮件标题": 邮件标题, "邮件正文": 邮件正文, "游戏名称": 游戏名称})
+            raise
+        except Exception as e:
+            logger.error(f"[签到] 后台发放奖励异常: {e}")
+            邮件返回值 = False
+        logger.debug("[签到] 邮件发送结果: %s", 邮件返回值)
+        if not 邮件返回值:
+            logger.warning("[签到] 邮件发送失败，但签到已记录")
+            await self._主动发送消息(event, event.plain_result(f"⚠️ 您在{游戏名称}的签到记录已保存，但奖励邮件发送失败，请稍后留意或联系管理员补发"))
 
     @filter.command("查看游戏列表")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def handle_view_games(self, event: AstrMessageEvent):
         """查看签到游戏列表，输出格式为游戏名称+奖励*数量"""
         if not self.game_configs:
@@ -2130,38 +4827,24 @@ class MyPlugin(Star):
     
     async def handle_continuous_checkin(self, event: AstrMessageEvent, author_id, 游戏名称):
         """处理连续签到逻辑"""
-        签到统计数据 = Json.读取Json字典("玩家连续签到数据.json")
-        连续签到复合键 = f"{author_id}_连续签到"
-        上次签到日期键 = f"{author_id}_上次签到日期"
+        玩家 = self.玩家数据.获取或创建(author_id)
+        今天 = datetime.date.today().toordinal()
         
-        当前日期 = datetime.datetime.now().strftime("%Y-%m-%d")
-        连续签到天数 = 0
-        
-        # 获取上次签到日期
-        上次签到日期 = Json.获取值(签到统计数据, 上次签到日期键, "")
-        
-        if not 上次签到日期:
+        if not 玩家.上次签到日:
             # 第一次签到
             连续签到天数 = 1
+        elif 今天 - 玩家.上次签到日 == 1:
+            # 连续签到
+            连续签到天数 = 玩家.连续签到 + 1
+        elif 玩家.上次签到日 == 今天:
+            # 同一天签到
+            连续签到天数 = 玩家.连续签到
         else:
-            try:
-                last_date = datetime.datetime.strptime(上次签到日期, "%Y-%m-%d")
-                current_date = datetime.datetime.strptime(当前日期, "%Y-%m-%d")
-                if (current_date - last_date).days == 1:
-                    # 连续签到
-                    连续签到天数 = int(Json.获取值(签到统计数据, 连续签到复合键, "0")) + 1
-                elif 上次签到日期 == 当前日期:
-                    # 同一天签到
-                    连续签到天数 = int(Json.获取值(签到统计数据, 连续签到复合键, "0"))
-                else:
-                    # 中断连续签到
-                    连续签到天数 = 1
-            except:
-                连续签到天数 = 1
+            # 中断连续签到
+            连续签到天数 = 1
         
-        # 保存签到数据
-        Json.添加或更新("玩家连续签到数据.json", 连续签到复合键, str(连续签到天数))
-        Json.添加或更新("玩家连续签到数据.json", 上次签到日期键, 当前日期)
+        玩家.连续签到 = 连续签到天数
+        玩家.上次签到日 = 今天
         
         # 计算活跃度奖励
         基础活跃度奖励 = 5
@@ -2174,11 +4857,11 @@ class MyPlugin(Star):
         
         总活跃度奖励 = 基础活跃度奖励 + 额外活跃度奖励
         
-        # 增加活跃度
-        活跃度数据 = Json.读取Json字典("玩家活跃度数据.json")
-        当前活跃度 = Json.获取值(活跃度数据, author_id, "0")
-        新活跃度 = int(当前活跃度) + 总活跃度奖励
-        Json.添加或更新("玩家活跃度数据.json", author_id, str(新活跃度))
+        # 增加活跃度，连同连续签到数据一起追加到日志
+        玩家.活跃度 += 总活跃度奖励
+        新活跃度 = 玩家.活跃度
+        self.玩家数据.记录变更(author_id, 连续签到=玩家.连续签到, 上次签到日=玩家.上次签到日, 活跃度=新活跃度)
+        self.活跃度排行.更新(author_id, 新活跃度)
         
 
         # 发送签到成功消息
@@ -2227,29 +4910,51 @@ class MyPlugin(Star):
             yield msg
 
     @filter.command("绑定ID")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def handle_bind_id(self, event: AstrMessageEvent):
-        """处理ID绑定"""
+        """处理ID绑定，格式为：绑定ID 游戏ID
+
+        游戏ID与批量绑定使用同一规则（EmailService.规范化用户ID）：只保存其中的数字，不含数字的ID不能绑定。
+        之前已保存的非数字ID仍会原样加载，发奖时同样只取其中的数字，完全不含数字的旧ID收不到奖励邮件；这类ID无法再次以原样绑定。
+        """
         message_str = event.message_str.strip()
         author_id = event.get_sender_id()
         
         parts = message_str.split(" ")
         if len(parts) > 1:
-            游戏_id = parts[1]
-            Json.添加或更新("玩家绑定id数据存储.json", author_id, 游戏_id)
-            async for msg in self.发送消息(event, f"ID绑定成功！您的游戏ID是：{游戏_id}"):
+            游戏_id = EmailService.规范化用户ID(parts[1])
+            if not 游戏_id:
+                async for msg in self.发送消息(event, "❌ 游戏ID必须是数字，请输入正确的格式：绑定ID 游戏ID\n（ID中混有其他字符时只保存数字部分）"):
+                    yield msg
+                return
+            if not self.玩家数据.设置绑定({author_id: 游戏_id}):
+                async for msg in self.发送消息(event, "❌ 写入绑定数据失败，本次绑定未生效，请稍后重试"):
+                    yield msg
+                return
+            指令节流.失效(author_id)
+            回复 = f"ID绑定成功！您的游戏ID是：{游戏_id}"
+            if 游戏_id != parts[1]:
+                回复 += f"\n（已去除「{parts[1]}」中的非数字字符）"
+            其他用户 = [用户ID for 用户ID in self.玩家数据.查找绑定用户(游戏_id) if 用户ID != str(author_id)]
+            if 其他用户:
+                logger.warning(f"游戏ID {游戏_id} 被多名用户绑定: {[str(author_id)] + 其他用户}")
+                回复 += f"\n⚠️ 该游戏ID已被其他{len(其他用户)}名用户绑定，请确认是否填写正确"
+            async for msg in self.发送消息(event, 回复):
                 yield msg
         else:
-            async for msg in self.发送消息(event, "请输入正确的格式：绑定ID xxx"):
+            async for msg in self.发送消息(event, "请输入正确的格式：绑定ID 游戏ID\n游戏ID为纯数字，混有其他字符时只保存数字部分"):
                 yield msg
     
     @filter.command("查看ID")
+    @指标.统计指令
+    @追踪器.追踪指令
+    @指令节流.节流(缓存结果=True)
     async def handle_view_id(self, event: AstrMessageEvent):
         """查看已绑定的ID"""
         author_id = event.get_sender_id()
         
-        # 从存储文件中读取绑定的ID
-        玩家数据 = Json.读取Json字典("玩家绑定id数据存储.json")
-        绑定的_id = Json.获取值(玩家数据, author_id)
+        绑定的_id = self.玩家数据.获取绑定(author_id)
         
         if 绑定的_id:
             async for msg in self.发送消息(event, f"您当前绑定的游戏ID是：{绑定的_id}"):
@@ -2258,6 +4963,37 @@ class MyPlugin(Star):
             async for msg in self.发送消息(event, "您还未绑定游戏ID，请使用'绑定ID xxx'命令进行绑定"):
                 yield msg
 
+    @filter.command("活跃度排行")
+    @指标.统计指令
+    @追踪器.追踪指令
+    async def 查看活跃度排行(self, event: AstrMessageEvent):
+        """查看活跃度排行及自己的名次，格式为：活跃度排行 [页码]"""
+        author_id = event.get_sender_id()
+        parts = event.message_str.strip().split(" ")
+        页码 = self._解析页码(parts[1]) if len(parts) > 1 else 1
+
+        总人数 = self.活跃度排行.数量()
+        if 总人数 == 0:
+            async for msg in self.发送消息(event, "📢 暂无活跃度数据，快去签到吧！"):
+                yield msg
+            return
+
+        总页数 = (总人数 + self.排行榜每页人数 - 1) // self.排行榜每页人数
+        页码 = min(页码, 总页数)
+        消息内容 = f"🏆 活跃度排行（第{页码}/{总页数}页，共{总人数}人）🏆\n\n"
+        for 名次, 用户ID, 活跃度 in self.活跃度排行.前列((页码 - 1) * self.排行榜每页人数 + 1, self.排行榜每页人数):
+            消息内容 += f"第{名次}名  {用户ID}  {活跃度}点\n"
+
+        我的名次, 我的活跃度 = self.活跃度排行.名次(author_id)
+        if 我的名次:
+            消息内容 += f"\n📈 您的名次：第{我的名次}名，活跃度{我的活跃度}点"
+        else:
+            消息内容 += "\n📈 您还没有活跃度，签到即可上榜"
+        if 页码 < 总页数:
+            消息内容 += f"\n发送「活跃度排行 {页码 + 1}」查看下一页"
+        async for msg in self.发送消息(event, 消息内容):
+            yield msg
+
     async def terminate(self):
         """插件销毁方法"""
         # 取消定时任务
@@ -2276,9 +5012,56 @@ class MyPlugin(Star):
             except asyncio.CancelledError:
                 pass
         
+        # 取消启动时的后台任务
+        for 任务名 in ('startup_refresh_task', 'warmup_task'):
+            if hasattr(self, 任务名):
+                getattr(self, 任务名).cancel()
+                try:
+                    await getattr(self, 任务名)
+                except asyncio.CancelledError:
+                    pass
+        
+        # 取消数据清理任务
+        if hasattr(self, 'retention_task'):
+            self.retention_task.cancel()
+            try:
+                await self.retention_task
+            except asyncio.CancelledError:
+                pass
+        
+        # 取消玩家数据压缩任务，停用前再合并一次
+        if hasattr(self, 'compaction_task'):
+            self.compaction_task.cancel()
+            try:
+                await self.compaction_task
+            except asyncio.CancelledError:
+                pass
+        
+        # 取消指标导出任务
+        if hasattr(self, 'metrics_task'):
+            self.metrics_task.cancel()
+            try:
+                await self.metrics_task
+            except asyncio.CancelledError:
+                pass
+        
+        # 等待后台发放中的签到奖励，超时未完成的取消并提示
+        if self.发奖任务:
+            完成, 未完成 = await asyncio.wait(set(self.发奖任务), timeout=30)
+            for 任务 in 未完成:
+                任务.cancel()
+            if 未完成:
+                logger.warning(f"插件停用时仍有{len(未完成)}个签到奖励未发放完成，已取消")
+        
+        # 写完剩余的失败日志，把玩家数据日志合并进快照
+        await asyncio.to_thread(self.邮件失败日志.关闭)
+        await asyncio.to_thread(self.玩家数据.关闭)
+        
         logger.info("SCE星火游戏插件已停用")
     
     @filter.command("刷新token")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def handle_refresh_token(self, event: AstrMessageEvent):
         """手动刷新所有游戏的token"""
         try:
@@ -2300,6 +5083,8 @@ class MyPlugin(Star):
                 yield msg
 
     @filter.command("发起抽奖")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def 发起抽奖(self, event: AstrMessageEvent):
         """处理发起抽奖功能,需要管理员权限并且在群聊中使用，使用格式：发起抽奖 游戏名称 奖励名称 奖励数量 抽奖人数 开奖时间(分钟)"""
         message_str = event.message_str.strip()
@@ -2334,13 +5119,11 @@ class MyPlugin(Star):
                 async for msg in self.发送消息(event, "抽奖人数和开奖时间必须为整数，请检查后重新输入。"):
                     yield msg
                 return
-            # 读取当前抽奖数据
-            抽奖数据=JsonHandler.读取Json字典("抽奖数据存储.json")
             当前时间=datetime.datetime.now()
             开奖截止时间=当前时间+datetime.timedelta(minutes=开奖时间)
             抽奖ID=str(int(当前时间.timestamp()))
             抽奖ID=f"{游戏名称}_{抽奖ID}"
-            抽奖数据[抽奖ID]={
+            抽奖信息={
                 "游戏名称":游戏名称,
                 "奖励名称":奖励名称,
                 "奖励数量":奖励数量,
@@ -2348,23 +5131,21 @@ class MyPlugin(Star):
                 "发起人":user_name,
                 "截止时间":开奖截止时间.strftime("%Y-%m-%d %H:%M:%S"),
                 "参与者":[],
-                "群聊ID": event.get_group_id()
+                "群聊ID": event.get_group_id(),
+                # 每场抽奖独立的随机种子，开奖后随结果一起存档以便复核
+                "种子": DrawEngine.生成种子()
             }
-            # 保存抽奖数据
-            # 使用JSON文件存储抽奖数据
-            文件路径 = JsonHandler.获取文件路径("抽奖数据存储.json", True)
-            try:
-                with open(文件路径, 'w', encoding='utf-8') as f:
-                    json.dump(抽奖数据, f, ensure_ascii=False, indent=2)
-                logger.info(f"抽奖数据已保存到: {文件路径}")
-            except Exception as e:
-                logger.error(f"保存抽奖数据失败: {e}")
+            # 加入抽奖索引并保存抽奖数据
+            if not self.抽奖索引.添加(抽奖ID, 抽奖信息):
+                logger.error(f"保存抽奖数据失败: {抽奖ID}")
 
             async for msg in self.发送消息(event, f"🎊 抽奖发起成功！🎊\n\n抽奖ID：{抽奖ID}\n游戏名称：{游戏名称}\n奖励名称：{奖励名称}\n奖励数量：{奖励数量}\n获奖人数：{抽奖人数}\n截止时间：{开奖截止时间.strftime('%Y-%m-%d %H:%M:%S')}\n\n请使用「参与抽奖 {抽奖ID}」命令参与抽奖\n祝您好运！🎉"):
                 yield msg
 
             # 创建并启动一个异步任务来等待开奖
-            asyncio.create_task(self.等待开奖(开奖时间, 抽奖ID,event))
+            任务 = asyncio.create_task(self.等待开奖(开奖时间, 抽奖ID,event))
+            self.开奖任务.add(任务)
+            任务.add_done_callback(self.开奖任务.discard)
     
     async def 等待开奖(self,开奖时间, 抽奖ID,event:AstrMessageEvent):
         """等待开奖"""
@@ -2373,9 +5154,9 @@ class MyPlugin(Star):
             # 等待指定的开奖时间（分钟转换为秒）
             await asyncio.sleep(60 * 开奖时间)
             try:
-                # 由于开奖函数是异步生成器，需要使用async for循环来迭代结果
-                async for _ in self.开奖(抽奖ID,event):
-                    pass
+                # 开奖函数是异步生成器，定时任务中没有处理器接收yield结果，需要主动发送到群聊
+                async for 结果 in self.开奖(抽奖ID,event):
+                    await self._主动发送消息(event, 结果)
             except Exception as e:
                 logger.error(f"定时开奖出错: {e}")
             except asyncio.CancelledError:
@@ -2383,48 +5164,89 @@ class MyPlugin(Star):
         except Exception as e:
             logger.error(f"开奖任务异常: {e}")
 
+    async def _主动发送消息(self, event: AstrMessageEvent, 消息结果):
+        """通过context主动发送消息，用于不在指令处理流程中的定时任务"""
+        try:
+            await self.context.send_message(event.unified_msg_origin, 消息结果)
+        except Exception as e:
+            logger.error(f"主动发送消息失败: {e}")
+
+    def _准备群聊事件(self, event: AstrMessageEvent, 群聊ID, 抽奖ID):
+        """将事件对象指向抽奖所在的群聊，返回可用于发送消息的事件对象"""
+        try:
+            # 直接在平台元数据中设置群聊ID，避免调用可能失败的方法
+            if hasattr(event, 'platform_meta'):
+                if isinstance(event.platform_meta, dict):
+                    event.platform_meta['group_id'] = 群聊ID
+
+            # 尝试设置群聊ID，但使用try-except保护
+            if hasattr(event, 'set_group_id') and callable(event.set_group_id):
+                try:
+                    event.set_group_id(群聊ID)
+                except Exception as set_error:
+                    logger.warning(f"设置群聊ID时出错但继续: {set_error}")
+                    # 不中断，继续尝试发送消息
+            return event
+        except Exception as e:
+            logger.warning(f"处理事件对象时出错: {e}")
+            # 如果出错，创建新的事件对象
+            return AstrMessageEvent(
+                message_str='',
+                message_obj=None,
+                platform_meta={'group_id': 群聊ID},  # 直接设置群聊ID
+                session_id=f'lottery_{抽奖ID}'
+            )
+
+    def _构建开奖公告(self, 抽奖ID, 数据, 获奖结果):
+        """把所有获奖者及发放状态汇总为开奖公告，获奖者较多时按页拆分
+
+        Args:
+            抽奖ID: 抽奖ID
+            数据: 抽奖数据
+            获奖结果: [(获奖者ID, 发放状态)] 列表
+
+        Returns:
+            list: 公告消息文本列表，每个元素为一页
+        """
+        游戏名称 = 数据.get('游戏名称', '未知游戏')
+        奖励名称 = 数据.get('奖励名称', '未知奖励')
+        奖励数量 = 数据.get('奖励数量', '未知数量')
+        成功人数 = sum(1 for _, 状态 in 获奖结果 if 状态 == "已发放")
+
+        每页人数 = max(1, self.开奖公告每页人数)
+        总页数 = max(1, (len(获奖结果) + 每页人数 - 1) // 每页人数)
+        消息列表 = []
+        for 页码 in range(总页数):
+            本页 = 获奖结果[页码 * 每页人数:(页码 + 1) * 每页人数]
+            名单 = "\n".join(f"{页码 * 每页人数 + 序号}. {获奖者ID} - {状态}" for 序号, (获奖者ID, 状态) in enumerate(本页, 1))
+            if 页码 == 0:
+                消息内容 = f"🎊 抽奖活动已结束！ 🎊\n\n✨ 抽奖ID：{抽奖ID}\n🎮 游戏名称：{游戏名称}\n🏆 奖励名称：{奖励名称}\n💎 奖励数量：{奖励数量}\n👥 获奖人数：{len(获奖结果)}\n📬 奖励发放成功：{成功人数}/{len(获奖结果)}\n\n🎉 获奖者名单：\n{名单}"
+            else:
+                消息内容 = f"🎉 获奖者名单（续）：\n{名单}"
+            if 总页数 > 1:
+                消息内容 += f"\n\n📄 第{页码 + 1}/{总页数}页"
+            if 页码 == 总页数 - 1:
+                消息内容 += f"\n\n🔐 开奖种子：{数据.get('种子', '无')}"
+                消息内容 += "\n\n恭喜以上获奖者！请留意系统邮件。🎊"
+            消息列表.append(消息内容)
+        return 消息列表
+
     async def 开奖(self, 抽奖ID,event:AstrMessageEvent):
-        抽奖数据=JsonHandler.读取Json字典("抽奖数据存储.json")
-        if 抽奖ID not in 抽奖数据:
+        数据=self.抽奖索引.获取(抽奖ID)
+        if 数据 is None:
             return
-        数据=抽奖数据[抽奖ID]
-        参与者列表=数据['参与者']
+        # 发放奖励期间会让出事件循环，先移出索引，开奖后不再接受参与，
+        # 并复制一份参与者名单，保证存档的名单就是实际抽取时的名单
+        self.抽奖索引.移除(抽奖ID)
+        参与者列表=list(数据['参与者'])
+        群聊ID=数据.get('群聊ID')
         
         # 处理参与人数为0的情况
         if len(参与者列表)==0:
-            # 不开奖，直接删除抽奖数据
-            del 抽奖数据[抽奖ID]
-            文件路径 = JsonHandler.获取文件路径("抽奖数据存储.json", True)
-            with open(文件路径, 'w', encoding='utf-8') as f:
-                json.dump(抽奖数据, f, ensure_ascii=False, indent=2)
             # 发送未有人参与的消息
-            群聊ID=数据.get('群聊ID')
             if 群聊ID:
                 try:
-                    # 安全地处理事件对象，避免'dict' object has no attribute 'id'错误
-                    try:
-                        # 直接在平台元数据中设置群聊ID，避免调用可能失败的方法
-                        if hasattr(event, 'platform_meta'):
-                            if isinstance(event.platform_meta, dict):
-                                event.platform_meta['group_id'] = 群聊ID
-                        
-                        # 尝试设置群聊ID，但使用try-except保护
-                        if hasattr(event, 'set_group_id') and callable(event.set_group_id):
-                            try:
-                                event.set_group_id(群聊ID)
-                            except Exception as set_error:
-                                logger.warning(f"设置群聊ID时出错但继续: {set_error}")
-                                # 不中断，继续尝试发送消息
-                    except Exception as e:
-                        logger.warning(f"处理事件对象时出错: {e}")
-                        # 如果出错，创建新的事件对象
-                        event = AstrMessageEvent(
-                            message_str='',
-                            message_obj=None,
-                            platform_meta={'group_id': 群聊ID},  # 直接设置群聊ID
-                            session_id=f'lottery_{抽奖ID}'
-                        )
-                    
+                    event = self._准备群聊事件(event, 群聊ID, 抽奖ID)
                     游戏名称 = 数据.get('游戏名称', '未知游戏')
                     消息内容=f"📢 抽奖结果通知 📢\n\n✨ 抽奖ID：{抽奖ID}\n🎮 游戏名称：{游戏名称}\n\n很遗憾，本次抽奖活动无人参与，活动已自动取消。"
                     async for msg in self.发送消息(event, 消息内容):
@@ -2433,76 +5255,11 @@ class MyPlugin(Star):
                     logger.error(f"发送无人参与消息时出错: {e}")
             return
         
-        # 处理参与人数大于0的情况
+        # 处理参与人数大于0的情况，参与人数不足时全员获奖
         设定获奖人数 = 数据['抽奖人数']
-        if len(参与者列表) <= 设定获奖人数:
-            # 参与人数小于等于获奖人数，全员获奖
-            获奖者 = 参与者列表.copy()
-            实际获奖人数 = len(获奖者)
-        else:
-            # 参与人数大于获奖人数，随机抽取
-            获奖者 = random.sample(参与者列表, 设定获奖人数)
-            实际获奖人数 = 设定获奖人数
-
-        #发送获奖消息
-        # 使用get方法安全访问字典键
-        游戏名称 = 数据.get('游戏名称', '未知游戏')
-        奖励名称 = 数据.get('奖励名称', '未知奖励')
-        奖励数量 = 数据.get('奖励数量', '未知数量')
-        消息内容=f"🎊 抽奖活动已结束！ 🎊\n\n✨ 抽奖ID：{抽奖ID}\n🎮 游戏名称：{游戏名称}\n🏆 奖励名称：{奖励名称}\n💎 奖励数量：{奖励数量}\n👥 获奖人数：{实际获奖人数}\n\n🎉 获奖者名单：\n{', '.join(获奖者)}\n\n恭喜以上获奖者！🎊"
-        #假设有一个群聊ID存储在数据中
-        群聊ID=数据.get('群聊ID')
-        if 群聊ID:
-            # 使用传入的event对象，并设置群聊ID
-            try:
-                # 安全地处理事件对象，避免'dict' object has no attribute 'id'错误
-                try:
-                    # 直接在平台元数据中设置群聊ID，避免调用可能失败的方法
-                    if hasattr(event, 'platform_meta'):
-                        if isinstance(event.platform_meta, dict):
-                            event.platform_meta['group_id'] = 群聊ID
-                    
-                    # 尝试设置群聊ID，但使用try-except保护
-                    if hasattr(event, 'set_group_id') and callable(event.set_group_id):
-                        try:
-                            event.set_group_id(群聊ID)
-                        except Exception as set_error:
-                            logger.warning(f"设置群聊ID时出错但继续: {set_error}")
-                            # 不中断，继续尝试发送消息
-                except Exception as e:
-                    logger.warning(f"处理事件对象时出错: {e}")
-                    # 如果出错，创建新的事件对象
-                    event = AstrMessageEvent(
-                        message_str='',
-                        message_obj=None,
-                        platform_meta={'group_id': 群聊ID},  # 直接设置群聊ID
-                        session_id=f'lottery_{抽奖ID}'
-                    )
-                async for msg in self.发送消息(event, 消息内容):
-                    yield msg
-            except Exception as e:
-                logger.error(f"发送获奖消息时出错: {e}")
-                # 尝试使用全新的事件对象作为最后的备用方案
-                try:
-                    # 创建更安全的备份事件对象
-                    backup_event = AstrMessageEvent(
-                        message_str='',
-                        message_obj=None,
-                        platform_meta={'group_id': 群聊ID},  # 直接在平台元数据中设置群聊ID
-                        session_id=f'lottery_backup_{抽奖ID}'
-                    )
-                    
-                    # 避免直接调用set_group_id，改为使用更安全的方式
-                    # 尝试发送消息，不依赖set_group_id方法
-                    try:
-                        async for msg in self.发送消息(backup_event, 消息内容):
-                            yield msg
-                    except Exception as msg_error:
-                        logger.error(f"发送备份消息时出错: {msg_error}")
-                        # 最后尝试不使用事件对象发送消息
-                        logger.warning("尝试直接发送消息，不依赖事件对象")
-                except Exception as backup_error:
-                    logger.error(f"备用方案也失败: {backup_error}")
+        种子 = 数据.get('种子') or DrawEngine.生成种子()
+        数据['种子'] = 种子
+        获奖者 = DrawEngine.抽取(种子, 参与者列表, 设定获奖人数)
 
         # 安全获取项目ID和奖励字符串
         项目ID = self.game_configs.get(数据.get('游戏名称', ''), {}).get('项目ID', '')
@@ -2536,166 +5293,155 @@ class MyPlugin(Star):
                 奖励基础字符串 = "$" + 奖励基础字符串
         奖励字符串 = f"{奖励基础字符串}:{奖励数量}" if 奖励基础字符串 else ""
 
+        游戏名称 = 数据.get('游戏名称', '未知游戏')
+        邮件标题 = "抽奖奖励"
+        邮件正文 = f"恭喜您在{游戏名称}的抽奖活动中获奖！"
+
+        # 先完成全部奖励发放，收集每位获奖者的发放状态，最后统一发布一次公告
+        获奖结果 = []
         for 获奖者ID in 获奖者:
             #发送奖励邮件
-            # 修复Json类调用错误，使用正确的JsonHandler类
-            玩家数据 = JsonHandler.读取Json字典("玩家绑定id数据存储.json")
-            发送的用户 = JsonHandler.获取值(玩家数据, 获奖者ID)
+            发送的用户 = self.玩家数据.获取绑定(获奖者ID)
             if not 发送的用户:
                 logger.warning(f"未找到获奖者{获奖者ID}的绑定信息，跳过发送奖励")
+                获奖结果.append((获奖者ID, "未绑定ID"))
                 continue
             
-            发送的奖励 = {"items": []}
-            if 奖励字符串:
-                try:
-                    # 提取奖励ID和数量
-                    奖励_id, 数量 = 奖励字符串.split(":")
-                    数量 = int(数量)
-                    # 改进的显示名称提取逻辑
-                    # 1. 尝试从奖励ID中提取中文字符作为显示名称
-                    name_parts = 奖励_id.split(".")
-                    display_name = "奖励"
-                    for part in name_parts:
-                        if any('\u4e00' <= char <= '\u9fff' for char in part):
-                            display_name = part
-                            break
-                    # 2. 如果没有找到中文字符，回退到使用最后一部分
-                    if display_name == "奖励" and name_parts:
-                        display_name = name_parts[-1]
-                    发送的奖励["items"].append(f"{display_name}*{数量}")
-                except:
-                    发送的奖励["items"] = ["抽奖奖励"]
-            else:
-                发送的奖励["items"] = ["抽奖奖励"]
-            邮件标题 = "抽奖奖励"
-            游戏名称 = 数据.get('游戏名称', '未知游戏')
-            邮件正文 = f"恭喜您在{游戏名称}的抽奖活动中获奖！"
-            # 检查send_personal_reward_email是否返回异步生成器
             try:
                 logger.info(f"准备发送邮件给用户 {发送的用户}，奖励: {奖励字符串}")
-                # 先发送开奖信息到群聊，不依赖邮件发送结果
-                try:
-                    群聊ID=数据.get('群聊ID')
-                    if 群聊ID:
-                        # 设置正确的群聊ID
-                        try:
-                            if hasattr(event, 'platform_meta') and isinstance(event.platform_meta, dict):
-                                event.platform_meta['group_id'] = 群聊ID
-                            
-                            # 构建开奖通知消息
-                            通知消息=f"🎊 开奖结果通知 🎊\n\n🎮 游戏名称：{游戏名称}\n👤 获奖者：{获奖者ID}\n🎁 奖励：{奖励名称} x{奖励数量}\n\n奖励正在发放中，请留意系统邮件。"
-                            logger.info(f"准备发送开奖通知到群聊: {群聊ID}")
-                            # 在异步函数中使用异步迭代
-                            async for result in self.发送消息(event, 通知消息):
-                                yield result
-                        except Exception as notify_error:
-                            logger.error(f"发送开奖通知到群聊时出错: {notify_error}")
-                            # 简化备用方案：直接记录错误，不再尝试创建新的事件对象
-                            logger.warning(f"群聊通知失败，已记录。奖励仍将发放，但玩家需自行查看。")
-                except Exception as e:
-                    logger.error(f"处理群聊通知时出错: {e}")
-                
-                # 然后处理邮件发送
-                result = self.send_personal_reward_email(self.auth_token, 项目ID, 奖励字符串, 发送的用户, 邮件标题, 邮件正文, 数据.get('游戏名称', '未知游戏'))
-                # 检查返回值是否是协程或异步生成器
-                if hasattr(result, '__await__'):
-                    # 是协程，直接await
-                    send_success = await result
-                    if send_success:
-                        logger.info(f"邮件发送成功给用户 {发送的用户}")
-                    else:
-                        logger.warning(f"邮件添加到后台但可能未成功发送给用户 {发送的用户}")
-                elif hasattr(result, '__aiter__'):
-                    # 是异步生成器，使用async for
-                    async for _ in result:
-                        pass
+                send_success = await self.send_personal_reward_email(self.auth_token, 项目ID, 奖励字符串, 发送的用户, 邮件标题, 邮件正文, 游戏名称)
+                if send_success:
+                    logger.info(f"邮件发送成功给用户 {发送的用户}")
+                    获奖结果.append((获奖者ID, "已发放"))
                 else:
-                    # 是普通值，直接忽略
-                    pass
+                    logger.warning(f"邮件添加到后台但可能未成功发送给用户 {发送的用户}")
+                    获奖结果.append((获奖者ID, "发放失败"))
             except Exception as email_error:
                 logger.error(f"发送奖励邮件时出错: {email_error}")
-        #删除抽奖数据
-        del 抽奖数据[抽奖ID]
-        文件路径 = JsonHandler.获取文件路径("抽奖数据存储.json", True)
-        with open(文件路径, 'w', encoding='utf-8') as f:
-            json.dump(抽奖数据, f, ensure_ascii=False, indent=2)
+                获奖结果.append((获奖者ID, "发放失败"))
+
+        #追加开奖记录，每场一行，包含种子和算法，任何人都可以用相同参与者复核结果
+        开奖记录 = {
+            "抽奖ID": 抽奖ID,
+            "游戏名称": 游戏名称,
+            "奖励名称": 奖励名称,
+            "奖励数量": 奖励数量,
+            "种子": 种子,
+            "算法": DrawEngine.算法,
+            "参与者": 参与者列表,
+            "获奖者": 获奖者,
+            "发放结果": {获奖者ID: 状态 for 获奖者ID, 状态 in 获奖结果},
+            "开奖时间": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        await asyncio.to_thread(JsonHandler.追加Json行, self.开奖记录文件名, 开奖记录)
+
+        #发送汇总后的开奖公告
+        if 群聊ID:
+            event = self._准备群聊事件(event, 群聊ID, 抽奖ID)
+            for 消息内容 in self._构建开奖公告(抽奖ID, 数据, 获奖结果):
+                try:
+                    async for msg in self.发送消息(event, 消息内容):
+                        yield msg
+                except Exception as e:
+                    logger.error(f"发送开奖公告时出错: {e}")
+
+    def _格式化抽奖列表(self, 标题, 当前页, 总数, 页码, 总页数, 翻页命令, 显示游戏名称=True):
+        """把一页抽奖数据格式化为消息文本"""
+        消息内容 = 标题
+        for 抽奖ID, 数据 in 当前页:
+            # 使用get方法安全访问字典键，提供默认值
+            游戏名称 = 数据.get('游戏名称', '未知游戏')
+            奖励名称 = 数据.get('奖励名称', '未知奖励')
+            奖励数量 = 数据.get('奖励数量', '未知数量')
+            获奖人数 = 数据.get('抽奖人数', '0')
+            截止时间 = 数据.get('截止时间', '未知时间')
+            参与人数 = len(数据.get('参与者', []))
+            消息内容 += f"📌 抽奖详情 📌\n抽奖ID：{抽奖ID}\n"
+            if 显示游戏名称:
+                消息内容 += f"游戏名称：{游戏名称}\n"
+            消息内容 += f"奖励名称：{奖励名称}\n奖励数量：{奖励数量}\n获奖人数：{获奖人数}\n截止时间：{截止时间}\n参与人数：{参与人数}\n\n------------------------------\n"
+        消息内容 += f"📄 第{页码}/{总页数}页，共{总数}个抽奖"
+        if 页码 < 总页数:
+            消息内容 += f"\n发送「{翻页命令} {页码 + 1}」查看下一页"
+        return 消息内容
+
+    私聊查看抽奖提示 = "📝 使用说明 📝\n\n抽奖列表按群聊展示，请在群聊中发送「查看抽奖」或「查看游戏抽奖 游戏名称」\n私聊中可以发送「查看抽奖 抽奖ID」查看指定抽奖"
+
+    @staticmethod
+    def _解析页码(文本) -> int:
+        try:
+            return max(1, int(文本))
+        except (TypeError, ValueError):
+            return 1
 
     @filter.command("查看游戏抽奖")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def 查询游戏抽奖(self, event: AstrMessageEvent):
-        """处理查看指定游戏的抽奖活动，格式为：查看游戏抽奖 游戏名称"""
+        """处理查看本群指定游戏的抽奖活动，格式为：查看游戏抽奖 游戏名称 [页码]"""
         message_str = event.message_str.strip()
         parts = message_str.split(" ")
         
         # 检查参数格式
-        if len(parts) != 2:
-            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n查看指定游戏的抽奖活动：查看游戏抽奖 游戏名称"):
+        if len(parts) not in (2, 3):
+            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n查看指定游戏的抽奖活动：查看游戏抽奖 游戏名称 [页码]"):
                 yield msg
             return
         
         游戏名称 = parts[1]
-        抽奖数据 = JsonHandler.读取Json字典("抽奖数据存储.json")
+        页码 = self._解析页码(parts[2]) if len(parts) == 3 else 1
+        群聊ID = event.get_group_id()
+        if not 群聊ID:
+            async for msg in self.发送消息(event, self.私聊查看抽奖提示):
+                yield msg
+            return
         
-        # 筛选该游戏的所有抽奖
-        游戏抽奖列表 = []
-        for 抽奖ID, 数据 in 抽奖数据.items():
-            if 数据.get('游戏名称') == 游戏名称:
-                游戏抽奖列表.append((抽奖ID, 数据))
+        # 通过索引筛选本群该游戏的抽奖
+        当前页, 总数, 总页数 = self.抽奖索引.查询(群聊ID=群聊ID, 游戏名称=游戏名称, 页码=页码, 每页数量=self.抽奖列表每页数量)
         
         # 处理没有找到该游戏抽奖的情况
-        if not 游戏抽奖列表:
+        if 总数 == 0:
             async for msg in self.发送消息(event, f"📢 通知 📢\n\n未找到与「{游戏名称}」相关的抽奖活动\n请检查游戏名称是否正确"):
                 yield msg
             return
         
-        # 构建消息内容
-        消息内容 = f"🎮 「{游戏名称}」的抽奖活动列表 🎮\n\n"
-        for 抽奖ID, 数据 in 游戏抽奖列表:
-            # 使用get方法安全访问字典键，提供默认值
-            奖励名称 = 数据.get('奖励名称', '未知奖励')
-            奖励数量 = 数据.get('奖励数量', '未知数量')
-            获奖人数 = 数据.get('抽奖人数', '0')
-            截止时间 = 数据.get('截止时间', '未知时间')
-            参与者列表 = 数据.get('参与者', [])
-            参与人数 = len(参与者列表)
-            消息内容 += f"📌 抽奖详情 📌\n抽奖ID：{抽奖ID}\n奖励名称：{奖励名称}\n奖励数量：{奖励数量}\n获奖人数：{获奖人数}\n截止时间：{截止时间}\n参与人数：{参与人数}\n\n------------------------------\n"
-        
-        # 发送消息
+        页码 = min(页码, 总页数)
+        消息内容 = self._格式化抽奖列表(f"🎮 「{游戏名称}」的抽奖活动列表 🎮\n\n", 当前页, 总数, 页码, 总页数, f"查看游戏抽奖 {游戏名称}", 显示游戏名称=False)
         async for msg in self.发送消息(event, 消息内容):
             yield msg
 
     @filter.command("查看抽奖")
+    @指标.统计指令
+    @追踪器.追踪指令
     async def 查看抽奖(self, event: AstrMessageEvent):
-        """处理查看已发起的抽奖，如果不指定就是查看所有的抽奖,格式为：查看抽奖 抽奖ID"""
+        """处理查看本群已发起的抽奖，格式为：查看抽奖 [页码] 或 查看抽奖 抽奖ID"""
         message_str = event.message_str.strip()
         parts = message_str.split(" ")
-        抽奖数据=JsonHandler.读取Json字典("抽奖数据存储.json")
-        if len(parts)==1:
-            #查看所有抽奖
-            if len(抽奖数据)==0:
+        if len(parts)==1 or (len(parts)==2 and parts[1].isdigit()):
+            #分页查看本群的抽奖
+            页码 = self._解析页码(parts[1]) if len(parts) == 2 else 1
+            群聊ID = event.get_group_id()
+            if not 群聊ID:
+                async for msg in self.发送消息(event, self.私聊查看抽奖提示):
+                    yield msg
+                return
+            当前页, 总数, 总页数 = self.抽奖索引.查询(群聊ID=群聊ID, 页码=页码, 每页数量=self.抽奖列表每页数量)
+            if 总数==0:
                 async for msg in self.发送消息(event, "📢 通知 📢\n\n当前没有任何抽奖活动\n请稍后再来查看吧~"):
                     yield msg
                 return
-            消息内容="🎯 当前抽奖活动列表 🎯\n\n"
-            for 抽奖ID,数据 in 抽奖数据.items():
-                # 使用get方法安全访问字典键，提供默认值
-                游戏名称 = 数据.get('游戏名称', '未知游戏')
-                奖励名称 = 数据.get('奖励名称', '未知奖励')
-                奖励数量 = 数据.get('奖励数量', '未知数量')
-                获奖人数 = 数据.get('抽奖人数', '0')
-                截止时间 = 数据.get('截止时间', '未知时间')
-                参与者列表 = 数据.get('参与者', [])
-                参与人数 = len(参与者列表)
-                消息内容+=f"📌 抽奖详情 📌\n抽奖ID：{抽奖ID}\n游戏名称：{游戏名称}\n奖励名称：{奖励名称}\n奖励数量：{奖励数量}\n获奖人数：{获奖人数}\n截止时间：{截止时间}\n参与人数：{参与人数}\n\n------------------------------\n"
+            页码 = min(页码, 总页数)
+            消息内容 = self._格式化抽奖列表("🎯 当前抽奖活动列表 🎯\n\n", 当前页, 总数, 页码, 总页数, "查看抽奖")
             async for msg in self.发送消息(event, 消息内容):
                 yield msg
         elif len(parts)==2:
             #查看指定抽奖
             抽奖ID=parts[1]
-            if 抽奖ID not in 抽奖数据:
+            数据=self.抽奖索引.获取(抽奖ID)
+            if 数据 is None:
                 async for msg in self.发送消息(event, f"❌ 错误提示 ❌\n\n未找到ID为{抽奖ID}的抽奖活动\n请检查抽奖ID是否正确"):
                         yield msg
                 return
-            数据=抽奖数据[抽奖ID]
             # 使用get方法安全访问字典键，提供默认值
             游戏名称 = 数据.get('游戏名称', '未知游戏')
             奖励名称 = 数据.get('奖励名称', '未知奖励')
@@ -2708,10 +5454,13 @@ class MyPlugin(Star):
             async for msg in self.发送消息(event, 消息内容):
                 yield msg
         else:
-            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n查看所有抽奖：查看抽奖\n查看指定抽奖：查看抽奖 抽奖ID"):
+            async for msg in self.发送消息(event, "📝 使用说明 📝\n\n查看本群抽奖：查看抽奖 [页码]\n查看指定抽奖：查看抽奖 抽奖ID"):
                         yield msg
     
     @filter.command("参与抽奖")
+    @指标.统计指令
+    @追踪器.追踪指令
+    @指令节流.节流()
     async def 参与抽奖(self, event: AstrMessageEvent):
         """参与已发起的某个抽奖，格式为：参与抽奖 抽奖ID"""
         message_str = event.message_str.strip()
@@ -2724,30 +5473,25 @@ class MyPlugin(Star):
         抽奖ID=parts[1]
         
         # 检查是否已绑定ID
-        玩家绑定数据 = JsonHandler.读取Json字典("玩家绑定id数据存储.json")
-        if author_id not in 玩家绑定数据 or not 玩家绑定数据[author_id].strip():
+        if not self.玩家数据.获取绑定(author_id).strip():
             async for msg in self.发送消息(event, "❌ 参与失败 ❌\n\n参与抽奖必须已经绑定ID\n请先完成ID绑定后再参与抽奖\n\n绑定ID格式：绑定ID 游戏名称 玩家ID"):
                 yield msg
             return
             
-        抽奖数据=JsonHandler.读取Json字典("抽奖数据存储.json")
-        if 抽奖ID not in 抽奖数据:
+        数据=self.抽奖索引.获取(抽奖ID)
+        if 数据 is None:
             async for msg in self.发送消息(event, f"❌ 错误提示 ❌\n\n未找到ID为{抽奖ID}的抽奖活动\n请检查抽奖ID是否正确\n\n如果确认抽奖ID正确，请联系管理员处理"):
                         yield msg
             return
-        数据=抽奖数据[抽奖ID]
-        # 使用get方法安全访问参与者列表
-        参与者列表 = 数据.get('参与者', [])
-        if author_id in 参与者列表:
+        截止时间 = 数据.get('截止时间')
+        if 截止时间 and 截止时间 <= datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"):
+            async for msg in self.发送消息(event, f"❌ 参与失败 ❌\n\n抽奖ID为{抽奖ID}的抽奖活动已截止，正在等待开奖"):
+                yield msg
+            return
+        # 追加参与者并保存，已参与时返回False
+        if not self.抽奖索引.参与(抽奖ID, author_id):
             async for msg in self.发送消息(event, "🔔 提示 🔔\n\n您已参与该抽奖\n无需重复参与\n耐心等待开奖吧~"):
                     yield msg
             return
-        参与者列表.append(author_id)
-        # 更新数据字典中的参与者列表
-        数据['参与者'] = 参与者列表
-        # 使用直接的文件操作保存数据，与其他部分保持一致
-        文件路径 = JsonHandler.获取文件路径("抽奖数据存储.json", True)
-        with open(文件路径, 'w', encoding='utf-8') as f:
-            json.dump(抽奖数据, f, ensure_ascii=False, indent=2)
         async for msg in self.发送消息(event, f"✅ 参与成功！\n\n您已成功参与抽奖ID为{抽奖ID}的抽奖活动\n\n现在您的参与人数：{len(数据.get('参与者', []))}\n\n🎁 祝您好运！🎁"):
                 yield msg